@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Hooks into AKL webserver calls
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import contextlib
+import typing
+
+# --- AKL packages ---
+from akl import api
+from akl.utils import kodi
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def override_attribute(owner: typing.Any, name: str, replacement: typing.Any):
+    """Replaces owner.<name> for the duration of the with block."""
+    original = getattr(owner, name)
+    setattr(owner, name, replacement)
+    try:
+        yield original
+    finally:
+        setattr(owner, name, original)
+
+
+@contextlib.contextmanager
+def override_api_call(name: str, create_replacement: typing.Callable[[typing.Callable], typing.Callable]):
+    """
+    Routes calls to akl.api.<name> made by the AKL base classes (launchers, scanners, scrapers)
+    through a replacement for the duration of the with block. create_replacement gets the
+    original function, so the replacement can still fall back to the webserver.
+    """
+    with override_attribute(api, name, create_replacement(getattr(api, name))):
+        yield
+
+
+def _log_notification(level: int) -> typing.Callable:
+    def notify(text: str = '', *args, **kwargs):
+        logger.log(level, text)
+    return notify
+
+
+@contextlib.contextmanager
+def override_notifications():
+    """
+    Logs the notifications and OK dialogs of the with block instead of showing them, for
+    commands that run without anyone watching.
+    """
+    replacements = [
+        ('notify', _log_notification(logging.INFO)),
+        ('notify_warn', _log_notification(logging.WARNING)),
+        ('notify_error', _log_notification(logging.ERROR)),
+        ('dialog_OK', _log_notification(logging.WARNING)),
+    ]
+    with contextlib.ExitStack() as stack:
+        for name, replacement in replacements:
+            if hasattr(kodi, name):
+                stack.enter_context(override_attribute(kodi, name, replacement))
+        yield
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Local asset matching index
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import re
+import os
+import collections
+import typing
+
+logger = logging.getLogger(__name__)
+
+# Everything between () or [] is a tag in No-Intro/TOSEC/GoodTools naming: regions,
+# revisions, languages and dump flags like [!], [b1] or [h2C].
+TAGS_RE = re.compile(r'\s*[\(\[]([^\)\]]*)[\)\]]')
+NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+ARTICLE_RE = re.compile(r'^(.*), (the|a|an)$')
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_MAX_BUCKET = 2000
+DEFAULT_MAX_CANDIDATES = 50
+
+
+def normalize_title(name: str) -> str:
+    """
+    Reduces a file stem to a key that survives regional variants, revision and dump tags,
+    case and punctuation. 'Legend of Zelda, The (USA) (Rev 1) [!]' -> 'the legend of zelda'.
+    """
+    name = TAGS_RE.sub('', name).strip().lower()
+    # 'Legend of Zelda, The' -> 'The Legend of Zelda'
+    match = ARTICLE_RE.match(name)
+    if match:
+        name = '{} {}'.format(match.group(2), match.group(1))
+    name = name.replace('&', ' and ')
+    return NON_ALNUM_RE.sub(' ', name).strip()
+
+
+def title_tags(name: str) -> typing.Set[str]:
+    return set(tag.strip().lower() for tag in TAGS_RE.findall(name))
+
+
+def trigrams(key: str) -> typing.Set[str]:
+    padded = '  {} '.format(key)
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+# ------------------------------------------------------------------------------------------------
+# Index over the files in a single asset directory.
+# Lookups go exact stem -> normalized key -> bounded trigram similarity, so a ROM only ever
+# gets compared against a handful of assets instead of the whole directory.
+# ------------------------------------------------------------------------------------------------
+class LocalAssetIndex(object):
+
+    def __init__(self,
+                 threshold: float = DEFAULT_THRESHOLD,
+                 max_bucket: int = DEFAULT_MAX_BUCKET,
+                 max_candidates: int = DEFAULT_MAX_CANDIDATES):
+        self.threshold = threshold
+        self.max_bucket = max_bucket
+        self.max_candidates = max_candidates
+
+        self.exact: typing.Dict[str, str] = {}
+        self.normalized: typing.Dict[str, typing.List[typing.Tuple[typing.Set[str], str]]] = {}
+        self.grams: typing.Dict[str, typing.List[str]] = collections.defaultdict(list)
+        self.gram_sets: typing.Dict[str, typing.Set[str]] = {}
+
+    def __len__(self):
+        return len(self.exact)
+
+    def add(self, path: str):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        self.exact.setdefault(stem.lower(), path)
+
+        key = normalize_title(stem)
+        if not key:
+            return
+        if key in self.normalized:
+            self.normalized[key].append((title_tags(stem), path))
+            return
+        self.normalized[key] = [(title_tags(stem), path)]
+
+        key_grams = trigrams(key)
+        self.gram_sets[key] = key_grams
+        for gram in key_grams:
+            self.grams[gram].append(key)
+
+    def add_all(self, paths: typing.Iterable[str]):
+        for path in paths:
+            self.add(path)
+
+    def find(self, stem: str, fuzzy: bool = True) -> typing.Optional[str]:
+        path = self.exact.get(stem.lower())
+        if path is not None:
+            return path
+
+        key = normalize_title(stem)
+        if not key:
+            return None
+        if key not in self.normalized:
+            if not fuzzy:
+                return None
+            key = self._find_similar(key)
+            if key is None:
+                return None
+            logger.debug('Fuzzy matched "{}" with "{}"'.format(stem, key))
+
+        return self._best_variant(key, title_tags(stem))
+
+    def _best_variant(self, key: str, tags: typing.Set[str]) -> str:
+        # 'Sonic (USA) (Rev 1)' prefers 'Sonic (USA)' over 'Sonic (Japan)'
+        variants = self.normalized[key]
+        if len(variants) == 1:
+            return variants[0][1]
+        return max(variants, key=lambda variant: len(variant[0] & tags))[1]
+
+    def _find_similar(self, key: str) -> typing.Optional[str]:
+        """Returns the most similar normalized key above the threshold (Dice coefficient on trigrams)."""
+        key_grams = trigrams(key)
+
+        # Count shared trigrams using only the selective posting lists. Grams like ' th'
+        # occur in half of any library and would turn this back into a full scan.
+        hits = collections.Counter()
+        for gram in key_grams:
+            posting = self.grams.get(gram)
+            if posting is None or len(posting) > self.max_bucket:
+                continue
+            hits.update(posting)
+
+        best_key = None
+        best_score = 0.0
+        for candidate, _ in hits.most_common(self.max_candidates):
+            candidate_grams = self.gram_sets[candidate]
+            score = 2.0 * len(key_grams & candidate_grams) / (len(key_grams) + len(candidate_grams))
+            if score >= self.threshold and score > best_score:
+                best_key = candidate
+                best_score = score
+
+        return best_key
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Asset placement engine
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import errno
+import shutil
+import time
+import threading
+import collections
+import typing
+
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+METHOD_HARDLINK = 'hardlink'
+METHOD_REFLINK = 'reflink'
+METHOD_COPY_FILE_RANGE = 'copy_file_range'
+METHOD_SENDFILE = 'sendfile'
+METHOD_BUFFERED = 'buffered'
+
+# From linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Errors telling a method does not work between these filesystems at all
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOSYS, errno.ENOTTY}
+DEFAULT_WORKERS = 4
+
+
+def _hardlink(source: str, target: str, size: int):
+    os.link(source, target)
+
+
+def _reflink(source: str, target: str, size: int):
+    if fcntl is None:
+        raise OSError('reflink not supported on this platform')
+    with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+        fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+
+
+def _check_copied(method: str, copied: int, size: int):
+    # The kernel calls report the end of the source with 0, which must not end a copy early
+    if copied != size:
+        raise OSError(errno.EIO, f'{method} copied {copied} of {size} bytes')
+
+
+def _copy_file_range(source: str, target: str, size: int):
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError('copy_file_range not supported on this platform')
+    with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+        copied = 0
+        while copied < size:
+            count = os.copy_file_range(source_file.fileno(), target_file.fileno(), min(CHUNK_SIZE, size - copied))
+            if count == 0:
+                break
+            copied += count
+    _check_copied(METHOD_COPY_FILE_RANGE, copied, size)
+
+
+def _sendfile(source: str, target: str, size: int):
+    # File to file sendfile() is only supported by Linux
+    if not hasattr(os, 'sendfile') or not os.uname().sysname == 'Linux':
+        raise OSError('sendfile to files not supported on this platform')
+    with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+        copied = 0
+        while copied < size:
+            count = os.sendfile(target_file.fileno(), source_file.fileno(), copied, min(CHUNK_SIZE, size - copied))
+            if count == 0:
+                break
+            copied += count
+    _check_copied(METHOD_SENDFILE, copied, size)
+
+
+def _buffered(source: str, target: str, size: int):
+    with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+        shutil.copyfileobj(source_file, target_file, CHUNK_SIZE)
+
+
+def replace_with_link(existing: str, path: str) -> typing.Optional[str]:
+    """
+    Replaces the file at path with a reflink or, when the filesystem cannot clone, a hard link
+    of the existing file. Returns the method used, None when neither works.
+    """
+    temp_path = '{}.{}.part'.format(path, threading.get_ident())
+    for method in (METHOD_REFLINK, METHOD_HARDLINK):
+        try:
+            PLACEMENT_METHODS[method](existing, temp_path, 0)
+        except OSError as ex:
+            logger.debug(f'Linking "{path}" with {method} failed: {ex}')
+            if os.path.lexists(temp_path):
+                os.remove(temp_path)
+            continue
+        os.replace(temp_path, path)
+        return method
+    return None
+
+
+PLACEMENT_METHODS = collections.OrderedDict([
+    (METHOD_HARDLINK, _hardlink),
+    (METHOD_REFLINK, _reflink),
+    (METHOD_COPY_FILE_RANGE, _copy_file_range),
+    (METHOD_SENDFILE, _sendfile),
+    (METHOD_BUFFERED, _buffered),
+])
+
+
+class PlacementResult(object):
+
+    def __init__(self, source: str, target: str):
+        self.source = source
+        self.target = target
+        self.method: typing.Optional[str] = None
+        self.size = 0
+        self.seconds = 0.0
+        self.error: typing.Optional[Exception] = None
+
+    def is_placed(self) -> bool:
+        return self.method is not None
+
+
+# ------------------------------------------------------------------------------------------------
+# Places files at their target path with the cheapest method the filesystems allow:
+# hard link, reflink (FICLONE), in-kernel copy and only then a buffered copy. An in-kernel copy
+# that ends before all bytes are copied fails, so the next method copies the file once more.
+# Methods that failed for a combination of source and target device are not tried again.
+# Targets are written next to their final path first and then renamed into place.
+# ------------------------------------------------------------------------------------------------
+class AssetPlacementEngine(object):
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, allow_hardlink: bool = True):
+        self.max_workers = max_workers
+        self.methods = [m for m in PLACEMENT_METHODS if allow_hardlink or m != METHOD_HARDLINK]
+        self.unsupported: typing.Set[typing.Tuple[str, int, int]] = set()
+        self.results: typing.List[PlacementResult] = []
+        self.wall_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def place(self, source: str, target: str, allow_hardlink: bool = True) -> PlacementResult:
+        result = self._place_timed(source, target, allow_hardlink)
+        with self.lock:
+            self.wall_seconds += result.seconds
+        return result
+
+    def place_all(self, pairs: typing.Iterable[typing.Tuple[str, str]]) -> typing.List[PlacementResult]:
+        pairs = list(pairs)
+        start = time.perf_counter()
+        if len(pairs) <= 1 or self.max_workers <= 1:
+            results = [self._place_timed(source, target) for source, target in pairs]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(lambda pair: self._place_timed(*pair), pairs))
+        self.wall_seconds += time.perf_counter() - start
+        return results
+
+    def _place_timed(self, source: str, target: str, allow_hardlink: bool = True) -> PlacementResult:
+        result = PlacementResult(source, target)
+        start = time.perf_counter()
+        try:
+            self._place(result, allow_hardlink)
+        except OSError as ex:
+            logger.warning(f'Failed to place "{source}" at "{target}"', exc_info=ex)
+            result.error = ex
+        result.seconds = time.perf_counter() - start
+
+        with self.lock:
+            self.results.append(result)
+        return result
+
+    def _place(self, result: PlacementResult, allow_hardlink: bool = True):
+        source_stat = os.stat(result.source)
+        target_dir = os.path.dirname(result.target)
+        os.makedirs(target_dir, exist_ok=True)
+        devices = (source_stat.st_dev, os.stat(target_dir).st_dev)
+
+        result.size = source_stat.st_size
+        temp_target = '{}.{}.part'.format(result.target, threading.get_ident())
+        for method in self.methods:
+            if (method,) + devices in self.unsupported or (method == METHOD_HARDLINK and not allow_hardlink):
+                continue
+            try:
+                PLACEMENT_METHODS[method](result.source, temp_target, result.size)
+            except OSError as ex:
+                logger.debug(f'Placement with {method} failed: {ex}')
+                if os.path.lexists(temp_target):
+                    os.remove(temp_target)
+                if method == METHOD_BUFFERED:
+                    raise
+                if ex.errno is None or ex.errno in UNSUPPORTED_ERRNOS:
+                    with self.lock:
+                        self.unsupported.add((method,) + devices)
+                continue
+
+            os.replace(temp_target, result.target)
+            result.method = method
+            return
+
+    def get_summary(self) -> typing.List[str]:
+        """Files, bytes and per file throughput for each placement method and the overall throughput."""
+        if len(self.results) == 0:
+            return []
+
+        per_method = collections.OrderedDict()
+        for result in self.results:
+            key = result.method if result.is_placed() else 'failed'
+            count, size, seconds = per_method.get(key, (0, 0, 0.0))
+            per_method[key] = (count + 1, size + result.size, seconds + result.seconds)
+
+        lines = []
+        for method, (count, size, seconds) in per_method.items():
+            throughput = size / seconds / (1024 * 1024) if seconds > 0 else 0.0
+            lines.append('{}: {} files, {} bytes, {:.1f} MB/s'.format(method, count, size, throughput))
+
+        total_size = sum(r.size for r in self.results if r.is_placed())
+        throughput = total_size / self.wall_seconds / (1024 * 1024) if self.wall_seconds > 0 else 0.0
+        lines.append('Placed {} bytes in {:.2f}s ({:.1f} MB/s)'.format(total_size, self.wall_seconds, throughput))
+        return lines
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Content addressed asset store
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import json
+import hashlib
+import typing
+
+from resources.lib.scrapecache import file_signature
+from resources.lib.assetplacement import AssetPlacementEngine, METHOD_REFLINK, replace_with_link
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AssetStoreStats(object):
+
+    def __init__(self):
+        self.assets_added = 0
+        self.assets_hashed = 0
+        self.assets_deduplicated = 0
+        self.assets_not_stored = 0
+        self.bytes_stored = 0
+        self.bytes_freed = 0
+
+    def __str__(self):
+        return '{} assets, {} hashed, {} duplicates, {} not stored, {} bytes stored, {} bytes freed by deduplication'.format(
+            self.assets_added, self.assets_hashed, self.assets_deduplicated, self.assets_not_stored,
+            self.bytes_stored, self.bytes_freed)
+
+
+# ------------------------------------------------------------------------------------------------
+# Keeps one read-only file per unique asset content under root_dir/<2 chars>/<digest><ext> and
+# replaces the sources with a reflink or hard link of it, so duplicates of the same artwork take
+# the space of one file. The stored file is a reflink or a copy of its first source, never a hard
+# link of it, so editing a source in place cannot change the content behind a digest.
+# Sources that cannot be linked to the store (another filesystem) are not stored at all, a copy
+# would only double their bytes. Sources are only hashed again when their size or mtime changed.
+# The index maps ROM id -> asset id -> digest.
+# ------------------------------------------------------------------------------------------------
+class AssetStore(object):
+
+    INDEX_FILE = 'index.json'
+    VERSION = 1
+
+    def __init__(self, root_dir: str, placement_engine: AssetPlacementEngine = None):
+        self.root_dir = root_dir
+        self.placement_engine = placement_engine if placement_engine else AssetPlacementEngine(max_workers=1)
+        self.index_path = os.path.join(root_dir, AssetStore.INDEX_FILE)
+        self.digests: typing.Dict[str, dict] = {}
+        self.sources: typing.Dict[str, list] = {}
+        self.roms: typing.Dict[str, typing.Dict[str, str]] = {}
+        self.stats = AssetStoreStats()
+
+    def load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            logger.debug(f'No usable asset store index in "{self.index_path}"')
+            return
+
+        if data.get('version') != AssetStore.VERSION:
+            return
+        self.digests = data.get('digests', {})
+        self.sources = data.get('sources', {})
+        self.roms = data.get('roms', {})
+
+    def save(self):
+        os.makedirs(self.root_dir, exist_ok=True)
+        data = {
+            'version': AssetStore.VERSION,
+            'digests': self.digests,
+            'sources': self.sources,
+            'roms': self.roms
+        }
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, separators=(',', ':'))
+        os.replace(temp_path, self.index_path)
+
+    def is_stored(self, path: str) -> bool:
+        return os.path.dirname(os.path.dirname(path)) == self.root_dir
+
+    def get_digest(self, rom_id: str, asset_id: str) -> typing.Optional[str]:
+        return self.roms.get(rom_id, {}).get(asset_id)
+
+    def add(self, rom_id: str, asset_id: str, source_path: str) -> typing.Optional[str]:
+        """
+        Replaces the asset with a link to the stored file of its content and returns the path of
+        the stored file. None when the asset cannot be stored, it is then left as it is.
+        """
+        if self.is_stored(source_path):
+            return source_path
+
+        signature = file_signature(source_path)
+        if signature is None:
+            logger.warning(f'Asset "{source_path}" not found. Not adding it to the store.')
+            return None
+        if not self._is_on_store_device(source_path):
+            logger.debug(f'Asset "{source_path}" is on another filesystem than the store. Not storing it.')
+            self.stats.assets_not_stored += 1
+            return None
+        size = signature[0]
+
+        known_source = self.sources.get(source_path)
+        if known_source is not None and tuple(known_source[:2]) == signature:
+            digest = known_source[2]
+        else:
+            digest = hash_file(source_path)
+            self.stats.assets_hashed += 1
+
+        self.stats.assets_added += 1
+        stored = self.digests.get(digest)
+        if stored is not None and os.path.exists(stored['path']):
+            if os.path.samefile(stored['path'], source_path):
+                self._remember_source(source_path, digest)
+            else:
+                # The bytes of a source with other hard links stay in use by those
+                is_only_link = os.stat(source_path).st_nlink == 1
+                if self._link_source(stored['path'], source_path, digest):
+                    self.stats.assets_deduplicated += 1
+                    if is_only_link:
+                        self.stats.bytes_freed += size
+        else:
+            stored = self._store(source_path, digest, size)
+            if stored is None:
+                self.stats.assets_not_stored += 1
+                return None
+
+        self.roms.setdefault(rom_id, {})[asset_id] = digest
+        return stored['path']
+
+    def _store(self, source_path: str, digest: str, size: int) -> typing.Optional[dict]:
+        stored_path = self._get_stored_path(digest, source_path)
+        if os.path.exists(stored_path):
+            os.remove(stored_path)
+        # A hard link would make the stored content change with the source
+        result = self.placement_engine.place(source_path, stored_path, allow_hardlink=False)
+        if not result.is_placed():
+            return None
+        os.chmod(stored_path, 0o444)
+        # A copy only pays off when the source can become a link of it
+        if result.method != METHOD_REFLINK and not self._link_source(stored_path, source_path, digest):
+            os.remove(stored_path)
+            return None
+        if result.method == METHOD_REFLINK:
+            self._remember_source(source_path, digest)
+
+        stored = {'path': stored_path, 'size': size}
+        self.digests[digest] = stored
+        self.stats.bytes_stored += size
+        return stored
+
+    def _link_source(self, stored_path: str, source_path: str, digest: str) -> bool:
+        try:
+            method = replace_with_link(stored_path, source_path)
+        except OSError as ex:
+            logger.warning(f'Could not replace "{source_path}" with the stored asset', exc_info=ex)
+            return False
+        if method is None:
+            logger.debug(f'Could not link "{source_path}" to the stored asset')
+            return False
+        self._remember_source(source_path, digest)
+        return True
+
+    def _remember_source(self, source_path: str, digest: str):
+        signature = file_signature(source_path)
+        if signature is not None:
+            self.sources[source_path] = [signature[0], signature[1], digest]
+
+    def _is_on_store_device(self, source_path: str) -> bool:
+        os.makedirs(self.root_dir, exist_ok=True)
+        return os.stat(source_path).st_dev == os.stat(self.root_dir).st_dev
+
+    def _get_stored_path(self, digest: str, source_path: str) -> str:
+        extension = os.path.splitext(source_path)[1].lower()
+        return os.path.join(self.root_dir, digest[:2], digest + extension)
@@ -0,0 +1,521 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Headless command line runner for the scanner and scraper
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# Runs the ROM folder scanner and the local files scraper without Kodi, for example on the
+# NAS that holds the ROMs or in CI. Needs script.module.akl and Kodistubs on the Python path,
+# see requirements.txt. Kodi settings, dialogs and the addon data directory are replaced by
+# stand-ins for the duration of a run.
+#
+# Usage: python -m resources.lib.cli --help
+#
+# A settings file is JSON with the source to scan and the settings Kodi would otherwise give:
+#   {
+#       "source_id": "...",
+#       "scanner": {"rompath": "/storage/roms/snes/", "romext": "zip|sfc", "scan_recursive": true,
+#                   "multidisc": false},
+#       "addon": {"scanner_detect_moves": true},
+#       "scraper": {"scrape_metadata_policy": ..., "asset_IDs_to_scrape": [...]}
+#   }
+# "addon" overrides the addon settings, all others keep the defaults of resources/settings.xml.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import sys
+import re
+import json
+import gzip
+import time
+import argparse
+import contextlib
+import concurrent.futures
+import typing
+import urllib.parse
+import xml.etree.ElementTree as ET
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+ADDON_ID = 'script.akl.defaults'
+SPECIAL_ADDON_DATA = 'special://profile/addon_data/{}/'.format(ADDON_ID)
+SPECIAL_PREFIX = 'special://'
+SETTINGS_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'settings.xml')
+DEFAULT_STANDIN_PORT = 8089
+SCRAPE_CHUNK_SIZE = 250
+
+
+def get_default_data_dir() -> str:
+    data_home = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(data_home, ADDON_ID)
+
+
+def translate_path(path: str, data_dir: str) -> str:
+    """special:// paths as Kodi would translate them, with the addon data in data_dir."""
+    if path.startswith(SPECIAL_ADDON_DATA):
+        return os.path.join(data_dir, path[len(SPECIAL_ADDON_DATA):])
+    if path.startswith(SPECIAL_PREFIX):
+        return os.path.join(data_dir, 'special', path[len(SPECIAL_PREFIX):])
+    return path
+
+
+def read_setting_defaults(data_dir: str, settings_xml: str = SETTINGS_XML) -> typing.Dict[str, str]:
+    """Setting id -> default value as text, like Kodi gives it for a fresh install."""
+    defaults = {}
+    for setting in ET.parse(settings_xml).iter('setting'):
+        default = setting.find('default')
+        if setting.get('id') is None or default is None:
+            continue
+        defaults[setting.get('id')] = translate_path(default.text or '', data_dir)
+    return defaults
+
+
+def read_settings_file(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    if 'source_id' not in data:
+        # Sources scanned on their own only need a stable id for the results and reports
+        data['source_id'] = re.sub(r'[^A-Za-z0-9_-]', '_', os.path.splitext(os.path.basename(path))[0])
+    return data
+
+
+def parse_server(value: typing.Optional[str]) -> typing.Tuple[typing.Optional[str], int]:
+    if not value:
+        return None, 0
+    host, _, port = value.rpartition(':')
+    return (host or '127.0.0.1'), int(port)
+
+
+def split_chunks(items: typing.List[typing.Any], chunk_size: int) -> typing.List[typing.List[typing.Any]]:
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def write_json(path: str, data: typing.Any):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=1)
+    os.replace(temp_path, path)
+
+
+# ------------------------------------------------------------------------------------------------
+# Progress dialog stand-in. Logs every message and every 10% of progress instead of showing a
+# dialog, and is never cancelled.
+# ------------------------------------------------------------------------------------------------
+class HeadlessProgressDialog(object):
+
+    def __init__(self):
+        self.message = ''
+        self.num_steps = 100
+        self.step_index = 0
+        self.steps = 0
+        self.reported_percentage = -1
+
+    def startProgress(self, message: str, num_steps: int = 100):
+        self.message = message
+        self.num_steps = num_steps
+        self.step_index = 0
+        self.reported_percentage = -1
+        logger.info(message)
+
+    def setSteps(self, steps: int):
+        self.steps = steps
+        self.step_index = 0
+
+    def incrementStep(self, message: str = None):
+        self.updateProgress(self.step_index + 1, message)
+
+    def updateProgress(self, step_index: int, message: str = None):
+        self.step_index = step_index
+        if message is not None:
+            self.updateMessage(message)
+        total = self.steps if self.steps > 0 else self.num_steps
+        percentage = int(step_index * 100 / total) if total > 0 else 100
+        if percentage // 10 != self.reported_percentage // 10:
+            self.reported_percentage = percentage
+            logger.info(f'{self.message}: {percentage}%')
+
+    def updateMessage(self, message: str):
+        if message != self.message:
+            self.message = message
+            logger.debug(message)
+
+    def isCanceled(self) -> bool:
+        return False
+
+    def close(self):
+        pass
+
+    def endProgress(self):
+        self.steps = 0
+
+    def reopen(self):
+        pass
+
+
+@contextlib.contextmanager
+def headless(data_dir: str, addon_settings: dict = None):
+    """
+    Replaces the Kodi settings, dialogs, notifications and addon directory that the scanner and
+    scraper use with stand-ins. Addon settings are the defaults of settings.xml with the given
+    values on top.
+    """
+    from akl import settings
+    from akl.utils import kodi, io
+    from resources.lib import apihooks
+
+    values = read_setting_defaults(data_dir)
+    values.update({key: str(value).lower() if isinstance(value, bool) else str(value)
+                   for key, value in (addon_settings or {}).items()})
+    os.makedirs(data_dir, exist_ok=True)
+
+    def get_setting(name: str) -> str:
+        return values.get(name, '')
+
+    def get_number(name: str) -> float:
+        try:
+            return float(values.get(name) or 0)
+        except ValueError:
+            return 0.0
+
+    replacements = [
+        (settings, 'getSetting', get_setting),
+        (settings, 'getSettingAsBool', lambda name: get_setting(name).lower() in ('true', '1')),
+        (settings, 'getSettingAsInt', lambda name: int(get_number(name))),
+        (settings, 'getSettingAsFloat', get_number),
+        (settings, 'getSettingAsFilePath', lambda name, *args, **kwargs: io.FileName(get_setting(name), isdir=True)),
+        (kodi, 'getAddonDir', lambda: io.FileName(data_dir, isdir=True)),
+        (kodi, 'get_addon_id', lambda: ADDON_ID),
+        (kodi, 'ProgressDialog', HeadlessProgressDialog),
+    ]
+    try:
+        import xbmcvfs
+        replacements.append((xbmcvfs, 'translatePath', lambda path: translate_path(path, data_dir)))
+    except ImportError:
+        pass
+
+    with contextlib.ExitStack() as stack:
+        for owner, name, replacement in replacements:
+            if hasattr(owner, name):
+                stack.enter_context(apihooks.override_attribute(owner, name, replacement))
+        stack.enter_context(apihooks.override_notifications())
+        yield
+
+
+# ------------------------------------------------------------------------------------------------
+# Scanning. Every settings file is one source, sources are scanned in parallel processes.
+# ------------------------------------------------------------------------------------------------
+def scan_source(settings_path: str, options: argparse.Namespace) -> dict:
+    from akl import api
+    from akl.utils import io
+    from resources.lib import apihooks, filewalk
+    from resources.lib.scanner import RomFolderScanner
+
+    source_settings = read_settings_file(settings_path)
+    source_id = source_settings['source_id']
+    host, port = parse_server(options.server)
+    report_dir = os.path.join(options.output or options.data_dir, 'reports', source_id)
+    os.makedirs(report_dir, exist_ok=True)
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(headless(options.data_dir, source_settings.get('addon')))
+        stack.enter_context(apihooks.override_api_call(
+            'client_get_source_scanner_settings',
+            lambda original: lambda *args: dict(source_settings.get('scanner', {}))))
+        if host is None:
+            existing = []
+            if options.existing:
+                with open(options.existing, 'r', encoding='utf-8') as file:
+                    existing = [api.ROMObj(data) for data in json.load(file)]
+            stack.enter_context(apihooks.override_api_call(
+                'client_get_roms_in_source', lambda original: lambda *args: list(existing)))
+
+        from akl import settings
+        started = time.perf_counter()
+        scanner = RomFolderScanner(
+            io.FileName(report_dir, isdir=True),
+            source_id,
+            host,
+            port,
+            HeadlessProgressDialog(),
+            detect_moves=settings.getSettingAsBool('scanner_detect_moves'),
+            identity_hash=settings.getSettingAsBool('scanner_identity_hash'),
+            prune_patterns=filewalk.parse_prune_patterns(settings.getSetting('scanner_prune_patterns')),
+            max_symlink_depth=settings.getSettingAsInt('scanner_max_symlink_depth'))
+        scanner.scan()
+        moved = [{'id': dead_rom.get_id(), 'scanned_data': new_rom.get_scanned_data()}
+                 for dead_rom, new_rom in scanner.moved_roms]
+
+        if host is not None:
+            scanner.store_moved_roms()
+            if scanner.amount_of_dead_roms() > 0:
+                scanner.remove_dead_roms()
+            if scanner.amount_of_scanned_roms() > 0:
+                with httpclient_installed(compact_json=True):
+                    scanner.store_scanned_roms()
+
+        result = {
+            'source_id': source_id,
+            'files_found': scanner.num_files_found,
+            'dead_rom_ids': [rom.get_id() for rom in scanner.found_dead_roms],
+            'moved_roms': moved,
+            'roms': [rom.get_data_dic() for rom in scanner.found_new_roms],
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+
+    logger.info(f'Source {source_id}: {result["files_found"]} files, {len(result["roms"])} new ROMs, '
+                f'{len(result["dead_rom_ids"])} dead ROMs, {len(moved)} moved ROMs in {result["seconds"]}s')
+    if options.output:
+        write_json(os.path.join(options.output, '{}-scan.json'.format(source_id)), result)
+    return result
+
+
+@contextlib.contextmanager
+def httpclient_installed(compact_json: bool = False):
+    from akl import settings
+    from resources.lib import httpclient
+    httpclient.install()
+    with httpclient.compressed_requests(
+            settings.getSettingAsBool('webserver_compression'),
+            compact_json and settings.getSettingAsBool('webserver_compact_json')):
+        yield
+
+
+# ------------------------------------------------------------------------------------------------
+# Scraping. Processes scrape chunks of ROMs in parallel. Applying ROM headers and placing and
+# storing assets is done afterwards in this process by one scraper, so the caches and the asset
+# store are only ever written by one process.
+# ------------------------------------------------------------------------------------------------
+def scrape_chunk(roms_data: typing.List[dict], source_settings: dict, options: argparse.Namespace) -> typing.List[dict]:
+    from akl import api
+    from akl.scrapers import ScrapeStrategy
+    from resources.lib import apihooks, commands
+    from resources.lib.scraper import LocalFilesScraper
+
+    roms_by_id = {data['id']: data for data in roms_data}
+    with headless(options.data_dir, source_settings.get('addon')), \
+            apihooks.override_api_call('client_get_rom',
+                                       lambda original: lambda host, port, rom_id: api.ROMObj(dict(roms_by_id[rom_id]))):
+        strategy = ScrapeStrategy(None, 0, commands.get_scraper_settings(source_settings.get('scraper', {})),
+                                  LocalFilesScraper(), HeadlessProgressDialog())
+        return [strategy.process_single_rom(rom_id).get_data_dic() for rom_id in roms_by_id]
+
+
+def scrape_roms(roms_data: typing.List[dict], source_settings: dict, options: argparse.Namespace) -> dict:
+    from akl import api, constants
+    from akl.scrapers import ScrapeStrategy
+    from resources.lib import commands
+    from resources.lib.scraper import LocalFilesScraper
+
+    started = time.perf_counter()
+    chunks = split_chunks(roms_data, max(1, min(SCRAPE_CHUNK_SIZE, len(roms_data) // max(1, options.jobs) + 1)))
+    scraped_data = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=options.jobs) as executor:
+        for chunk_result in executor.map(scrape_chunk, chunks,
+                                         [source_settings] * len(chunks), [options] * len(chunks)):
+            scraped_data.extend(chunk_result)
+
+    source_id = source_settings['source_id']
+    host, port = parse_server(options.server)
+    with headless(options.data_dir, source_settings.get('addon')):
+        scraper_settings = commands.get_scraper_settings(source_settings.get('scraper', {}))
+        scraper = LocalFilesScraper()
+        scraped_roms = [api.ROMObj(data) for data in scraped_data]
+        num_titles = 0
+        num_matched = 0
+        if scraper_settings.scrape_metadata_policy != constants.SCRAPE_ACTION_NONE:
+            num_titles = scraper.apply_rom_headers(scraped_roms)
+        if scraper_settings.scrape_assets_policy != constants.SCRAPE_ACTION_NONE:
+            num_matched = sum(scraper.match_local_assets(rom, scraper_settings.asset_IDs_to_scrape)
+                              for rom in scraped_roms)
+            scraper.place_assets(scraped_roms)
+            for rom in scraped_roms:
+                scraper.store_assets(rom)
+        if scraper.asset_store is not None:
+            scraper.asset_store.save()
+
+        if host is not None and len(scraped_roms) > 0:
+            strategy = ScrapeStrategy(host, port, scraper_settings, scraper, HeadlessProgressDialog())
+            with httpclient_installed():
+                strategy.store_scraped_roms(ADDON_ID, constants.OBJ_SOURCE, source_id, scraped_roms)
+
+        result = {
+            'source_id': source_id,
+            'header_titles': num_titles,
+            'assets_matched': num_matched,
+            'asset_placement': scraper.placement_engine.get_summary(),
+            'roms': [rom.get_data_dic() for rom in scraped_roms],
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+
+    logger.info(f'Source {source_id}: {len(scraped_roms)} ROMs scraped in {result["seconds"]}s')
+    if options.output:
+        write_json(os.path.join(options.output, '{}-scrape.json'.format(source_id)), result)
+    return result
+
+
+# ------------------------------------------------------------------------------------------------
+# Stand-in for the AKL webserver. Answers GET requests from JSON files in the data directory
+# and keeps the body of every POST in data/received/, so the results of a run can be checked
+# without Kodi. A GET of /query/source/roms/?id=abc is answered with query.source.roms-abc.json,
+# or an empty list when there is no such file. offset and limit page through a list.
+# ------------------------------------------------------------------------------------------------
+def get_standin_file_name(path: str) -> str:
+    url = urllib.parse.urlsplit(path)
+    name = '.'.join(part for part in url.path.split('/') if part)
+    entity_id = urllib.parse.parse_qs(url.query).get('id')
+    if entity_id:
+        name = '{}-{}'.format(name, entity_id[0])
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name) + '.json'
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        data = []
+        file_path = os.path.join(self.server.data_dir, get_standin_file_name(self.path))
+        if os.path.isfile(file_path):
+            with open(file_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        if isinstance(data, list) and 'limit' in query:
+            offset = int(query.get('offset', ['0'])[0])
+            data = data[offset:offset + int(query['limit'][0])]
+        self._reply(200, data)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        received_dir = os.path.join(self.server.data_dir, 'received')
+        os.makedirs(received_dir, exist_ok=True)
+        with self.server.lock:
+            self.server.received += 1
+            file_name = '{:05d}-{}'.format(self.server.received, get_standin_file_name(self.path))
+        with open(os.path.join(received_dir, file_name), 'wb') as file:
+            file.write(body)
+        logger.info(f'Stand-in webserver: received {len(body)} bytes on {self.path}')
+        self._reply(200, {})
+
+    def _reply(self, status: int, data: typing.Any):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def create_standin_server(data_dir: str, port: int = DEFAULT_STANDIN_PORT, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    import threading
+    server = ThreadingHTTPServer((host, port), StandInRequestHandler)
+    server.data_dir = data_dir
+    server.received = 0
+    server.lock = threading.Lock()
+    return server
+
+
+# ------------------------------------------------------------------------------------------------
+# Command line
+# ------------------------------------------------------------------------------------------------
+def _run_scan(options: argparse.Namespace) -> int:
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=options.jobs) as executor:
+        futures = {executor.submit(scan_source, path, options): path for path in options.settings}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as ex:
+                logger.error(f'Scanning with {futures[future]} failed', exc_info=ex)
+                failed += 1
+    return 1 if failed > 0 else 0
+
+
+def _run_scrape(options: argparse.Namespace) -> int:
+    source_settings = read_settings_file(options.settings)
+    with open(options.roms, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    # Takes the output of a scan as well as a plain list of ROMs
+    roms_data = data.get('roms', []) if isinstance(data, dict) else data
+    scrape_roms(roms_data, source_settings, options)
+    return 0
+
+
+def _run_standin(options: argparse.Namespace) -> int:
+    server = create_standin_server(options.data, options.port, options.host)
+    logger.info(f'Stand-in webserver on {options.host}:{server.server_address[1]}, data in {options.data}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m resources.lib.cli',
+                                     description='Runs the AKL defaults scanner and scraper without Kodi.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log debug messages')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_run_arguments(command: argparse.ArgumentParser):
+        target = command.add_mutually_exclusive_group()
+        target.add_argument('--output', help='directory for the JSON results and reports')
+        target.add_argument('--server', help='HOST:PORT of an AKL webserver or stand-in to store the results in')
+        command.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='parallel processes (default: all cores)')
+        command.add_argument('--data-dir', default=get_default_data_dir(),
+                             help='addon data directory for caches and reports (default: %(default)s)')
+
+    scan = commands.add_parser('scan', help='scan the ROM paths of one or more sources')
+    scan.add_argument('settings', nargs='+', help='settings file per source')
+    scan.add_argument('--existing', help='JSON list of the ROMs already in the source, when not using --server')
+    add_run_arguments(scan)
+    scan.set_defaults(run=_run_scan)
+
+    scrape = commands.add_parser('scrape', help='scrape scanned ROMs with the local files scraper')
+    scrape.add_argument('roms', help='scan result or JSON list of ROMs')
+    scrape.add_argument('--settings', required=True, help='settings file of the source')
+    add_run_arguments(scrape)
+    scrape.set_defaults(run=_run_scrape)
+
+    standin = commands.add_parser('standin', help='run a stand-in AKL webserver')
+    standin.add_argument('--host', default='127.0.0.1')
+    standin.add_argument('--port', type=int, default=DEFAULT_STANDIN_PORT)
+    standin.add_argument('--data', default=os.path.join(get_default_data_dir(), 'standin'),
+                         help='directory with the answers and the received bodies (default: %(default)s)')
+    standin.set_defaults(run=_run_standin)
+    return parser
+
+
+def main(argv: typing.List[str] = None) -> int:
+    options = create_parser().parse_args(argv)
+    logging.basicConfig(format='%(asctime)s %(processName)s %(name)s %(levelname)s: %(message)s',
+                        level=logging.DEBUG if options.verbose else logging.INFO)
+    if getattr(options, 'jobs', 1) < 1:
+        options.jobs = 1
+    return options.run(options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
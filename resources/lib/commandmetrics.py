@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Metrics of the plugin commands
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# Only imported by the commands when the metrics are kept, so a launch without metrics does not
+# load the metrics code.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+# --- Local modules ---
+from resources.lib.metrics import MetricsRegistry
+
+# Metrics of the commands, merged into the exposition file when a command is done
+METRICS = MetricsRegistry()
+COMMAND_DURATION = METRICS.histogram('akl_defaults_command_duration_seconds', 'Duration of plugin commands')
+SCAN_DURATION = METRICS.histogram('akl_defaults_scan_duration_seconds', 'Duration of ROM scans per source')
+SCAN_FILES = METRICS.counter('akl_defaults_scan_files_total', 'Files found by ROM scans per source')
+SCAN_FILES_PER_SECOND = METRICS.gauge('akl_defaults_scan_files_per_second', 'Files per second of the last scan per source')
+SCAN_ROMS_ADDED = METRICS.counter('akl_defaults_scan_roms_added_total', 'ROMs added by scans per source')
+SCAN_ROMS_REMOVED = METRICS.counter('akl_defaults_scan_roms_removed_total', 'Dead ROMs removed by scans per source')
+SCAN_ROMS_MOVED = METRICS.counter('akl_defaults_scan_roms_moved_total', 'ROMs found at another path by scans per source')
+SCAN_LAST_SUCCESS = METRICS.gauge('akl_defaults_scan_last_success_timestamp_seconds', 'End of the last scan per source')
+LAUNCH_LATENCY = METRICS.histogram('akl_defaults_launch_latency_seconds',
+                                   'Time from the launch command until the application was started',
+                                   buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+LAUNCH_FAILURES = METRICS.counter('akl_defaults_launch_failures_total', 'Launches that failed')
+SCRAPE_ROMS = METRICS.counter('akl_defaults_scrape_roms_total', 'ROMs handled by the scraper, scraped or unchanged')
+SCRAPE_ASSETS_MATCHED = METRICS.counter('akl_defaults_scrape_assets_matched_total', 'Local assets matched by the scraper')
+SCRAPE_HEADER_TITLES = METRICS.counter('akl_defaults_scrape_header_titles_total', 'Titles taken from ROM headers')
@@ -0,0 +1,700 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Default plugins commands
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import time
+import logging
+import importlib
+import contextlib
+import threading
+import typing
+
+# --- AKL packages ---
+# Launcher, scanner and scraper modules, like the modules of optional features (metrics,
+# profiling, memory diagnostics, the scheduler), are imported by the command that needs them,
+# so a ROM launch does not pay for loading code it does not run.
+from akl import constants, settings, addons
+from akl.utils import kodi
+
+if typing.TYPE_CHECKING:
+    from akl import api
+    from akl.scrapers import ScraperSettings
+    from resources.lib import memdiag, scheduler
+    from resources.lib.scraper import LocalFilesScraper
+    from resources.lib.reportstore import ReportStore
+
+logger = logging.getLogger(__name__)
+
+ADDON_ID = 'script.akl.defaults'
+WARM_UP_MODULES = [
+    'akl.launchers', 'akl.scrapers',
+    'resources.lib.launcher', 'resources.lib.scanner', 'resources.lib.scraper',
+    'resources.lib.executors', 'resources.lib.reportstore', 'resources.lib.timeline',
+    'resources.lib.httpclient'
+]
+
+
+# ---------------------------------------------------------------------------------------------
+# Command dispatching, used by the plugin entry point and the worker in the addon service.
+# ---------------------------------------------------------------------------------------------
+def parse_arguments(argv: typing.List[str]) -> addons.AklAddonArguments:
+    """Parses plugin arguments. argv is like sys.argv, starting with the script name."""
+    addon_args = addons.AklAddonArguments(ADDON_ID)
+    # parse() reads sys.argv, which the worker in the service must not change for its commands
+    addon_args.args = addon_args.parser.parse_args(argv[1:])
+    return addon_args
+
+
+def warm_up():
+    """Imports everything the commands use, done once by the worker when it starts."""
+    for module in WARM_UP_MODULES:
+        importlib.import_module(module)
+
+
+def run_command(addon_args: addons.AklAddonArguments):
+    from resources.lib import httpclient, profiling
+    # All webserver calls of the command share keep-alive connections
+    http_handler = httpclient.install()
+    started = time.perf_counter()
+    try:
+        if profiling.is_enabled_by_environment() or settings.getSettingAsBool('profile_commands'):
+            _run_profiled(addon_args)
+        else:
+            _dispatch(addon_args)
+    finally:
+        logger.debug(f'run_command(): {http_handler.get_summary()}')
+        command_metrics = _get_metrics()
+        if command_metrics is not None:
+            command_metrics.COMMAND_DURATION.observe(time.perf_counter() - started, command=addon_args.get_command())
+            if addon_args.get_command() == addons.AklAddonArguments.LAUNCH:
+                # Locking and rewriting the metrics file is left to a thread, off the launch path
+                threading.Thread(target=_save_metrics, args=(command_metrics,), name='LaunchMetrics').start()
+            else:
+                _save_metrics(command_metrics)
+
+
+def _get_metrics():
+    """The metrics of the commands when they are kept, else None."""
+    if not settings.getSettingAsBool('metrics_enabled'):
+        return None
+    from resources.lib import commandmetrics
+    return commandmetrics
+
+
+def _save_metrics(command_metrics):
+    from resources.lib import metrics
+    try:
+        metrics_dir = settings.getSettingAsFilePath('metrics_dir')
+        command_metrics.METRICS.save(metrics_dir.pjoin(metrics.FILE_NAME).getPath())
+    except OSError as ex:
+        logger.warning('Could not save the metrics', exc_info=ex)
+
+
+def _run_profiled(addon_args: addons.AklAddonArguments):
+    from resources.lib import profiling
+    from resources.lib.reportstore import CATEGORY_PROFILE
+    name = profiling.get_profile_name(addon_args.get_command(), addon_args.get_entity_id())
+    profile = profiling.CommandProfile(name)
+    try:
+        with profile:
+            _dispatch(addon_args)
+    finally:
+        logger.info('Profiled {}: wall {:.3f}s, CPU {:.3f}s'.format(name, profile.wall_time, profile.thread_time))
+        try:
+            report_store = _get_report_store()
+            file_names = profile.write(report_store.get_category_dir(CATEGORY_PROFILE))
+            report_store.register_all(CATEGORY_PROFILE, [(file_name, addon_args.get_entity_id() or name)
+                                                         for file_name in file_names])
+            report_store.prune(CATEGORY_PROFILE)
+        except OSError as ex:
+            logger.warning('Could not store the profile', exc_info=ex)
+
+
+@contextlib.contextmanager
+def _memory_diagnostics(addon_args: addons.AklAddonArguments):
+    """Traces the memory of the command in phases when the memory diagnostics are on."""
+    if not settings.getSettingAsBool('memory_diagnostics'):
+        yield None
+        return
+    from resources.lib import memdiag
+    diagnostics = memdiag.MemoryDiagnostics()
+    diagnostics.start()
+    try:
+        yield diagnostics
+    finally:
+        diagnostics.stop()
+        _report_memory(addon_args, diagnostics)
+
+
+def _report_memory(addon_args: addons.AklAddonArguments, diagnostics: 'memdiag.MemoryDiagnostics'):
+    from resources.lib import memdiag, profiling
+    from resources.lib.reportstore import CATEGORY_MEMORY
+    library_size = settings.getSettingAsInt('memory_diagnostics_library_size')
+    limit = settings.getSettingAsInt('memory_diagnostics_limit') * memdiag.MB
+    projected = diagnostics.get_projected_peak(library_size)
+    logger.info('Memory of {}: peak {:.1f}MB, projected {:.1f}MB'.format(
+        addon_args.get_command(), diagnostics.get_peak() / memdiag.MB, projected / memdiag.MB))
+    try:
+        report_store = _get_report_store()
+        file_name = '{}.txt'.format(profiling.get_profile_name(addon_args.get_command(), addon_args.get_entity_id()))
+        with open(report_store.get_path(CATEGORY_MEMORY, file_name), 'w', encoding='utf-8') as file:
+            file.write(diagnostics.get_summary(library_size, limit))
+        report_store.register(CATEGORY_MEMORY, file_name, addon_args.get_entity_id() or file_name)
+        report_store.prune(CATEGORY_MEMORY)
+    except OSError as ex:
+        logger.warning('Could not store the memory report', exc_info=ex)
+    if limit > 0 and projected > limit:
+        kodi.notify_warn('Projected memory {:.0f}MB is above the limit of {:.0f}MB'.format(
+            projected / memdiag.MB, limit / memdiag.MB))
+
+
+def _dispatch(addon_args: addons.AklAddonArguments):
+    if addon_args.get_command() == addons.AklAddonArguments.LAUNCH:
+        launch_rom(addon_args)
+    elif addon_args.get_command() == addons.AklAddonArguments.CONFIGURE_LAUNCHER:
+        configure_launcher(addon_args)
+    elif addon_args.get_command() == addons.AklAddonArguments.SCAN:
+        scan_for_roms(addon_args)
+    elif addon_args.get_command() == addons.AklAddonArguments.CONFIGURE_SCANNER:
+        configure_scanner(addon_args)
+    elif addon_args.get_command() == addons.AklAddonArguments.SCRAPE:
+        run_scraper(addon_args)
+    else:
+        kodi.dialog_OK(text=addon_args.get_help())
+
+
+# Bulk stores send the largest request bodies. The compact JSON encoding leaves out empty
+# fields, which only the scanner can do safely: its ROMs are new, so an empty field is just
+# the default. For scraped ROMs an empty field can mean the value has to be cleared.
+# Compression is off by default, the AKL webserver does not say it takes gzipped bodies.
+def _bulk_store_requests(compact_json: bool = False):
+    from resources.lib import httpclient
+    return httpclient.compressed_requests(
+        settings.getSettingAsBool('webserver_compression'),
+        compact_json and settings.getSettingAsBool('webserver_compact_json'))
+
+
+# ---------------------------------------------------------------------------------------------
+# Launcher methods.
+# ---------------------------------------------------------------------------------------------
+# Arguments: --akl_addon_id --rom_id
+def launch_rom(args: addons.AklAddonArguments):
+    logger.debug('App Launcher: Starting ...')
+    from akl.utils import io
+    from akl.launchers import ExecutionSettings, get_executor_factory
+    from resources.lib.launcher import AppLauncher
+    from resources.lib.executors import InstrumentedExecutorFactory
+    from resources.lib import timeline as launch_timeline, reportstore
+    
+    timeline = launch_timeline.LaunchTimeline(args.get_akl_addon_id(), args.get_entity_id())
+    entity = '{}-{}'.format(args.get_akl_addon_id(), args.get_entity_id())
+    report_store = None
+    try:
+        execution_settings = ExecutionSettings()
+        execution_settings.delay_tempo = settings.getSettingAsInt('delay_tempo')
+        execution_settings.display_launcher_notify = settings.getSettingAsBool('display_launcher_notify')
+        execution_settings.is_non_blocking = settings.getSettingAsBool('is_non_blocking')
+        execution_settings.media_state_action = settings.getSettingAsInt('media_state_action')
+        execution_settings.suspend_audio_engine = settings.getSettingAsBool('suspend_audio_engine')
+        execution_settings.suspend_screensaver = settings.getSettingAsBool('suspend_screensaver')
+        execution_settings.suspend_joystick_engine = settings.getSettingAsBool('suspend_joystick')
+        settings_snapshot = _get_launcher_settings_snapshot()
+        application_cache = _get_application_cache()
+        prewarmer = None
+        if settings.getSettingAsBool('launcher_prewarm'):
+            from resources.lib.prewarm import Prewarmer
+            prewarmer = Prewarmer(settings.getSettingAsInt('launcher_prewarm_limit') * 1024 * 1024)
+        extraction_cache = None
+        if settings.getSettingAsBool('launcher_extract_archives'):
+            from resources.lib.extractcache import ExtractionCache
+            extraction_dir = kodi.getAddonDir().pjoin('cache', isdir=True).pjoin('extracted', isdir=True)
+            extraction_cache = ExtractionCache(
+                extraction_dir.getPath(), settings.getSettingAsInt('launcher_extract_cache_size') * 1024 * 1024 * 1024)
+                
+        report_store = _get_report_store()
+        report_path = io.FileName(report_store.get_path(reportstore.CATEGORY_LAUNCH, entity + '.txt'))
+        timeline.mark(launch_timeline.PHASE_SETTINGS)
+        
+        executor_factory = get_executor_factory(report_path)
+        if settings.getSettingAsBool('posix_spawn_executor'):
+            from resources.lib.executors import PosixSpawnExecutor, PosixSpawnExecutorFactory
+            if PosixSpawnExecutor.is_supported():
+                executor_factory = PosixSpawnExecutorFactory(
+                    executor_factory, report_path, execution_settings.is_non_blocking)
+        if extraction_cache is not None:
+            from resources.lib.executors import ExtractingExecutorFactory
+            executor_factory = ExtractingExecutorFactory(executor_factory, extraction_cache)
+        executor_factory = InstrumentedExecutorFactory(executor_factory, timeline, execution_settings.is_non_blocking)
+        launcher = AppLauncher(
+            args.get_akl_addon_id(),
+            args.get_entity_id(),
+            args.get_webserver_host(),
+            args.get_webserver_port(),
+            executor_factory,
+            execution_settings,
+            settings_snapshot,
+            application_cache,
+            prewarmer,
+            timeline,
+            extraction_cache)
+        
+        launcher.launch()
+        timeline.mark(launch_timeline.PHASE_RETURN)
+        command_metrics = _get_metrics()
+        if command_metrics is not None:
+            command_metrics.LAUNCH_LATENCY.observe(timeline.get_startup_time(), launcher=args.get_akl_addon_id())
+        logger.info(str(timeline))
+
+        if extraction_cache is not None:
+            extraction_cache.evict_in_background()
+        if prewarmer is not None and timeline.get_spawn_start() is not None:
+            logger.info('Prewarmed {} MB, emulator started {:.1f}ms after prewarming began'.format(
+                prewarmer.bytes_prewarmed // (1024 * 1024), prewarmer.get_elapsed(timeline.get_spawn_start()) * 1000))
+        if launcher.snapshot_used:
+            launcher.revalidate_settings_snapshot()
+            logger.info('Launcher settings snapshot saved {:.1f}ms of waiting for the webserver'.format(
+                (launcher.timings.get('revalidate', 0.0) - launcher.timings.get('settings', 0.0)) * 1000))
+    except Exception as e:
+        command_metrics = _get_metrics()
+        if command_metrics is not None:
+            command_metrics.LAUNCH_FAILURES.inc()
+        logger.error('Exception while executing ROM', exc_info=e)
+        kodi.notify_error('Failed to execute ROM')
+        return
+
+    try:
+        if extraction_cache is not None:
+            with open(report_path.getPath(), 'a', encoding='utf-8') as report_file:
+                report_file.write('\n'.join(extraction_cache.get_report_lines()) + '\n')
+        timeline_file = entity + launch_timeline.FILE_EXTENSION
+        timeline.write(report_store.get_path(reportstore.CATEGORY_TIMELINE, timeline_file))
+    except OSError as ex:
+        logger.warning('Could not write the launch reports', exc_info=ex)
+        return
+    threading.Thread(target=_register_launch_reports, args=(report_store, entity, timeline_file),
+                     name='LaunchReports').start()
+
+
+def _register_launch_reports(report_store: 'ReportStore', entity: str, timeline_file: str):
+    from resources.lib import reportstore
+    try:
+        report_store.register(reportstore.CATEGORY_LAUNCH, entity + '.txt', entity)
+        report_store.register(reportstore.CATEGORY_TIMELINE, timeline_file, entity)
+        report_store.prune(reportstore.CATEGORY_LAUNCH)
+        report_store.prune(reportstore.CATEGORY_TIMELINE)
+    except OSError as ex:
+        logger.warning('Could not register the launch reports', exc_info=ex)
+
+
+# Arguments: none, started with RunScript(script.akl.defaults,launch_stats)
+def show_launch_stats():
+    import xbmcgui
+    from resources.lib import timeline as launch_timeline, reportstore
+    
+    timelines_dir = _get_report_store().get_category_dir(reportstore.CATEGORY_TIMELINE)
+    stats = launch_timeline.aggregate(launch_timeline.read_timelines(timelines_dir))
+    xbmcgui.Dialog().textviewer('Launch timings', launch_timeline.format_stats(stats), usemono=True)
+
+
+# Arguments: --akl_addon_id --romcollection_id | --rom_id
+def configure_launcher(args: addons.AklAddonArguments):
+    logger.debug('App Launcher: Configuring ...')
+    from resources.lib.launcher import AppLauncher
+        
+    launcher = AppLauncher(
+        args.get_akl_addon_id(),
+        args.get_entity_id(),
+        args.get_webserver_host(),
+        args.get_webserver_port(),
+        settings_snapshot=_get_launcher_settings_snapshot())
+    
+    if launcher.build():
+        launcher.store_settings()
+        return
+    
+    kodi.notify_warn('Cancelled creating launcher')
+
+
+def _get_launcher_settings_snapshot():
+    if not settings.getSettingAsBool('launcher_settings_snapshot'):
+        return None
+    from resources.lib.launchcache import LauncherSettingsSnapshot
+    cache_dir = kodi.getAddonDir().pjoin('cache', isdir=True).pjoin('launchers', isdir=True)
+    return LauncherSettingsSnapshot(cache_dir.getPath(), settings.getSettingAsInt('launcher_settings_snapshot_minutes') * 60)
+
+
+def _get_application_cache():
+    if not settings.getSettingAsBool('launcher_application_cache'):
+        return None
+    from resources.lib.launchcache import ApplicationResolutionCache
+    cache_dir = kodi.getAddonDir().pjoin('cache', isdir=True).pjoin('launchers', isdir=True)
+    return ApplicationResolutionCache(cache_dir.getPath())
+
+
+def _get_report_store():
+    from resources.lib.reportstore import ReportStore, ReportLimits, CATEGORY_TIMELINE
+    max_age = settings.getSettingAsInt('reports_max_age')
+    max_size = settings.getSettingAsInt('reports_max_size')
+    limits = ReportLimits(max_age, max_size, settings.getSettingAsInt('reports_compress_after'))
+    # Timelines are appended to with every launch, so they are never compressed
+    category_limits = {CATEGORY_TIMELINE: ReportLimits(max_age, max_size, 0)}
+    return ReportStore(kodi.getAddonDir().pjoin('reports').getPath(), category_limits, limits)
+
+
+# ---------------------------------------------------------------------------------------------
+# Scanner methods.
+# ---------------------------------------------------------------------------------------------
+# Arguments: --source_id --server_host --server_port
+def scan_for_roms(args: addons.AklAddonArguments):
+    with _memory_diagnostics(args) as memory:
+        _scan_for_roms(args, memory)
+
+
+def _scan_for_roms(args: addons.AklAddonArguments, memory: typing.Optional['memdiag.MemoryDiagnostics']):
+    logger.debug('ROM Folder scanner: Starting scan ...')
+    from akl.utils import io
+    from resources.lib import filewalk, memdiag
+    from resources.lib.scanner import RomFolderScanner
+    from resources.lib.reportstore import CATEGORY_SCAN, CATEGORY_LEGACY
+    progress_dialog = kodi.ProgressDialog()
+
+    scan_start = time.time()
+    scan_timer = time.perf_counter()
+    report_store = _get_report_store()
+    report_path = io.FileName(report_store.get_category_dir(CATEGORY_SCAN), isdir=True)
+            
+    scanner = RomFolderScanner(
+        report_path,
+        args.get_entity_id(),
+        args.get_webserver_host(),
+        args.get_webserver_port(),
+        progress_dialog,
+        memory_diagnostics=memory,
+        detect_moves=settings.getSettingAsBool('scanner_detect_moves'),
+        identity_hash=settings.getSettingAsBool('scanner_identity_hash'),
+        prune_patterns=filewalk.parse_prune_patterns(settings.getSetting('scanner_prune_patterns')),
+        max_symlink_depth=settings.getSettingAsInt('scanner_max_symlink_depth'))
+        
+    scanner.scan()
+    progress_dialog.endProgress()
+    
+    logger.debug('scan_for_roms(): Finished scanning')
+    
+    amount_moved = 0
+    if scanner.amount_of_moved_roms() > 0:
+        with memdiag.phase(memory, 'moved ROMs'):
+            amount_moved = scanner.store_moved_roms()
+        logger.info(f'scan_for_roms(): {amount_moved} roms moved or renamed')
+    
+    amount_dead = scanner.amount_of_dead_roms()
+    if amount_dead > 0:
+        logger.info(f'scan_for_roms(): {amount_dead} roms marked as dead')
+        with memdiag.phase(memory, 'remove dead ROMs'):
+            scanner.remove_dead_roms()
+        
+    amount_scanned = scanner.amount_of_scanned_roms()
+    if amount_scanned == 0:
+        logger.info('scan_for_roms(): No roms scanned')
+    else:
+        logger.info(f'scan_for_roms(): {amount_scanned} roms scanned')
+        with _bulk_store_requests(compact_json=True), memdiag.phase(memory, 'store ROMs'):
+            scanner.store_scanned_roms()
+    if memory is not None:
+        memory.set_items(scanner.num_files_found)
+        
+    scan_duration = time.perf_counter() - scan_timer
+    source_id = args.get_entity_id()
+    command_metrics = _get_metrics()
+    if command_metrics is not None:
+        files_per_second = scanner.num_files_found / scan_duration if scan_duration > 0 else 0.0
+        command_metrics.SCAN_DURATION.observe(scan_duration, source=source_id)
+        command_metrics.SCAN_FILES.inc(scanner.num_files_found, source=source_id)
+        command_metrics.SCAN_FILES_PER_SECOND.set(files_per_second, source=source_id)
+        command_metrics.SCAN_ROMS_ADDED.inc(amount_scanned, source=source_id)
+        command_metrics.SCAN_ROMS_REMOVED.inc(amount_dead, source=source_id)
+        command_metrics.SCAN_ROMS_MOVED.inc(amount_moved, source=source_id)
+        command_metrics.SCAN_LAST_SUCCESS.set(time.time(), source=source_id)
+    # Sources join the schedule with their next scan once background scans are switched on
+    if settings.getSettingAsBool('scheduler_enabled'):
+        try:
+            schedule_store = get_schedule_store()
+            schedule_store.register(source_id, args.get_webserver_host(), args.get_webserver_port())
+            schedule_store.record_scan(source_id, scan_start, scan_duration, amount_scanned, amount_dead)
+        except OSError as ex:
+            logger.warning('Could not update the background scan schedule', exc_info=ex)
+
+    report_store.register_new(CATEGORY_SCAN, args.get_entity_id(), scan_start)
+    report_store.prune(CATEGORY_SCAN)
+    report_store.prune(CATEGORY_LEGACY)
+    kodi.notify('ROMs scanning done')
+
+
+# Arguments: --source_id
+def configure_scanner(args: addons.AklAddonArguments):
+    logger.debug('ROM Folder scanner: Configuring ...')
+    from akl.utils import io
+    from resources.lib.scanner import RomFolderScanner
+    from resources.lib.reportstore import CATEGORY_SCAN
+    report_path = io.FileName(_get_report_store().get_category_dir(CATEGORY_SCAN), isdir=True)
+    
+    scanner = RomFolderScanner(
+        report_path,
+        args.get_entity_id(),
+        args.get_webserver_host(),
+        args.get_webserver_port(),
+        kodi.ProgressDialog())
+    
+    if scanner.configure():
+        scanner.store_settings()
+        if settings.getSettingAsBool('scheduler_enabled'):
+            try:
+                get_schedule_store().register(args.get_entity_id(), args.get_webserver_host(), args.get_webserver_port())
+            except OSError as ex:
+                logger.warning('Could not add the source to the background scan schedule', exc_info=ex)
+        return
+    
+    kodi.notify_warn('Cancelled configuring scanner')
+
+
+# ---------------------------------------------------------------------------------------------
+# Background scans, started by the scheduler of the addon service.
+# ---------------------------------------------------------------------------------------------
+class ScheduledArguments(object):
+    """Arguments of a command on a source, started by the scheduler instead of AKL."""
+
+    def __init__(self, command: str, source_id: str, host: str, port: int,
+                 settings_dict: dict = None, akl_addon_id: str = None):
+        self.command = command
+        self.source_id = source_id
+        self.host = host
+        self.port = port
+        self.settings_dict = settings_dict if settings_dict is not None else {}
+        self.akl_addon_id = akl_addon_id
+
+    def get_command(self) -> str:
+        return self.command
+
+    def get_entity_id(self) -> str:
+        return self.source_id
+
+    def get_entity_type(self) -> int:
+        return constants.OBJ_SOURCE
+
+    def get_webserver_host(self) -> str:
+        return self.host
+
+    def get_webserver_port(self) -> int:
+        return self.port
+
+    def get_settings(self) -> dict:
+        return self.settings_dict
+
+    def get_akl_addon_id(self) -> str:
+        return self.akl_addon_id
+
+    def get_help(self) -> str:
+        return ''
+
+
+def get_schedule_store() -> 'scheduler.ScheduleStore':
+    from resources.lib import scheduler
+    return scheduler.ScheduleStore(kodi.getAddonDir().pjoin(scheduler.FILE_NAME).getPath())
+
+
+def run_scheduled_source(source_id: str, source: dict, progress_dialog: 'scheduler.PausingProgressDialog'):
+    """Rescans the source, and scrapes it when asked for, without showing anything."""
+    from resources.lib import apihooks
+    with apihooks.override_attribute(kodi, 'ProgressDialog', lambda *args, **kwargs: progress_dialog), \
+            apihooks.override_notifications():
+        run_command(ScheduledArguments(addons.AklAddonArguments.SCAN, source_id, source['host'], source['port']))
+        if progress_dialog.isCanceled() or not source.get('scrape', settings.getSettingAsBool('scheduler_scrape')):
+            return
+        if source.get('scraper_settings') is None:
+            logger.info(f'Source {source_id} was never scraped with local files, no background scrape')
+            return
+        run_command(ScheduledArguments(addons.AklAddonArguments.SCRAPE, source_id, source['host'], source['port'],
+                                       source['scraper_settings'], source.get('akl_addon_id')))
+
+
+# ---------------------------------------------------------------------------------------------
+# Scraper methods.
+# ---------------------------------------------------------------------------------------------
+def run_scraper(args: addons.AklAddonArguments):
+    with _memory_diagnostics(args) as memory:
+        _run_scraper(args, memory)
+    if args.get_entity_type() == constants.OBJ_SOURCE and settings.getSettingAsBool('scheduler_enabled'):
+        # Background scans of the source scrape with the settings of the last scrape
+        # A forced scrape is for this run only
+        scraper_settings = {k: v for k, v in args.get_settings().items() if k != 'force'}
+        try:
+            get_schedule_store().update(args.get_entity_id(),
+                                        scraper_settings=scraper_settings,
+                                        akl_addon_id=args.get_akl_addon_id())
+        except OSError as ex:
+            logger.warning('Could not update the background scan schedule', exc_info=ex)
+
+
+def _run_scraper(args: addons.AklAddonArguments, memory: typing.Optional['memdiag.MemoryDiagnostics']):
+    logger.debug('========== Local files.run_scraper() BEGIN ==================================================')
+    from akl.scrapers import ScrapeStrategy
+    from resources.lib import memdiag
+    from resources.lib.scraper import LocalFilesScraper
+    
+    pdialog = kodi.ProgressDialog()
+    settings = get_scraper_settings(args.get_settings())
+    command_metrics = _get_metrics()
+    
+    scraper = LocalFilesScraper()
+    scraper.set_scrape_settings(settings)
+    scraper_strategy = ScrapeStrategy(
+        args.get_webserver_host(),
+        args.get_webserver_port(),
+        settings,
+        scraper,
+        pdialog)
+    
+    state_cache = scraper.get_scrape_state_cache()
+    # 'force' in the settings of a run scrapes all ROMs, also the unchanged ones
+    force = bool(args.get_settings().get('force', False))
+                        
+    if args.get_entity_type() == constants.OBJ_ROM:
+        scraped_rom = scraper_strategy.process_single_rom(args.get_entity_id())
+        if settings.scrape_metadata_policy != constants.SCRAPE_ACTION_NONE:
+            scraper.apply_rom_headers([scraped_rom])
+        if settings.scrape_assets_policy != constants.SCRAPE_ACTION_NONE:
+            scraper.match_local_assets(scraped_rom, settings.asset_IDs_to_scrape)
+            scraper.place_assets([scraped_rom])
+            scraper.store_assets(scraped_rom)
+        pdialog.endProgress()
+        pdialog.startProgress('Saving ROM in database ...')
+        scraper_strategy.store_scraped_rom(args.get_akl_addon_id(), args.get_entity_id(), scraped_rom)
+        pdialog.endProgress()
+        state_cache.update(scraped_rom.get_id(), scraper.get_rom_fingerprint(scraped_rom, refresh=True))
+        if command_metrics is not None:
+            command_metrics.SCRAPE_ROMS.inc(result='scraped')
+    else:
+        changed_roms = None
+        if scraper.skip_unchanged and not force:
+            with memdiag.phase(memory, 'changed ROMs'):
+                changed_roms = _get_changed_roms(args, scraper, state_cache)
+        
+        with memdiag.phase(memory, 'scrape'):
+            if changed_roms is None:
+                scraped_roms = scraper_strategy.process_roms(args.get_entity_type(), args.get_entity_id())
+            else:
+                scraped_roms = [scraper_strategy.process_single_rom(rom.get_id()) for rom in changed_roms]
+        
+        if settings.scrape_metadata_policy != constants.SCRAPE_ACTION_NONE:
+            with memdiag.phase(memory, 'ROM headers'):
+                num_titles = scraper.apply_rom_headers(scraped_roms)
+            logger.info(f'run_scraper(): {num_titles} titles taken from ROM headers')
+            if command_metrics is not None:
+                command_metrics.SCRAPE_HEADER_TITLES.inc(num_titles)
+        if settings.scrape_assets_policy != constants.SCRAPE_ACTION_NONE:
+            with memdiag.phase(memory, 'assets'):
+                num_matched = sum(scraper.match_local_assets(rom, settings.asset_IDs_to_scrape) for rom in scraped_roms)
+                scraper.place_assets(scraped_roms)
+                for rom in scraped_roms:
+                    scraper.store_assets(rom)
+            logger.info(f'run_scraper(): {num_matched} additional local assets matched')
+            if command_metrics is not None:
+                command_metrics.SCRAPE_ASSETS_MATCHED.inc(num_matched)
+        pdialog.endProgress()
+        
+        if len(scraped_roms) == 0:
+            logger.info('run_scraper(): All ROMs unchanged since last scrape')
+            kodi.notify('No changed ROMs to scrape')
+        else:
+            pdialog.startProgress('Saving ROMs in database ...')
+            with _bulk_store_requests(), memdiag.phase(memory, 'store ROMs'):
+                scraper_strategy.store_scraped_roms(args.get_akl_addon_id(),
+                                                    args.get_entity_type(),
+                                                    args.get_entity_id(),
+                                                    scraped_roms)
+            pdialog.endProgress()
+        
+        for rom in scraped_roms:
+            state_cache.update(rom.get_id(), scraper.get_rom_fingerprint(rom, refresh=True))
+        if command_metrics is not None:
+            command_metrics.SCRAPE_ROMS.inc(len(scraped_roms), result='scraped')
+        if memory is not None:
+            memory.set_items(len(scraped_roms))
+    
+    state_cache.save()
+    report_lines = [f'Asset placement: {line}' for line in scraper.placement_engine.get_summary()]
+    if scraper.asset_store is not None:
+        scraper.asset_store.save()
+        logger.info(f'run_scraper(): Asset store: {scraper.asset_store.stats}')
+        report_lines.append(f'Asset store: {scraper.asset_store.stats}')
+    if len(report_lines) > 0:
+        _write_scrape_report(args, report_lines)
+    
+
+def get_scraper_settings(settings_dict: dict) -> 'ScraperSettings':
+    """Scraper settings as given, with everything forced to automatic and local files only."""
+    from akl.scrapers import ScraperSettings
+    scraper_settings = ScraperSettings.from_settings_dict(settings_dict)
+    # OVERRIDES
+    scraper_settings.search_term_mode = constants.SCRAPE_AUTOMATIC
+    scraper_settings.game_selection_mode = constants.SCRAPE_AUTOMATIC
+    scraper_settings.asset_selection_mode = constants.SCRAPE_AUTOMATIC
+    scraper_settings.overwrite_existing_assets = constants.SCRAPE_AUTOMATIC
+    scraper_settings.overwrite_existing_meta = constants.SCRAPE_AUTOMATIC
+    
+    if scraper_settings.scrape_metadata_policy != constants.SCRAPE_ACTION_NONE:
+        scraper_settings.scrape_metadata_policy = constants.SCRAPE_POLICY_LOCAL_ONLY
+    if scraper_settings.scrape_assets_policy != constants.SCRAPE_ACTION_NONE:
+        scraper_settings.scrape_assets_policy = constants.SCRAPE_POLICY_LOCAL_ONLY
+    return scraper_settings
+
+
+def _write_scrape_report(args: addons.AklAddonArguments, lines: typing.List[str]):
+    from resources.lib.reportstore import CATEGORY_SCRAPE
+    report_store = _get_report_store()
+    file_name = '{}-scrape-{}.txt'.format(args.get_akl_addon_id(), args.get_entity_id())
+    with open(report_store.get_path(CATEGORY_SCRAPE, file_name), 'w', encoding='utf-8') as file:
+        file.write('\n'.join(lines) + '\n')
+    report_store.register(CATEGORY_SCRAPE, file_name, args.get_entity_id())
+    report_store.prune(CATEGORY_SCRAPE)
+
+
+# Returns the ROMs whose files or assets changed since the last scrape, or None when the whole
+# set should go through the bulk scrape.
+def _get_changed_roms(args: addons.AklAddonArguments,
+                      scraper: 'LocalFilesScraper',
+                      state_cache) -> typing.Optional[typing.List['api.ROMObj']]:
+    from akl import api
+    
+    if args.get_entity_type() == constants.OBJ_SOURCE:
+        roms = api.client_get_roms_in_source(args.get_webserver_host(), args.get_webserver_port(), args.get_entity_id())
+    elif args.get_entity_type() == constants.OBJ_ROMCOLLECTION:
+        roms = api.client_get_roms_in_collection(args.get_webserver_host(), args.get_webserver_port(), args.get_entity_id())
+    else:
+        return None
+    
+    changed_roms = [rom for rom in roms
+                    if not state_cache.is_unchanged(rom.get_id(), scraper.get_rom_fingerprint(rom))]
+    logger.info(f'_get_changed_roms(): {len(changed_roms)} of {len(roms)} ROMs changed since last scrape')
+    
+    # Single ROM scrapes cost a request each, so when most ROMs changed the bulk scrape is cheaper.
+    if len(changed_roms) > len(roms) // 2:
+        return None
+    command_metrics = _get_metrics()
+    if command_metrics is not None:
+        command_metrics.SCRAPE_ROMS.inc(len(roms) - len(changed_roms), result='unchanged')
+    return changed_roms
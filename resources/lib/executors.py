@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Executor extensions for the App Launcher
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import signal
+import threading
+import typing
+
+# --- AKL packages ---
+from akl.executors import ExecutorABC
+
+from resources.lib.extractcache import ExtractionCache
+from resources.lib.timeline import LaunchTimeline, PHASE_ARGUMENTS, PHASE_SUSPEND, PHASE_SPAWN, PHASE_RUN
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------------------------------------------------------------------
+# Wraps the executor factory of the launcher to see when the launcher is done preparing the
+# arguments (the executor gets created) and when the process is started and returns.
+# ------------------------------------------------------------------------------------------------
+class InstrumentedExecutorFactory(object):
+
+    def __init__(self, executor_factory, timeline: LaunchTimeline, is_non_blocking: bool = False):
+        self.executor_factory = executor_factory
+        self.timeline = timeline
+        self.is_non_blocking = is_non_blocking
+
+    def create(self, *args, **kwargs):
+        self.timeline.mark(PHASE_ARGUMENTS)
+        executor = self.executor_factory.create(*args, **kwargs)
+        return InstrumentedExecutor(executor, self.timeline, self.is_non_blocking) if executor is not None else None
+
+    def __getattr__(self, name):
+        return getattr(self.executor_factory, name)
+
+
+class InstrumentedExecutor(object):
+
+    def __init__(self, executor, timeline: LaunchTimeline, is_non_blocking: bool):
+        self.executor = executor
+        self.timeline = timeline
+        self.is_non_blocking = is_non_blocking
+
+    def execute(self, *args, **kwargs):
+        # Between creating the executor and executing it the launcher suspends the Kodi engines
+        self.timeline.mark(PHASE_SUSPEND)
+        with self.timeline.measure(PHASE_SPAWN if self.is_non_blocking else PHASE_RUN):
+            return self.executor.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.executor, name)
+
+
+# ------------------------------------------------------------------------------------------------
+# Starts the application with posix_spawn() instead of fork() + exec(). Forking Kodi means
+# copying the page tables of a process with gigabytes of mappings, spawning does not.
+# Only descriptors 0-2 are passed on: stdin is /dev/null, stdout and stderr go to the report.
+# Descriptors Kodi left inheritable are closed, signals Kodi ignores are reset to their default
+# and the environment of Kodi's embedded Python is not passed on to the application.
+# Executor options given as keyword arguments are not known to posix_spawn(), a launch with
+# any of them is handed to the executor the default factory creates for it.
+# A process that is not waited for is reaped by a thread, so it leaves no zombie behind.
+# ------------------------------------------------------------------------------------------------
+class PosixSpawnExecutor(ExecutorABC):
+
+    REMOVED_ENVIRONMENT = ['PYTHONHOME', 'PYTHONPATH', 'PYTHONOPTIMIZE']
+
+    def __init__(self, logFile, is_non_blocking: bool = False, fallback: typing.Callable[[], typing.Any] = None):
+        self.is_non_blocking = is_non_blocking
+        self.fallback = fallback
+        super(PosixSpawnExecutor, self).__init__(logFile)
+
+    @staticmethod
+    def is_supported() -> bool:
+        return hasattr(os, 'posix_spawn') and os.uname().sysname == 'Linux'
+
+    def execute(self, application: str, *args, **kwargs):
+        if kwargs:
+            executor = self.fallback() if self.fallback is not None else None
+            if executor is None:
+                raise TypeError('PosixSpawnExecutor does not take the options {}'.format(', '.join(sorted(kwargs))))
+            logger.debug('PosixSpawnExecutor::execute() Options {} given, using the default executor'.format(
+                ', '.join(sorted(kwargs))))
+            return executor.execute(application, *args, **kwargs)
+
+        command = [application] + [str(arg) for arg in args]
+        logger.debug('PosixSpawnExecutor::execute() Starting "{}"'.format(' '.join(command)))
+
+        log_fd = os.open(self.logFile.getPath(), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            spawn = os.posix_spawn if os.path.sep in application else os.posix_spawnp
+            pid = spawn(application, command, self.get_environment(),
+                        file_actions=self.get_file_actions(log_fd),
+                        setsid=self.is_non_blocking,
+                        setsigmask=(),
+                        setsigdef=self.get_ignored_signals())
+        finally:
+            os.close(log_fd)
+
+        if self.is_non_blocking:
+            logger.debug(f'PosixSpawnExecutor::execute() Started process {pid}, not waiting for it')
+            threading.Thread(target=os.waitpid, args=(pid, 0), name='SpawnReaper', daemon=True).start()
+            return
+
+        _, status = os.waitpid(pid, 0)
+        logger.debug('PosixSpawnExecutor::execute() Process {} returned {}'.format(pid, os.waitstatus_to_exitcode(status)
+                     if hasattr(os, 'waitstatus_to_exitcode') else status))
+
+    def get_environment(self) -> typing.Dict[str, str]:
+        return {k: v for k, v in os.environ.items() if k not in PosixSpawnExecutor.REMOVED_ENVIRONMENT}
+
+    @staticmethod
+    def get_file_actions(log_fd: int) -> list:
+        actions = [
+            (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+            (os.POSIX_SPAWN_DUP2, log_fd, 1),
+            (os.POSIX_SPAWN_DUP2, log_fd, 2),
+        ]
+        try:
+            open_fds = [int(fd) for fd in os.listdir('/proc/self/fd')]
+        except OSError:
+            open_fds = []
+        for fd in open_fds:
+            if fd <= 2 or fd == log_fd:
+                continue
+            try:
+                if os.get_inheritable(fd):
+                    actions.append((os.POSIX_SPAWN_CLOSE, fd))
+            except OSError:
+                # The descriptor used for listing /proc/self/fd is gone by now
+                continue
+        actions.append((os.POSIX_SPAWN_CLOSE, log_fd))
+        return actions
+
+    @staticmethod
+    def get_ignored_signals() -> typing.List[int]:
+        ignored = []
+        for signal_number in signal.valid_signals():
+            if signal_number in (signal.SIGKILL, signal.SIGSTOP):
+                continue
+            if signal.getsignal(signal_number) == signal.SIG_IGN:
+                ignored.append(signal_number)
+        return ignored
+
+
+# ------------------------------------------------------------------------------------------------
+# Hands out PosixSpawnExecutors for applications that are executable files and leaves everything
+# else (.desktop files, scripts without exec bit, Windows) to the default executor factory.
+# ------------------------------------------------------------------------------------------------
+class PosixSpawnExecutorFactory(object):
+
+    def __init__(self, executor_factory, report_path, is_non_blocking: bool = False):
+        self.executor_factory = executor_factory
+        self.report_path = report_path
+        self.is_non_blocking = is_non_blocking
+
+    def create(self, application, *args, **kwargs):
+        path = application.getPath() if hasattr(application, 'getPath') else application
+        if isinstance(path, str) and not path.lower().endswith('.desktop') and os.path.isfile(path) \
+                and os.access(path, os.X_OK):
+            return PosixSpawnExecutor(self.report_path, self.is_non_blocking,
+                                      lambda: self.executor_factory.create(application, *args, **kwargs))
+        return self.executor_factory.create(application, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.executor_factory, name)
+
+
+# ------------------------------------------------------------------------------------------------
+# Starts applications with the extracted ROM instead of the archive, see ExtractionCache.
+# ------------------------------------------------------------------------------------------------
+class ExtractingExecutorFactory(object):
+
+    def __init__(self, executor_factory, extraction_cache: ExtractionCache):
+        self.executor_factory = executor_factory
+        self.extraction_cache = extraction_cache
+
+    def create(self, *args, **kwargs):
+        executor = self.executor_factory.create(*args, **kwargs)
+        return ExtractingExecutor(executor, self.extraction_cache) if executor is not None else None
+
+    def __getattr__(self, name):
+        return getattr(self.executor_factory, name)
+
+
+class ExtractingExecutor(object):
+
+    def __init__(self, executor, extraction_cache: ExtractionCache):
+        self.executor = executor
+        self.extraction_cache = extraction_cache
+
+    def execute(self, application, *args, **kwargs):
+        # With the FILE option the ROM itself is the application
+        application, *args = self.extraction_cache.substitute([application, *args])
+        return self.executor.execute(application, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.executor, name)
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Extraction cache for archived ROMs
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import json
+import time
+import shutil
+import hashlib
+import zipfile
+import threading
+import contextlib
+import subprocess
+import typing
+
+from concurrent.futures import ThreadPoolExecutor, Future
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = ('.zip', '.7z')
+# Files emulators should be started with when an archive holds more than one file
+MAIN_FILE_EXTENSIONS = ('.m3u', '.cue', '.gdi', '.ccd', '.mds', '.chd')
+SEVEN_ZIP_BINARIES = ('7z', '7za', '7zz', '7zr')
+CHUNK_SIZE = 1024 * 1024
+# Directories without index entry younger than this may still be written by another launch
+ORPHAN_GRACE_SECONDS = 60 * 60
+
+
+def archive_fingerprint(path: str) -> str:
+    stat = os.stat(path)
+    return hashlib.sha1('{}\0{}\0{}'.format(path, stat.st_size, stat.st_mtime_ns).encode('utf-8')).hexdigest()
+
+
+def is_archive(path: str) -> bool:
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _extract_zip(archive_path: str, target_dir: str):
+    root = os.path.realpath(target_dir)
+    with zipfile.ZipFile(archive_path) as archive:
+        for entry in archive.infolist():
+            target = os.path.realpath(os.path.join(target_dir, entry.filename))
+            if not target.startswith(root + os.sep):
+                raise ValueError(f'Archive entry "{entry.filename}" points outside the target directory')
+            if entry.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Streamed in chunks, never a whole disc image in memory
+            with archive.open(entry) as source, open(target, 'wb') as destination:
+                shutil.copyfileobj(source, destination, CHUNK_SIZE)
+
+
+def _extract_7z(archive_path: str, target_dir: str):
+    binary = next((shutil.which(b) for b in SEVEN_ZIP_BINARIES if shutil.which(b)), None)
+    if binary is None:
+        raise OSError('No 7-Zip binary found to extract "{}"'.format(archive_path))
+    subprocess.run([binary, 'x', '-y', '-bd', '-o' + target_dir, archive_path],
+                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+
+
+def find_main_file(extract_dir: str) -> typing.Optional[str]:
+    files = []
+    for root, _, names in os.walk(extract_dir):
+        files.extend(os.path.join(root, n) for n in names)
+    if len(files) == 0:
+        return None
+    for extension in MAIN_FILE_EXTENSIONS:
+        matches = sorted(f for f in files if f.lower().endswith(extension))
+        if len(matches) > 0:
+            return matches[0]
+    return max(files, key=os.path.getsize)
+
+
+def _get_dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, n)) for root, _, names in os.walk(path) for n in names)
+
+
+class ExtractionCacheStats(object):
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.wait_seconds = 0.0
+
+    def __str__(self):
+        return '{} hits, {} misses, {} failures, waited {:.1f}ms for extraction'.format(
+            self.hits, self.misses, self.failures, self.wait_seconds * 1000)
+
+
+# ------------------------------------------------------------------------------------------------
+# Archives extracted into cache_dir/<fingerprint of the archive>, at most max_size bytes in total.
+# prepare() starts the extraction of a ROM archive as soon as the ROM is known, substitute() then
+# waits for it and swaps the archive path in the arguments for the extracted main file.
+# An existing extraction is reused right away and a new one is written to the index as soon as it
+# is done. The index is shared by launches running at the same time: it is merged with what is on
+# disk under a lock file before every write. The least recently used extractions, and directories
+# the index does not know (left by a launch that ended before saving), are removed in a background
+# thread after the launch.
+# ------------------------------------------------------------------------------------------------
+class ExtractionCache(object):
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, cache_dir: str, max_size: int):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.index_path = os.path.join(cache_dir, ExtractionCache.INDEX_FILE)
+        self.entries: typing.Dict[str, dict] = {}
+        # Totals over all launches, stats only counts this one
+        self.total_hits = 0
+        self.total_misses = 0
+        # Counts of this launch already in the index
+        self.saved_hits = 0
+        self.saved_misses = 0
+        self.evicted: typing.Set[str] = set()
+        self.pending: typing.Dict[str, Future] = {}
+        self.stats = ExtractionCacheStats()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Extract')
+        self.eviction_thread: typing.Optional[threading.Thread] = None
+        self._load()
+
+    def prepare(self, archive_path: str):
+        if not is_archive(archive_path) or archive_path in self.pending:
+            return
+        self.pending[archive_path] = self.executor.submit(self.get_extracted, archive_path)
+
+    def substitute(self, args: typing.Sequence) -> list:
+        """Replaces the prepared archive paths in the arguments with their extracted main files."""
+        substituted = list(args)
+        for archive_path, future in self.pending.items():
+            start = time.perf_counter()
+            try:
+                extracted_path = future.result()
+            except Exception as ex:
+                logger.error(f'Extracting "{archive_path}" failed. Launching the archive itself.', exc_info=ex)
+                self.stats.failures += 1
+                continue
+            finally:
+                self.stats.wait_seconds += time.perf_counter() - start
+
+            if extracted_path is None:
+                continue
+            substituted = [arg.replace(archive_path, extracted_path) if isinstance(arg, str) else arg
+                           for arg in substituted]
+        return substituted
+
+    def get_extracted(self, archive_path: str) -> typing.Optional[str]:
+        key = archive_fingerprint(archive_path)
+        entry = self.entries.get(key)
+        if entry is not None and os.path.exists(os.path.join(self.cache_dir, key, entry['main'])):
+            with self.lock:
+                entry['last_used'] = time.time()
+                self.stats.hits += 1
+            logger.debug(f'Extraction cache hit for "{archive_path}"')
+            return os.path.join(self.cache_dir, key, entry['main'])
+
+        self.stats.misses += 1
+        target_dir = os.path.join(self.cache_dir, key)
+        temp_dir = '{}.{}.tmp'.format(target_dir, os.getpid())
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        try:
+            if archive_path.lower().endswith('.zip'):
+                _extract_zip(archive_path, temp_dir)
+            else:
+                _extract_7z(archive_path, temp_dir)
+            main_file = find_main_file(temp_dir)
+            if main_file is None:
+                logger.warning(f'Archive "{archive_path}" is empty')
+                return None
+            main_file = os.path.relpath(main_file, temp_dir)
+            shutil.rmtree(target_dir, ignore_errors=True)
+            os.rename(temp_dir, target_dir)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        with self.lock:
+            self.entries[key] = {
+                'archive': archive_path, 'main': main_file, 'size': _get_dir_size(target_dir), 'last_used': time.time()
+            }
+            self._save()
+        logger.debug(f'Extracted "{archive_path}" into "{target_dir}"')
+        return os.path.join(target_dir, main_file)
+
+    def evict_in_background(self):
+        """
+        Saves the index, removes the least recently used extractions above the size limit and
+        the directories without index entry.
+        """
+        self.eviction_thread = threading.Thread(target=self._evict_and_save, name='ExtractEvict')
+        self.eviction_thread.start()
+
+    def wait(self):
+        if self.eviction_thread is not None:
+            self.eviction_thread.join()
+        self.executor.shutdown(wait=True)
+
+    def get_report_lines(self) -> typing.List[str]:
+        return [
+            'Extraction cache: {}'.format(self.stats),
+            'Extraction cache totals: {} hits, {} misses, {} MB in use'.format(
+                self.total_hits + self.stats.hits, self.total_misses + self.stats.misses,
+                self.get_total_size() // (1024 * 1024))
+        ]
+
+    def get_total_size(self) -> int:
+        return sum(e['size'] for e in self.entries.values())
+
+    def _evict_and_save(self):
+        in_use = {archive_fingerprint(p) for p in self.pending if os.path.exists(p)}
+        with self.lock:
+            with self._locked():
+                self._merge_index()
+                total_size = self.get_total_size()
+                for key, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_used']):
+                    if total_size <= self.max_size:
+                        break
+                    if key in in_use:
+                        continue
+                    shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+                    del self.entries[key]
+                    self.evicted.add(key)
+                    total_size -= entry['size']
+                    logger.debug(f'Evicted extraction of "{entry["archive"]}"')
+                self._write_index()
+            self._remove_orphans()
+
+    def _load(self):
+        data = self._read_index()
+        self.entries = data.get('entries', {})
+        self.total_hits = data.get('hits', 0)
+        self.total_misses = data.get('misses', 0)
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _remove_orphans(self):
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        now = time.time()
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            if name in self.entries or not os.path.isdir(path):
+                continue
+            try:
+                if now - os.stat(path).st_mtime < ORPHAN_GRACE_SECONDS:
+                    continue
+            except OSError:
+                continue
+            logger.debug(f'Removing extraction "{name}" missing in the index')
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _save(self):
+        with self._locked():
+            self._merge_index()
+            self._write_index()
+
+    def _merge_index(self):
+        """
+        Takes in what other launches wrote to the index since it was loaded: their extractions,
+        later uses and counts. Entries another launch evicted stay out.
+        """
+        data = self._read_index()
+        entries = {key: entry for key, entry in data.get('entries', {}).items() if key not in self.evicted}
+        for key, entry in self.entries.items():
+            if key in entries:
+                entries[key]['last_used'] = max(entries[key]['last_used'], entry['last_used'])
+            elif os.path.isdir(os.path.join(self.cache_dir, key)):
+                entries[key] = entry
+        self.entries = entries
+        self.total_hits = data.get('hits', 0) - self.saved_hits
+        self.total_misses = data.get('misses', 0) - self.saved_misses
+
+    def _write_index(self):
+        temp_path = '{}.{}.tmp'.format(self.index_path, os.getpid())
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({
+                'entries': self.entries,
+                'hits': self.total_hits + self.stats.hits,
+                'misses': self.total_misses + self.stats.misses
+            }, file, separators=(',', ':'))
+        os.replace(temp_path, self.index_path)
+        self.saved_hits = self.stats.hits
+        self.saved_misses = self.stats.misses
+
+    @contextlib.contextmanager
+    def _locked(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.index_path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Loop safe walk of local ROM directories
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import fnmatch
+import typing
+
+logger = logging.getLogger(__name__)
+
+# Directories of NAS systems and tools that never hold ROMs
+DEFAULT_PRUNE_PATTERNS = '.git|@eaDir|#recycle|$RECYCLE.BIN|System Volume Information'
+DEFAULT_MAX_SYMLINK_DEPTH = 3
+
+
+def is_local(path: str) -> bool:
+    """Paths Kodi reads through its VFS (smb://, nfs://, special://) are not walked here."""
+    return '://' not in path
+
+
+def parse_prune_patterns(text: str) -> typing.List[str]:
+    return [pattern.strip() for pattern in (text or '').split('|') if pattern.strip()]
+
+
+# ------------------------------------------------------------------------------------------------
+# Walks a directory tree with os.scandir. Every directory is listed once, identified by its
+# device and inode, so symlinks and bind mounts back into the tree do not loop or list the same
+# files twice. Symlinked directories are followed up to max_symlink_depth links deep. Directories
+# matching a prune pattern are skipped before they are listed. A pattern matches the directory
+# name, or with a / in it the path relative to the root, case insensitive like the file
+# systems ROMs usually live on.
+# ------------------------------------------------------------------------------------------------
+class DirectoryWalker(object):
+
+    def __init__(self, prune_patterns: typing.Iterable[str] = (), max_symlink_depth: int = DEFAULT_MAX_SYMLINK_DEPTH):
+        self.prune_patterns = [pattern.lower().strip('/') for pattern in prune_patterns]
+        self.max_symlink_depth = max_symlink_depth
+        self.num_dirs = 0
+        self.num_files = 0
+        self.num_pruned = 0
+        self.num_duplicates = 0
+        self.num_too_deep = 0
+        self.num_errors = 0
+
+    def is_pruned(self, name: str, relative_path: str) -> bool:
+        name = name.lower()
+        relative_path = relative_path.lower()
+        for pattern in self.prune_patterns:
+            if fnmatch.fnmatchcase(relative_path if '/' in pattern else name, pattern):
+                return True
+        return False
+
+    def walk(self, root: str, recursive: bool = True,
+             set_steps: typing.Callable[[int], None] = None,
+             increment_step: typing.Callable[[], None] = None) -> typing.List[str]:
+        """
+        Paths of all files below root. set_steps gets the number of directories directly in
+        root and increment_step is called when each of them is done, for a progress dialog.
+        """
+        files = []
+        visited = set()
+        try:
+            root_stat = os.stat(root)
+        except OSError as ex:
+            logger.warning(f'Cannot read ROM path {root}: {ex}')
+            self.num_errors += 1
+            return files
+        visited.add((root_stat.st_dev, root_stat.st_ino))
+
+        subdirs = self._list(root, '', 0, visited, files)
+        if not recursive:
+            return files
+        if set_steps is not None:
+            set_steps(len(subdirs))
+        for subdir in subdirs:
+            stack = [subdir]
+            while stack:
+                path, relative_path, symlink_depth = stack.pop()
+                # Reversed, so the directories are walked in name order
+                stack.extend(reversed(self._list(path, relative_path, symlink_depth, visited, files)))
+            if increment_step is not None:
+                increment_step()
+        return files
+
+    def _list(self, path: str, relative_path: str, symlink_depth: int,
+              visited: typing.Set[typing.Tuple[int, int]],
+              files: typing.List[str]) -> typing.List[typing.Tuple[str, str, int]]:
+        """Adds the files in path to files and returns the directories in it still to walk."""
+        subdirs = []
+        try:
+            with os.scandir(path) as iterator:
+                entries = sorted(iterator, key=lambda e: e.name)
+        except OSError as ex:
+            logger.warning(f'Cannot list {path}: {ex}')
+            self.num_errors += 1
+            return subdirs
+        self.num_dirs += 1
+
+        for entry in entries:
+            try:
+                if not entry.is_dir():
+                    if entry.is_file():
+                        files.append(entry.path)
+                        self.num_files += 1
+                    continue
+
+                entry_relative_path = entry.name if not relative_path else relative_path + '/' + entry.name
+                if self.is_pruned(entry.name, entry_relative_path):
+                    logger.debug(f'Pruned {entry.path}')
+                    self.num_pruned += 1
+                    continue
+                entry_symlink_depth = symlink_depth + 1 if entry.is_symlink() else symlink_depth
+                if entry_symlink_depth > self.max_symlink_depth:
+                    logger.debug(f'Not following {entry.path}, more than {self.max_symlink_depth} symlinks deep')
+                    self.num_too_deep += 1
+                    continue
+                stat = entry.stat()
+                key = (stat.st_dev, stat.st_ino)
+                if key in visited:
+                    logger.debug(f'Skipping {entry.path}, directory already walked')
+                    self.num_duplicates += 1
+                    continue
+                visited.add(key)
+                subdirs.append((entry.path, entry_relative_path, entry_symlink_depth))
+            except OSError as ex:
+                logger.debug(f'Cannot read {entry.path}: {ex}')
+                self.num_errors += 1
+        return subdirs
+
+    def get_summary(self) -> str:
+        return '{} files in {} directories, {} pruned, {} already walked, {} too many symlinks deep, {} unreadable'.format(
+            self.num_files, self.num_dirs, self.num_pruned, self.num_duplicates, self.num_too_deep, self.num_errors)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Keep-alive HTTP client for the AKL webserver calls
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import io
+import json
+import gzip
+import socket
+import contextlib
+import threading
+import http.client
+import urllib.error
+import urllib.request
+import urllib.response
+import typing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IDLE_PER_HOST = 4
+# Request bodies smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 16 * 1024
+COMPRESSION_LEVEL = 5
+
+# Errors of a reused connection that the server closed while it was idle in the pool
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                           ConnectionResetError, BrokenPipeError)
+
+
+# ------------------------------------------------------------------------------------------------
+# http.client sends the headers and the body of a request with separate writes. On a connection
+# that stays open, Nagle's algorithm then holds the body back until the server's delayed ACK
+# for the headers arrives, about 40ms per call. Those calls are small, so Nagle is switched off.
+# ------------------------------------------------------------------------------------------------
+class NoDelayHTTPConnection(http.client.HTTPConnection):
+
+    def connect(self):
+        super(NoDelayHTTPConnection, self).connect()
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+_installed_handler: typing.Optional['KeepAliveHandler'] = None
+_install_lock = threading.Lock()
+
+
+def _strip_empty_fields(value):
+    if isinstance(value, dict):
+        return {k: _strip_empty_fields(v) for k, v in value.items()
+                if v is not None and not (isinstance(v, (str, list, dict)) and len(v) == 0)}
+    if isinstance(value, list):
+        return [_strip_empty_fields(v) for v in value]
+    return value
+
+
+def encode_compact_json(data: bytes) -> bytes:
+    """
+    Encodes a JSON body without whitespace and without the fields that only hold their empty
+    default (None, '', [] or {}). Bodies that are not JSON objects or arrays are returned as they are.
+    """
+    if data[:1] not in (b'{', b'['):
+        return data
+    try:
+        payload = json.loads(data.decode('utf-8'))
+    except ValueError:
+        return data
+    return json.dumps(_strip_empty_fields(payload), separators=(',', ':')).encode('utf-8')
+
+
+# ------------------------------------------------------------------------------------------------
+# urllib handler keeping HTTP/1.1 connections open per host, so every akl.api call of a command
+# goes over the same connection instead of opening a new one. Responses are read completely
+# before they are returned, which hands the connection back to the pool right away.
+# A reused connection the server has closed in the meantime is replaced and the request is
+# sent once more over a new connection.
+# Inside compressed_requests() large request bodies are sent gzipped. The first compressed body
+# to a host tells whether it takes them: webservers without support do not answer 415 but fail
+# to decode the body as JSON (400 or 500) before storing anything, so after any error status
+# the body is sent once more uncompressed and that host only gets plain bodies from then on.
+# Once a host took a compressed body, errors are returned as they are without sending again,
+# the store calls are not idempotent.
+# ------------------------------------------------------------------------------------------------
+class KeepAliveHandler(urllib.request.HTTPHandler):
+
+    def __init__(self, max_idle_per_host: int = DEFAULT_MAX_IDLE_PER_HOST):
+        super(KeepAliveHandler, self).__init__()
+        self.max_idle_per_host = max_idle_per_host
+        self.idle: typing.Dict[str, typing.List[http.client.HTTPConnection]] = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.compress_bodies = False
+        self.compact_json = False
+        self.plain_hosts: typing.Set[str] = set()
+        self.gzip_hosts: typing.Set[str] = set()
+        self.bytes_before_encoding = 0
+        self.bytes_sent = 0
+
+    def http_open(self, req: urllib.request.Request):
+        host = req.host
+        if not host:
+            raise urllib.error.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers['Connection'] = 'keep-alive'
+        headers = {name.title(): value for name, value in headers.items()}
+
+        data = req.data
+        if not isinstance(data, bytes):
+            return self._request(host, req, headers, data)
+
+        if self.compact_json:
+            data = encode_compact_json(data)
+        self.bytes_before_encoding += len(req.data)
+        if not self.compress_bodies or host in self.plain_hosts or len(data) < COMPRESS_MIN_SIZE:
+            self.bytes_sent += len(data)
+            return self._request(host, req, headers, data)
+
+        compressed = gzip.compress(data, COMPRESSION_LEVEL)
+        self.bytes_sent += len(compressed)
+        response = self._request(host, req, dict(headers, **{'Content-Encoding': 'gzip'}), compressed)
+        if host in self.gzip_hosts:
+            return response
+        if response.status < 400:
+            self.gzip_hosts.add(host)
+            return response
+
+        logger.info(f'Webserver {host} answered {response.status} to a compressed request, sending plain bodies')
+        self.plain_hosts.add(host)
+        self.bytes_sent += len(data)
+        return self._request(host, req, headers, data)
+
+    def _request(self, host: str, req: urllib.request.Request, headers: dict,
+                 data: typing.Optional[bytes]) -> urllib.response.addinfourl:
+        if isinstance(data, bytes):
+            headers['Content-Length'] = str(len(data))
+
+        connection, is_reused = self._acquire(host, req.timeout)
+        try:
+            response = self._send(connection, req, headers, data)
+        except STALE_CONNECTION_ERRORS as ex:
+            connection.close()
+            if not is_reused:
+                raise urllib.error.URLError(ex)
+            logger.debug(f'Pooled connection to {host} was closed by the server, reconnecting')
+            connection, _ = self._acquire(host, req.timeout, reuse=False)
+            try:
+                response = self._send(connection, req, headers, data)
+            except (OSError, http.client.HTTPException) as retry_ex:
+                connection.close()
+                raise urllib.error.URLError(retry_ex)
+        except (OSError, http.client.HTTPException) as ex:
+            connection.close()
+            raise urllib.error.URLError(ex)
+
+        try:
+            body = response.read()
+        except (OSError, http.client.HTTPException) as ex:
+            connection.close()
+            raise urllib.error.URLError(ex)
+
+        with self.lock:
+            self.requests += 1
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(host, connection)
+
+        result = urllib.response.addinfourl(io.BytesIO(body), response.msg, req.get_full_url(), response.status)
+        result.msg = response.reason
+        return result
+
+    def _send(self, connection: http.client.HTTPConnection, req: urllib.request.Request,
+              headers: dict, data: typing.Optional[bytes]) -> http.client.HTTPResponse:
+        connection.request(req.get_method(), req.selector, data, headers,
+                           encode_chunked=req.has_header('Transfer-encoding'))
+        return connection.getresponse()
+
+    def _acquire(self, host: str, timeout: typing.Optional[float],
+                 reuse: bool = True) -> typing.Tuple[http.client.HTTPConnection, bool]:
+        with self.lock:
+            connections = self.idle.get(host)
+            if reuse and connections:
+                connection = connections.pop()
+                if timeout is not None and timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    connection.timeout = timeout
+                    if connection.sock is not None:
+                        connection.sock.settimeout(timeout)
+                return connection, True
+            self.connections_opened += 1
+        return NoDelayHTTPConnection(host, timeout=timeout), False
+
+    def _release(self, host: str, connection: http.client.HTTPConnection):
+        with self.lock:
+            connections = self.idle.setdefault(host, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            connections = [c for host_connections in self.idle.values() for c in host_connections]
+            self.idle.clear()
+        for connection in connections:
+            connection.close()
+
+    def get_summary(self) -> str:
+        summary = '{} HTTP requests over {} connections'.format(self.requests, self.connections_opened)
+        if self.bytes_sent != self.bytes_before_encoding:
+            summary += ', {} KB of request bodies sent as {} KB'.format(
+                self.bytes_before_encoding // 1024, self.bytes_sent // 1024)
+        return summary
+
+
+def install(max_idle_per_host: int = DEFAULT_MAX_IDLE_PER_HOST) -> KeepAliveHandler:
+    """
+    Installs the keep-alive handler as the global urllib opener, which akl.api uses for its
+    webserver calls. Only the first call installs it, later calls return the same handler.
+    """
+    global _installed_handler
+    with _install_lock:
+        if _installed_handler is None:
+            _installed_handler = KeepAliveHandler(max_idle_per_host)
+            urllib.request.install_opener(urllib.request.build_opener(_installed_handler))
+        return _installed_handler
+
+
+def uninstall():
+    global _installed_handler
+    with _install_lock:
+        if _installed_handler is not None:
+            _installed_handler.close()
+            _installed_handler = None
+            urllib.request.install_opener(None)
+
+
+@contextlib.contextmanager
+def compressed_requests(compress: bool = True, compact_json: bool = False):
+    """
+    Sends the request bodies of the with block gzipped and, with compact_json, in the compact
+    JSON encoding. Meant for the bulk store calls, which send the largest bodies.
+    """
+    handler = install()
+    previous = (handler.compress_bodies, handler.compact_json)
+    handler.compress_bodies = compress
+    handler.compact_json = compact_json
+    try:
+        yield handler
+    finally:
+        handler.compress_bodies, handler.compact_json = previous
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Local caches for the launch path
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import json
+import time
+import hashlib
+import threading
+import typing
+
+logger = logging.getLogger(__name__)
+
+
+def _write_json(path: str, data: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, separators=(',', ':'), default=str)
+    os.replace(temp_path, path)
+
+
+def _read_json(path: str) -> typing.Optional[dict]:
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+# ------------------------------------------------------------------------------------------------
+# Snapshot of the launcher settings per launcher and ROM, so a launch does not have to wait for
+# the AKL webserver. Each snapshot carries a content version. After a launch the settings are
+# fetched again and a changed version replaces the snapshot for the next launch. A snapshot older
+# than max_age is not used, that launch fetches the settings before it starts, so an edit on the
+# webserver is at most max_age old when a ROM is launched with it.
+# ------------------------------------------------------------------------------------------------
+class LauncherSettingsSnapshot(object):
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, cache_dir: str, max_age: int):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+
+    @staticmethod
+    def get_version(launcher_settings: dict) -> str:
+        encoded = json.dumps(launcher_settings, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha1(encoded).hexdigest()
+
+    def get(self, launcher_id: str, rom_id: str) -> typing.Optional[dict]:
+        snapshot = _read_json(self._get_path(launcher_id, rom_id))
+        if snapshot is None or snapshot.get('format') != LauncherSettingsSnapshot.FORMAT_VERSION:
+            return None
+        if self._is_expired(snapshot):
+            logger.debug(f'Launcher settings snapshot of {launcher_id}/{rom_id} expired')
+            return None
+        return snapshot['settings']
+
+    def put(self, launcher_id: str, rom_id: str, launcher_settings: dict) -> bool:
+        """Stores the settings and returns True when they differ from the stored version."""
+        version = self.get_version(launcher_settings)
+        current = _read_json(self._get_path(launcher_id, rom_id))
+        is_changed = current is None or current.get('version') != version
+        # An expired snapshot with the same settings is stored again, to be used from now on
+        if not is_changed and not self._is_expired(current):
+            return False
+
+        _write_json(self._get_path(launcher_id, rom_id), {
+            'format': LauncherSettingsSnapshot.FORMAT_VERSION,
+            'version': version,
+            'stored_at': time.time(),
+            'settings': launcher_settings
+        })
+        return is_changed
+
+    def _is_expired(self, snapshot: dict) -> bool:
+        return self.max_age > 0 and time.time() - snapshot.get('stored_at', 0) > self.max_age
+
+    def invalidate(self, launcher_id: str):
+        """Removes the snapshots of this launcher for all ROMs."""
+        prefix = '{}-'.format(launcher_id)
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith(prefix):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def _get_path(self, launcher_id: str, rom_id: str) -> str:
+        return os.path.join(self.cache_dir, '{}-{}.json'.format(launcher_id, rom_id))
+
+
+# ------------------------------------------------------------------------------------------------
+# Resolved application paths with the identity (inode, mtime) of the binary. A hit only costs an
+# access() check of the binary, the identity is checked again in a background thread once the
+# launch is under way. Entries of binaries that are gone are dropped and not returned, so the
+# launch takes the normal checks again and reports the missing application.
+# ------------------------------------------------------------------------------------------------
+class ApplicationResolutionCache(object):
+
+    FILE_NAME = 'applications.json'
+
+    def __init__(self, cache_dir: str):
+        self.file_path = os.path.join(cache_dir, ApplicationResolutionCache.FILE_NAME)
+        self.entries: typing.Optional[typing.Dict[str, dict]] = None
+        self.lock = threading.Lock()
+        self.recheck_thread: typing.Optional[threading.Thread] = None
+
+    def resolve(self, application: str) -> typing.Optional[str]:
+        entry = self._get_entries().get(application)
+        if entry is None:
+            return None
+        if not os.access(entry['path'], os.X_OK):
+            logger.warning(f'Application "{entry["path"]}" is gone. Removed it from the cache.')
+            self.forget(application)
+            return None
+
+        self.recheck_thread = threading.Thread(target=self.recheck, args=(application,), name='AppRecheck', daemon=True)
+        self.recheck_thread.start()
+        return entry['path']
+
+    def store(self, application: str, resolved_path: str):
+        identity = self._get_identity(resolved_path)
+        if identity is None:
+            return
+        with self.lock:
+            entries = self._get_entries()
+            entries[application] = {'path': resolved_path, 'ino': identity[0], 'mtime': identity[1]}
+            _write_json(self.file_path, entries)
+
+    def forget(self, application: str):
+        with self.lock:
+            entries = self._get_entries()
+            if entries.pop(application, None) is not None:
+                _write_json(self.file_path, entries)
+
+    def recheck(self, application: str):
+        entry = self._get_entries().get(application)
+        if entry is None:
+            return
+        identity = self._get_identity(entry['path'])
+        if identity is None:
+            logger.warning(f'Application "{entry["path"]}" is gone. Removed it from the cache.')
+            self.forget(application)
+        elif identity != (entry['ino'], entry['mtime']):
+            logger.debug(f'Application "{entry["path"]}" changed. Updating the cache.')
+            self.store(application, entry['path'])
+
+    def wait(self):
+        if self.recheck_thread is not None:
+            self.recheck_thread.join()
+
+    def _get_entries(self) -> typing.Dict[str, dict]:
+        if self.entries is None:
+            self.entries = _read_json(self.file_path) or {}
+        return self.entries
+
+    @staticmethod
+    def _get_identity(path: str) -> typing.Optional[typing.Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
@@ -18,12 +18,21 @@ from __future__ import division
 
 import logging
 import collections
+import contextlib
+import time
+import typing
 
 # --- AKL packages ---
-from akl import platforms
+from akl import platforms, api
 from akl.utils import io, kodi
 from akl.launchers import LauncherABC
 
+from resources.lib.apihooks import override_api_call
+from resources.lib.launchcache import LauncherSettingsSnapshot, ApplicationResolutionCache
+from resources.lib.prewarm import Prewarmer
+from resources.lib.extractcache import ExtractionCache
+from resources.lib.timeline import LaunchTimeline, PHASE_WEBSERVER, PHASE_APPLICATION
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,6 +42,25 @@ logger = logging.getLogger(__name__)
 # -------------------------------------------------------------------------------------------------
 class AppLauncher(LauncherABC):
 
+    def __init__(self, launcher_id: str, rom_id: str, webservice_host: str, webservice_port: int,
+                 executorFactory=None, execution_settings=None,
+                 settings_snapshot: LauncherSettingsSnapshot = None,
+                 application_cache: ApplicationResolutionCache = None,
+                 prewarmer: Prewarmer = None,
+                 timeline: LaunchTimeline = None,
+                 extraction_cache: ExtractionCache = None):
+        self.settings_snapshot = settings_snapshot
+        self.application_cache = application_cache
+        self.prewarmer = prewarmer
+        self.timeline = timeline
+        self.extraction_cache = extraction_cache
+        self.snapshot_key = (launcher_id, rom_id)
+        self.snapshot_used = False
+        self.settings_call: typing.Optional[tuple] = None
+        self.timings: typing.Dict[str, float] = {}
+        super(AppLauncher, self).__init__(launcher_id, rom_id, webservice_host, webservice_port,
+                                          executorFactory, execution_settings)
+
     # --------------------------------------------------------------------------------------------
     # Core methods
     # --------------------------------------------------------------------------------------------
@@ -43,6 +71,90 @@ class AppLauncher(LauncherABC):
         addon_id = kodi.get_addon_id()
         return addon_id
 
+    def launch(self):
+        with contextlib.ExitStack() as stack:
+            if self.settings_snapshot is not None:
+                stack.enter_context(
+                    override_api_call('client_get_launcher_settings', self._get_launcher_settings_through_snapshot))
+            if self.prewarmer is not None or self.extraction_cache is not None:
+                stack.enter_context(override_api_call('client_get_rom', self._prepare_loaded_rom))
+            if self.timeline is not None:
+                stack.enter_context(override_api_call('client_get_launcher_settings', self._measure_webserver_call))
+                stack.enter_context(override_api_call('client_get_rom', self._measure_webserver_call))
+            return super(AppLauncher, self).launch()
+
+    def store_settings(self):
+        result = super(AppLauncher, self).store_settings()
+        if self.settings_snapshot is not None:
+            # Snapshots for single ROMs of this launcher could be outdated now as well
+            launcher_id, entity_id = self.snapshot_key
+            self.settings_snapshot.invalidate(launcher_id)
+            self.settings_snapshot.put(launcher_id, entity_id, self.launcher_settings)
+        return result
+
+    def revalidate_settings_snapshot(self) -> bool:
+        """
+        Fetches the launcher settings from the webserver after a launch that used the snapshot.
+        Returns True when they had changed, the next launch will then use the new settings.
+        """
+        if not self.snapshot_used or self.settings_call is None:
+            return False
+
+        args, kwargs = self.settings_call
+        start = time.perf_counter()
+        try:
+            launcher_settings = api.client_get_launcher_settings(*args, **kwargs)
+        except Exception as ex:
+            logger.warning('Could not revalidate the launcher settings snapshot', exc_info=ex)
+            return False
+        self.timings['revalidate'] = time.perf_counter() - start
+
+        if launcher_settings is None:
+            return False
+        is_changed = self.settings_snapshot.put(*self.snapshot_key, launcher_settings)
+        if is_changed:
+            logger.info('Launcher settings changed on the webserver. Snapshot updated.')
+        return is_changed
+
+    def _get_launcher_settings_through_snapshot(self, get_launcher_settings):
+        def get_launcher_settings_from_snapshot(*args, **kwargs):
+            self.settings_call = (args, kwargs)
+            start = time.perf_counter()
+            launcher_settings = self.settings_snapshot.get(*self.snapshot_key)
+            if launcher_settings is not None:
+                self.snapshot_used = True
+                self.timings['settings'] = time.perf_counter() - start
+                return launcher_settings
+
+            launcher_settings = get_launcher_settings(*args, **kwargs)
+            self.timings['settings'] = time.perf_counter() - start
+            if launcher_settings is not None:
+                self.settings_snapshot.put(*self.snapshot_key, launcher_settings)
+            return launcher_settings
+        return get_launcher_settings_from_snapshot
+
+    def _measure_webserver_call(self, api_call):
+        def measured_api_call(*args, **kwargs):
+            with self.timeline.measure(PHASE_WEBSERVER):
+                return api_call(*args, **kwargs)
+        return measured_api_call
+
+    def _prepare_loaded_rom(self, get_rom):
+        # Starts prewarming or extracting the ROM file as soon as the ROM is known,
+        # while the launch is still being prepared
+        def get_rom_and_prepare(*args, **kwargs):
+            rom = get_rom(*args, **kwargs)
+            try:
+                rom_file = rom.get_scanned_data_element_as_file('file') if rom is not None else None
+                if rom_file is not None and self.prewarmer is not None:
+                    self.prewarmer.start(rom_file.getPath())
+                if rom_file is not None and self.extraction_cache is not None:
+                    self.extraction_cache.prepare(rom_file.getPath())
+            except Exception as ex:
+                logger.debug('Not preparing the ROM file', exc_info=ex)
+            return rom
+        return get_rom_and_prepare
+
     # --------------------------------------------------------------------------------------------
     # Launcher build wizard methods
     # --------------------------------------------------------------------------------------------
@@ -122,6 +234,16 @@ class AppLauncher(LauncherABC):
     # Execution methods
     # ---------------------------------------------------------------------------------------------
     def get_application(self) -> str:
+        if self.timeline is not None:
+            with self.timeline.measure(PHASE_APPLICATION):
+                application = self._resolve_application()
+        else:
+            application = self._resolve_application()
+        if self.prewarmer is not None and application is not None and application != '$ROM$':
+            self.prewarmer.start(application)
+        return application
+
+    def _resolve_application(self) -> str:
         if 'application' not in self.launcher_settings:
             logger.error('LauncherABC::launch() No application argument defined')
             return None
@@ -129,6 +251,11 @@ class AppLauncher(LauncherABC):
         if self.launcher_settings['application'] == 'FILE':
             return "$ROM$"
         
+        if self.application_cache is not None:
+            resolved_path = self.application_cache.resolve(self.launcher_settings['application'])
+            if resolved_path is not None:
+                return resolved_path
+
         application = io.FileName(self.launcher_settings['application'])
         
         # --- Check for errors and abort if errors found ---
@@ -137,4 +264,6 @@ class AppLauncher(LauncherABC):
             kodi.notify_warn('App {0} not found.'.format(application.getPath()))
             return None
         
+        if self.application_cache is not None:
+            self.application_cache.store(self.launcher_settings['application'], application.getPath())
         return application.getPath()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Opt-in memory diagnostics of scans and scrapes
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import io
+import contextlib
+import functools
+import tracemalloc
+import typing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_N = 10
+# Frames kept per allocation. One frame is enough to name the line, more makes tracing slower.
+TRACE_FRAMES = 1
+MB = 1024 * 1024
+
+
+class PhaseMemory(object):
+    """Memory of one phase: traced memory at the start and end, the peak and the top allocation sites."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0
+        self.end = 0
+        self.peak = 0
+        self.top_sites: typing.List[typing.Tuple[str, int, int]] = []
+
+    def get_growth(self) -> int:
+        return self.end - self.start
+
+
+# ------------------------------------------------------------------------------------------------
+# Traces the Python allocations of a command with tracemalloc and splits them into phases, like
+# collecting candidates, fetching the ROMs of the source or storing the results. Per phase the
+# peak is kept, and the allocation sites that grew the most between the start and the end of
+# the phase, which is what is still held by the candidates, ROM lists or report buffers.
+# Tracing slows allocations down a lot, so this is only for finding out why a scan runs out
+# of memory, not for every run.
+# ------------------------------------------------------------------------------------------------
+class MemoryDiagnostics(object):
+
+    def __init__(self, top_n: int = DEFAULT_TOP_N):
+        self.top_n = top_n
+        self.phases: typing.List[PhaseMemory] = []
+        self.items = 0
+        self.started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            self.started_tracing = True
+
+    def stop(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        if not tracemalloc.is_tracing():
+            yield None
+            return
+        phase = PhaseMemory(name)
+        before = self._take_snapshot()
+        phase.start = tracemalloc.get_traced_memory()[0]
+        # Without reset_peak (before Python 3.9) the peak is the highest since tracing started
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        try:
+            yield phase
+        finally:
+            phase.end, phase.peak = tracemalloc.get_traced_memory()
+            after = self._take_snapshot()
+            phase.top_sites = [(str(stat.traceback[0]), stat.size_diff, stat.count_diff)
+                               for stat in after.compare_to(before, 'lineno')[:self.top_n]]
+            self.phases.append(phase)
+            logger.debug('Memory of {}: peak {:.1f}MB, grew {:.1f}MB'.format(
+                name, phase.peak / MB, phase.get_growth() / MB))
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        # Allocations of tracemalloc itself are no part of the command
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    def set_items(self, items: int):
+        """The number of files or ROMs the command went through, to project the memory from."""
+        self.items = items
+
+    def get_peak(self) -> int:
+        return max((phase.peak for phase in self.phases), default=0)
+
+    def get_projected_peak(self, library_size: int) -> int:
+        """
+        The peak scaled to a library of library_size items, assuming memory grows linearly with
+        the number of items. Without a library size or items the measured peak is returned.
+        """
+        peak = self.get_peak()
+        if library_size <= self.items or self.items <= 0:
+            return peak
+        return int(peak * library_size / self.items)
+
+    def get_summary(self, library_size: int = 0, limit: int = 0) -> str:
+        output = io.StringIO()
+        output.write('Items: {}\n'.format(self.items))
+        output.write('Peak: {:.1f}MB\n'.format(self.get_peak() / MB))
+        if library_size > self.items:
+            output.write('Projected peak for {} items: {:.1f}MB\n'.format(
+                library_size, self.get_projected_peak(library_size) / MB))
+        if limit > 0:
+            output.write('Limit: {:.1f}MB\n'.format(limit / MB))
+        for phase in self.phases:
+            output.write('\n--- {} ---\n'.format(phase.name))
+            output.write('Peak {:.1f}MB, start {:.1f}MB, end {:.1f}MB\n'.format(
+                phase.peak / MB, phase.start / MB, phase.end / MB))
+            for site, size_diff, count_diff in phase.top_sites:
+                output.write('{:>+10.1f}KB {:>+8} blocks  {}\n'.format(size_diff / 1024, count_diff, site))
+        return output.getvalue()
+
+
+def phase(diagnostics: typing.Optional[MemoryDiagnostics], name: str) -> typing.ContextManager:
+    """diagnostics.phase(name), or a context doing nothing when the diagnostics are off."""
+    if diagnostics is None:
+        return contextlib.nullcontext()
+    return diagnostics.phase(name)
+
+
+def traced_phase(name: str):
+    """Method decorator running the method as a phase of self.memory_diagnostics, when set."""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with phase(getattr(self, 'memory_diagnostics', None), name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def traced_call(diagnostics: typing.Optional[MemoryDiagnostics], name: str, function: typing.Callable) -> typing.Callable:
+    """function, running every call as a phase."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with phase(diagnostics, name):
+            return function(*args, **kwargs)
+    return wrapper
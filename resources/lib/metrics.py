@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Metrics in the Prometheus text exposition format
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import re
+import math
+import bisect
+import threading
+import collections
+import typing
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FILE_NAME = 'script_akl_defaults.prom'
+
+TYPE_COUNTER = 'counter'
+TYPE_GAUGE = 'gauge'
+TYPE_HISTOGRAM = 'histogram'
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)(?:\s+-?\d+)?$')
+LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+LabelKey = typing.Tuple[typing.Tuple[str, str], ...]
+SampleKey = typing.Tuple[str, LabelKey]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_series(name: str, labels: LabelKey) -> str:
+    if len(labels) == 0:
+        return name
+    return '{}{{{}}}'.format(name, ','.join('{}="{}"'.format(k, _escape(v)) for k, v in labels))
+
+
+def _get_label_key(labels: typing.Dict[str, typing.Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class MetricFamily(object):
+    """HELP, TYPE and samples of one metric, as read from the exposition file."""
+
+    def __init__(self, name: str, metric_type: str = 'untyped', help_text: str = ''):
+        self.name = name
+        self.type = metric_type
+        self.help = help_text
+        self.samples: typing.OrderedDict[SampleKey, float] = collections.OrderedDict()
+
+
+def parse_exposition(text: str) -> typing.OrderedDict[str, MetricFamily]:
+    families: typing.OrderedDict[str, MetricFamily] = collections.OrderedDict()
+    current: typing.Optional[MetricFamily] = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#'):
+            parts = line.split(None, 3)
+            if len(parts) >= 3 and parts[1] in ('HELP', 'TYPE'):
+                current = families.setdefault(parts[2], MetricFamily(parts[2]))
+                if parts[1] == 'TYPE' and len(parts) == 4:
+                    current.type = parts[3].strip()
+                elif parts[1] == 'HELP':
+                    current.help = parts[3] if len(parts) == 4 else ''
+            continue
+
+        match = SAMPLE_RE.match(line)
+        if match is None:
+            logger.debug(f'Skipping unreadable metrics line "{line}"')
+            continue
+        sample_name, label_text, value_text = match.groups()
+        try:
+            value = float(value_text)
+        except ValueError:
+            continue
+        labels = tuple(sorted((k, _unescape(v)) for k, v in LABEL_RE.findall(label_text or '')))
+        if current is None or not sample_name.startswith(current.name):
+            current = families.setdefault(sample_name, MetricFamily(sample_name))
+        current.samples[(sample_name, labels)] = value
+    return families
+
+
+# ------------------------------------------------------------------------------------------------
+# Metrics of a single command. Counters and histograms only hold what happened during this
+# command, gauges hold their last value. Saving merges them into the values already in the file,
+# so every plugin invocation adds to the totals of the ones before.
+# ------------------------------------------------------------------------------------------------
+class Metric(object):
+
+    def __init__(self, name: str, metric_type: str, help_text: str):
+        self.name = name
+        self.type = metric_type
+        self.help = help_text
+        self.lock = threading.Lock()
+
+    def get_samples(self) -> typing.List[typing.Tuple[str, float, bool]]:
+        """(series, value, value is added to the saved value) of the series that changed."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+
+    def __init__(self, name: str, help_text: str):
+        super(Counter, self).__init__(name, TYPE_COUNTER, help_text)
+        self.values: typing.Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount < 0:
+            raise ValueError('Counters can only go up')
+        key = _get_label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get_samples(self) -> typing.List[typing.Tuple[str, float, bool]]:
+        return [(_format_series(self.name, labels), value, True) for labels, value in self.values.items()]
+
+    def clear(self):
+        self.values.clear()
+
+
+class Gauge(Metric):
+
+    def __init__(self, name: str, help_text: str):
+        super(Gauge, self).__init__(name, TYPE_GAUGE, help_text)
+        self.values: typing.Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[_get_label_key(labels)] = value
+
+    def get_samples(self) -> typing.List[typing.Tuple[str, float, bool]]:
+        return [(_format_series(self.name, labels), value, False) for labels, value in self.values.items()]
+
+    def clear(self):
+        self.values.clear()
+
+
+class Histogram(Metric):
+
+    def __init__(self, name: str, help_text: str, buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, TYPE_HISTOGRAM, help_text)
+        self.buckets = sorted(buckets)
+        # Label key -> (count per bucket with +Inf last, sum)
+        self.values: typing.Dict[LabelKey, typing.Tuple[typing.List[int], float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _get_label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def get_samples(self) -> typing.List[typing.Tuple[str, float, bool]]:
+        samples = []
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + [math.inf], counts):
+                cumulative += count
+                bucket_labels = tuple(sorted(labels + (('le', _format_value(bound)),)))
+                samples.append((_format_series(self.name + '_bucket', bucket_labels), cumulative, True))
+            samples.append((_format_series(self.name + '_sum', labels), total, True))
+            samples.append((_format_series(self.name + '_count', labels), sum(counts), True))
+        return samples
+
+    def clear(self):
+        self.values.clear()
+
+
+# ------------------------------------------------------------------------------------------------
+# Saving only touches the lines of the series that changed, all other lines of the file are
+# copied as they are. The file holds the series of every source and launcher, so parsing and
+# writing all of them back would cost more than the command being measured.
+# ------------------------------------------------------------------------------------------------
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self.metrics: typing.OrderedDict[str, Metric] = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str = '') -> Counter:
+        return self._register(name, lambda: Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str = '') -> Gauge:
+        return self._register(name, lambda: Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str = '', buckets: typing.Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(name, help_text, buckets))
+
+    def _register(self, name: str, create: typing.Callable[[], Metric]):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = create()
+            return self.metrics[name]
+
+    def merge(self, lines: typing.List[str]) -> typing.List[str]:
+        """Merges the metrics into the lines of an exposition file."""
+        series_lines: typing.Dict[str, int] = {}
+        family_ends: typing.Dict[str, int] = {}
+        family = None
+        for i, line in enumerate(lines):
+            if line.startswith('#'):
+                parts = line.split(None, 3)
+                if len(parts) >= 3:
+                    family = parts[2]
+                    family_ends[family] = i
+                continue
+            series = line.rpartition(' ')[0]
+            series_lines[series] = i
+            if family is not None:
+                family_ends[family] = i
+
+        # New series go behind the last line of their family, new families at the end
+        additions: typing.Dict[int, typing.List[str]] = collections.defaultdict(list)
+        new_families: typing.List[str] = []
+        for metric in self.metrics.values():
+            with metric.lock:
+                samples = metric.get_samples()
+            if len(samples) == 0:
+                continue
+            if metric.name not in family_ends:
+                new_families.append('# HELP {} {}'.format(metric.name, metric.help))
+                new_families.append('# TYPE {} {}'.format(metric.name, metric.type))
+            for series, value, is_added in samples:
+                index = series_lines.get(series)
+                if index is None:
+                    line = '{} {}'.format(series, _format_value(value))
+                    if metric.name in family_ends:
+                        additions[family_ends[metric.name]].append(line)
+                    else:
+                        new_families.append(line)
+                    continue
+                if is_added:
+                    try:
+                        value += float(lines[index].rpartition(' ')[2])
+                    except ValueError:
+                        pass
+                lines[index] = '{} {}'.format(series, _format_value(value))
+
+        if len(additions) == 0:
+            return lines + new_families
+        merged = []
+        for i, line in enumerate(lines):
+            merged.append(line)
+            merged.extend(additions.get(i, ()))
+        return merged + new_families
+
+    def save(self, path: str):
+        """
+        Merges the metrics into the exposition file at path. The file is replaced in one rename,
+        so the textfile collector never reads half of it. A lock file keeps two commands that
+        finish at the same time from losing each other's updates.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                lines = self.merge(self._read(path))
+                temp_path = '{}.{}.tmp'.format(path, os.getpid())
+                with open(temp_path, 'w', encoding='utf-8') as file:
+                    file.write('\n'.join(lines) + '\n')
+                os.replace(temp_path, path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        self._reset()
+
+    def _read(self, path: str) -> typing.List[str]:
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                return [line for line in file.read().split('\n') if line.strip()]
+        except OSError:
+            return []
+
+    def _reset(self):
+        # Saved values are in the file now, a next save only adds what happened since
+        for metric in self.metrics.values():
+            with metric.lock:
+                metric.clear()
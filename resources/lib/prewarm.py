@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Page cache prewarming before a launch
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import time
+import threading
+import typing
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_LIMIT = 1024 * 1024 * 1024
+
+
+def prewarm_file(path: str, limit: int = DEFAULT_LIMIT) -> int:
+    """
+    Asks the kernel to read the first limit bytes of a file into the page cache.
+    Uses posix_fadvise(WILLNEED) where available, which returns right away and lets the kernel
+    read ahead asynchronously. Elsewhere the file is read in chunks. Returns the bytes covered.
+    """
+    with open(path, 'rb', buffering=0) as file:
+        length = min(os.fstat(file.fileno()).st_size, limit)
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(file.fileno(), 0, length, os.POSIX_FADV_WILLNEED)
+            return length
+
+        remaining = length
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        return length - remaining
+
+
+# ------------------------------------------------------------------------------------------------
+# Prewarms files in the background while the launcher does its setup work, so the emulator
+# binary and the ROM are (partly) in memory when the emulator starts reading them.
+# Paths that cannot be opened with plain file IO, like smb:// paths, are skipped. The threads
+# are daemon threads, a read on slow storage never keeps the plugin or worker from exiting.
+# ------------------------------------------------------------------------------------------------
+class Prewarmer(object):
+
+    def __init__(self, limit: int = DEFAULT_LIMIT):
+        self.limit = limit
+        self.threads: typing.List[threading.Thread] = []
+        self.started: typing.Set[str] = set()
+        self.bytes_prewarmed = 0
+        self.started_at: typing.Optional[float] = None
+        self.lock = threading.Lock()
+
+    def start(self, path: typing.Optional[str]):
+        if not path or path in self.started or not os.path.isabs(path):
+            return
+        self.started.add(path)
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+        thread = threading.Thread(target=self._prewarm, args=(path,), name='Prewarm', daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def wait(self, timeout: float = None):
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def get_elapsed(self, until: float = None) -> float:
+        """Seconds from the start of prewarming until the given perf_counter() time, or now."""
+        if self.started_at is None:
+            return 0.0
+        return (until if until is not None else time.perf_counter()) - self.started_at
+
+    def _prewarm(self, path: str):
+        try:
+            count = prewarm_file(path, self.limit)
+        except OSError as ex:
+            logger.debug(f'Cannot prewarm "{path}": {ex}')
+            return
+        with self.lock:
+            self.bytes_prewarmed += count
+        logger.debug(f'Prewarmed {count} bytes of "{path}"')
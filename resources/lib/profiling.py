@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Opt-in profiling of plugin commands
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import io
+import re
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+# Set to 1 to profile every command, whatever the addon setting says
+ENV_VARIABLE = 'AKL_DEFAULTS_PROFILE'
+DEFAULT_TOP_N = 40
+SORT_KEYS = ('cumulative', 'tottime')
+
+
+def is_enabled_by_environment() -> bool:
+    return os.environ.get(ENV_VARIABLE, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_profile_name(command: str, entity_id: typing.Optional[str], started: float = None) -> str:
+    parts = [command or 'command']
+    if entity_id:
+        parts.append(entity_id)
+    parts.append(time.strftime('%Y%m%d-%H%M%S', time.localtime(started)))
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', '-'.join(parts))
+
+
+# ------------------------------------------------------------------------------------------------
+# Profiles one command with cProfile. The profiler only sees the thread it was started in,
+# which is the thread running the command. Besides the stats the wall time, the CPU time of
+# that thread and the CPU time of the whole process are kept, so time spent waiting on the
+# webserver or the disk shows up as the difference between wall and CPU time.
+# cProfile and pstats are only imported here, so importing this module costs next to nothing
+# when profiling is off.
+# ------------------------------------------------------------------------------------------------
+class CommandProfile(object):
+
+    def __init__(self, name: str):
+        import cProfile
+        self.name = name
+        self.profiler = cProfile.Profile()
+        self.wall_time = 0.0
+        self.thread_time = 0.0
+        self.process_time = 0.0
+        self._started: typing.Optional[typing.Tuple[float, float, float]] = None
+
+    def __enter__(self) -> 'CommandProfile':
+        self._started = (time.perf_counter(), time.thread_time(), time.process_time())
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.disable()
+        wall_start, thread_start, process_start = self._started
+        self.wall_time = time.perf_counter() - wall_start
+        self.thread_time = time.thread_time() - thread_start
+        self.process_time = time.process_time() - process_start
+        return False
+
+    def get_summary(self, top_n: int = DEFAULT_TOP_N) -> str:
+        import pstats
+        output = io.StringIO()
+        output.write('Profile of {}\n'.format(self.name))
+        output.write('Wall time:          {:.3f}s\n'.format(self.wall_time))
+        output.write('CPU time (command): {:.3f}s\n'.format(self.thread_time))
+        output.write('CPU time (process): {:.3f}s\n'.format(self.process_time))
+        stats = pstats.Stats(self.profiler, stream=output)
+        stats.strip_dirs()
+        for sort_key in SORT_KEYS:
+            output.write('\n--- Top {} by {} time ---\n'.format(top_n, sort_key))
+            stats.sort_stats(sort_key).print_stats(top_n)
+        return output.getvalue()
+
+    def write(self, directory: str, top_n: int = DEFAULT_TOP_N) -> typing.List[str]:
+        """Writes <name>.pstats and <name>.txt and returns their file names."""
+        stats_file = self.name + '.pstats'
+        summary_file = self.name + '.txt'
+        self.profiler.dump_stats(os.path.join(directory, stats_file))
+        with open(os.path.join(directory, summary_file), 'w', encoding='utf-8') as file:
+            file.write(self.get_summary(top_n))
+        return [stats_file, summary_file]
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Report store
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import json
+import gzip
+import contextlib
+import shutil
+import time
+import typing
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_LAUNCH = 'launch'
+CATEGORY_TIMELINE = 'timeline'
+CATEGORY_SCAN = 'scan'
+CATEGORY_SCRAPE = 'scrape'
+CATEGORY_PROFILE = 'profile'
+CATEGORY_MEMORY = 'memory'
+CATEGORY_LEGACY = 'legacy'
+
+DAY = 24 * 3600
+PRUNE_INTERVAL = 3600
+
+
+class ReportLimits(object):
+
+    def __init__(self, max_age_days: int = 30, max_size_mb: int = 50, compress_after_days: int = 1):
+        self.max_age = max_age_days * DAY
+        self.max_size = max_size_mb * 1024 * 1024
+        # 0 disables compression, for files that keep being appended to
+        self.compress_after = compress_after_days * DAY
+
+
+# ------------------------------------------------------------------------------------------------
+# Reports live in one subdirectory per category under the reports directory. Each category keeps
+# its own index.jsonl journal with a line per registered report (file, entity, time, size), so
+# registering a report is one small append and never reads the index. Other invocations (a scan
+# next to a launch) append to the same journal under a lock file.
+# Pruning happens at most once an hour per category, which the mtime of a marker file tells
+# without reading the journal. It reads the journal, gzips older reports, deletes reports past
+# the maximum age and then the oldest until the category fits its size limit, and rewrites the
+# journal with one line per report left.
+# ------------------------------------------------------------------------------------------------
+class ReportStore(object):
+
+    INDEX_FILE = 'index.jsonl'
+    PRUNED_FILE = '.pruned'
+    LEGACY_INDEX_FILE = 'index.json'
+
+    def __init__(self, reports_dir: str, limits: typing.Dict[str, ReportLimits] = None,
+                 default_limits: ReportLimits = None):
+        self.reports_dir = reports_dir
+        self.limits = limits if limits else {}
+        self.default_limits = default_limits if default_limits else ReportLimits()
+        self.created_dirs: typing.Set[str] = set()
+
+    def get_category_dir(self, category: str) -> str:
+        category_dir = os.path.join(self.reports_dir, category)
+        if category not in self.created_dirs:
+            os.makedirs(category_dir, exist_ok=True)
+            self.created_dirs.add(category)
+        return category_dir
+
+    def get_path(self, category: str, file_name: str) -> str:
+        return os.path.join(self.get_category_dir(category), file_name)
+
+    def register(self, category: str, file_name: str, entity: str):
+        """Adds a written report to the index of its category."""
+        self.register_all(category, [(file_name, entity)])
+
+    def register_all(self, category: str, reports: typing.Iterable[typing.Tuple[str, str]]):
+        """Adds written reports, given as (file name, entity), with one append to the index."""
+        category_dir = self.get_category_dir(category)
+        lines = []
+        for file_name, entity in reports:
+            try:
+                stat = os.stat(os.path.join(category_dir, file_name))
+            except OSError:
+                continue
+            lines.append(json.dumps({'file': file_name, 'entity': entity, 'time': stat.st_mtime, 'size': stat.st_size},
+                                    separators=(',', ':')))
+        if len(lines) == 0:
+            return
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        with self._locked(category_dir):
+            with open(os.path.join(category_dir, ReportStore.INDEX_FILE), 'ab+') as file:
+                # A line cut short by a crash while appending stays a line of its own
+                if file.seek(0, os.SEEK_END) > 0:
+                    file.seek(-1, os.SEEK_END)
+                    if file.read(1) != b'\n':
+                        data = b'\n' + data
+                file.write(data)
+
+    def register_new(self, category: str, entity: str, since: float):
+        """Adds the reports written by others since the given time. Only for small categories."""
+        category_dir = self.get_category_dir(category)
+        new_reports = []
+        for file_name in os.listdir(category_dir):
+            if file_name in (ReportStore.INDEX_FILE, ReportStore.PRUNED_FILE) or file_name.endswith('.lock'):
+                continue
+            try:
+                if os.stat(os.path.join(category_dir, file_name)).st_mtime >= since:
+                    new_reports.append((file_name, entity))
+            except OSError:
+                continue
+        self.register_all(category, new_reports)
+
+    def get_entries(self, category: str) -> typing.Dict[str, dict]:
+        """file name -> entry of the reports of a category, the later registration of a file wins."""
+        entries = {}
+        try:
+            with open(os.path.join(self.reports_dir, category, ReportStore.INDEX_FILE), 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                        entries[entry.pop('file')] = entry
+                    except (ValueError, KeyError, AttributeError):
+                        continue
+        except OSError:
+            pass
+        return entries
+
+    def find_latest(self, category: str, entity: str) -> typing.Optional[str]:
+        """Path of the newest report of the entity, found in the index without listing the directory."""
+        entries = [(e.get('time', 0), name) for name, e in self.get_entries(category).items() if e.get('entity') == entity]
+        if len(entries) == 0:
+            return None
+        return os.path.join(self.reports_dir, category, max(entries)[1])
+
+    def get_total_size(self, category: str) -> int:
+        return sum(e['size'] for e in self.get_entries(category).values())
+
+    def prune(self, category: str, force: bool = False):
+        category_dir = self.get_category_dir(category)
+        pruned_path = os.path.join(category_dir, ReportStore.PRUNED_FILE)
+        now = time.time()
+        try:
+            if not force and now - os.path.getmtime(pruned_path) < PRUNE_INTERVAL:
+                return
+        except OSError:
+            pass
+
+        if category == CATEGORY_LEGACY:
+            self._move_legacy_reports()
+        with self._locked(category_dir):
+            with open(pruned_path, 'w'):
+                pass
+            entries = self.get_entries(category)
+            self._prune_entries(category_dir, entries, self.limits.get(category, self.default_limits), now)
+
+            temp_path = '{}.{}.tmp'.format(os.path.join(category_dir, ReportStore.INDEX_FILE), os.getpid())
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                for file_name, entry in sorted(entries.items(), key=lambda item: item[1]['time']):
+                    file.write(json.dumps(dict(entry, file=file_name), separators=(',', ':')) + '\n')
+            os.replace(temp_path, os.path.join(category_dir, ReportStore.INDEX_FILE))
+
+    def _prune_entries(self, category_dir: str, entries: typing.Dict[str, dict], limits: ReportLimits, now: float):
+        for file_name, entry in sorted(entries.items(), key=lambda item: item[1]['time']):
+            age = now - entry['time']
+            if limits.max_age > 0 and age > limits.max_age:
+                self._remove(category_dir, entries, file_name)
+            elif limits.compress_after > 0 and age > limits.compress_after and not file_name.endswith('.gz'):
+                self._compress(category_dir, entries, file_name)
+
+        if limits.max_size <= 0:
+            return
+        total_size = sum(e['size'] for e in entries.values())
+        for file_name, entry in sorted(entries.items(), key=lambda item: item[1]['time']):
+            if total_size <= limits.max_size:
+                break
+            total_size -= entry['size']
+            self._remove(category_dir, entries, file_name)
+
+    def _move_legacy_reports(self):
+        # Reports from before the store was used lie directly in the reports directory.
+        # They get moved into their own category, so they age out like the others.
+        try:
+            file_names = [n for n in os.listdir(self.reports_dir)
+                          if n != ReportStore.LEGACY_INDEX_FILE and os.path.isfile(os.path.join(self.reports_dir, n))]
+        except OSError:
+            return
+        if len(file_names) == 0:
+            return
+        legacy_dir = self.get_category_dir(CATEGORY_LEGACY)
+        moved = []
+        for file_name in file_names:
+            try:
+                os.replace(os.path.join(self.reports_dir, file_name), os.path.join(legacy_dir, file_name))
+            except OSError:
+                continue
+            moved.append((file_name, os.path.splitext(file_name)[0]))
+        self.register_all(CATEGORY_LEGACY, moved)
+        logger.info(f'Moved {len(moved)} reports into "{legacy_dir}"')
+
+    @contextlib.contextmanager
+    def _locked(self, category_dir: str):
+        with open(os.path.join(category_dir, ReportStore.INDEX_FILE + '.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _compress(self, category_dir: str, entries: typing.Dict[str, dict], file_name: str):
+        path = os.path.join(category_dir, file_name)
+        try:
+            with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(path)
+        except OSError as ex:
+            logger.debug(f'Cannot compress report "{path}": {ex}')
+            return
+
+        entry = entries.pop(file_name)
+        entry['size'] = os.path.getsize(path + '.gz')
+        entries[file_name + '.gz'] = entry
+
+    def _remove(self, category_dir: str, entries: typing.Dict[str, dict], file_name: str):
+        try:
+            os.remove(os.path.join(category_dir, file_name))
+        except FileNotFoundError:
+            pass
+        except OSError as ex:
+            logger.debug(f'Cannot remove report "{file_name}": {ex}')
+            return
+        entries.pop(file_name, None)
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Cartridge ROM header parsing
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import sys
+import json
+import mmap
+import struct
+import zipfile
+import typing
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from resources.lib.scrapecache import file_signature
+
+logger = logging.getLogger(__name__)
+
+PROCESS_POOL_THRESHOLD = 256
+DEFAULT_WORKERS = 4
+
+# Game code region characters used by N64 and GBA
+REGION_CODES = {
+    'A': 'World', 'B': 'Brazil', 'C': 'China', 'D': 'Germany', 'E': 'USA', 'F': 'France',
+    'I': 'Italy', 'J': 'Japan', 'K': 'Korea', 'P': 'Europe', 'S': 'Spain', 'U': 'Australia',
+    'X': 'Europe', 'Y': 'Europe'
+}
+SNES_REGIONS = {
+    0x00: 'Japan', 0x01: 'USA', 0x02: 'Europe', 0x03: 'Sweden', 0x04: 'Finland', 0x05: 'Denmark',
+    0x06: 'France', 0x07: 'Netherlands', 0x08: 'Spain', 0x09: 'Germany', 0x0A: 'Italy', 0x0B: 'China',
+    0x0D: 'Korea', 0x0F: 'Canada', 0x10: 'Brazil', 0x11: 'Australia'
+}
+NES_REGIONS = {0: 'NTSC', 1: 'PAL', 2: 'Multiple', 3: 'Dendy'}
+MEGADRIVE_REGIONS = {'J': 'Japan', 'U': 'USA', 'E': 'Europe'}
+
+
+def _text(data: bytes) -> str:
+    text = data.split(b'\x00', 1)[0].decode('ascii', errors='ignore')
+    text = ' '.join(text.split())
+    return text.title() if text.isupper() else text
+
+
+# --- Parsers. Each gets the first bytes of the ROM and returns None when they don't match. ------
+def parse_nes(data: bytes) -> typing.Optional[dict]:
+    if len(data) < 16 or data[:4] != b'NES\x1a':
+        return None
+    header = {
+        'format': 'iNES',
+        'prg_rom_kb': data[4] * 16,
+        'chr_rom_kb': data[5] * 8,
+        'mapper': (data[7] & 0xF0) | (data[6] >> 4)
+    }
+    if data[7] & 0x0C == 0x08:
+        header['format'] = 'NES 2.0'
+        header['region'] = NES_REGIONS[data[12] & 0x03]
+    return header
+
+
+def parse_snes(data: bytes) -> typing.Optional[dict]:
+    # Copier headers add 512 bytes in front of the ROM
+    offsets = [0x7FC0, 0xFFC0, 0x81C0, 0x101C0]
+    for offset in offsets:
+        if len(data) < offset + 0x20:
+            continue
+        checksum_complement, checksum = struct.unpack_from('<HH', data, offset + 0x1C)
+        if checksum_complement ^ checksum != 0xFFFF:
+            continue
+        title = _text(data[offset:offset + 21])
+        if not title:
+            continue
+        return {
+            'format': 'SNES',
+            'title': title,
+            'region': SNES_REGIONS.get(data[offset + 0x19]),
+            'publisher': '{:02X}'.format(data[offset + 0x1A]),
+            'version': data[offset + 0x1B],
+            'checksum': '{:04X}'.format(checksum)
+        }
+    return None
+
+
+def parse_gameboy(data: bytes) -> typing.Optional[dict]:
+    if len(data) < 0x150:
+        return None
+    header_checksum = 0
+    for value in data[0x134:0x14D]:
+        header_checksum = (header_checksum - value - 1) & 0xFF
+    if header_checksum != data[0x14D]:
+        return None
+
+    cgb_flag = data[0x143]
+    title = _text(data[0x134:0x143] if cgb_flag & 0x80 else data[0x134:0x144])
+    old_licensee = data[0x14B]
+    publisher = data[0x144:0x146].decode('ascii', errors='ignore') if old_licensee == 0x33 else '{:02X}'.format(old_licensee)
+    return {
+        'format': 'Game Boy Color' if cgb_flag & 0x80 else 'Game Boy',
+        'title': title,
+        'region': 'Japan' if data[0x14A] == 0 else 'World',
+        'publisher': publisher,
+        'checksum': '{:04X}'.format(struct.unpack_from('>H', data, 0x14E)[0])
+    }
+
+
+def parse_gba(data: bytes) -> typing.Optional[dict]:
+    if len(data) < 0xC0 or data[0xB2] != 0x96:
+        return None
+    complement = 0
+    for value in data[0xA0:0xBD]:
+        complement = (complement - value) & 0xFF
+    if (complement - 0x19) & 0xFF != data[0xBD]:
+        return None
+
+    game_code = data[0xAC:0xB0].decode('ascii', errors='ignore')
+    return {
+        'format': 'GBA',
+        'title': _text(data[0xA0:0xAC]),
+        'serial': game_code,
+        'region': REGION_CODES.get(game_code[3:4]),
+        'publisher': data[0xB0:0xB2].decode('ascii', errors='ignore'),
+        'checksum': '{:02X}'.format(data[0xBD])
+    }
+
+
+def parse_megadrive(data: bytes) -> typing.Optional[dict]:
+    if len(data) < 0x200 or not data[0x100:0x104] == b'SEGA' and not data[0x101:0x105] == b'SEGA':
+        return None
+    title = _text(data[0x150:0x180]) or _text(data[0x120:0x150])
+    regions = data[0x1F0:0x1F3].decode('ascii', errors='ignore').strip()
+    return {
+        'format': 'Mega Drive',
+        'title': title,
+        'serial': _text(data[0x180:0x18E]),
+        'region': ', '.join(MEGADRIVE_REGIONS[r] for r in regions if r in MEGADRIVE_REGIONS) or None,
+        'publisher': data[0x113:0x117].decode('ascii', errors='ignore').strip(),
+        'checksum': '{:04X}'.format(struct.unpack_from('>H', data, 0x18E)[0])
+    }
+
+
+def parse_n64(data: bytes) -> typing.Optional[dict]:
+    if len(data) < 0x40:
+        return None
+    magic = data[:4]
+    if magic == b'\x37\x80\x40\x12':
+        # .v64, byte swapped
+        data = bytes(b for pair in zip(data[1::2], data[0::2]) for b in pair)
+    elif magic == b'\x40\x12\x37\x80':
+        # .n64, little endian words
+        data = b''.join(data[i:i + 4][::-1] for i in range(0, 0x40, 4))
+    elif magic != b'\x80\x37\x12\x40':
+        return None
+
+    game_code = data[0x3B:0x3F].decode('ascii', errors='ignore')
+    crc1, crc2 = struct.unpack_from('>II', data, 0x10)
+    return {
+        'format': 'N64',
+        'title': _text(data[0x20:0x34]),
+        'serial': game_code,
+        'region': REGION_CODES.get(game_code[3:4]),
+        'version': data[0x3F],
+        'checksum': '{:08X}{:08X}'.format(crc1, crc2)
+    }
+
+
+# Extension -> (bytes needed from the start of the ROM, parser)
+HEADER_PARSERS = {
+    '.nes': (0x10, parse_nes),
+    '.sfc': (0x101E0, parse_snes),
+    '.smc': (0x101E0, parse_snes),
+    '.gb': (0x150, parse_gameboy),
+    '.gbc': (0x150, parse_gameboy),
+    '.gba': (0xC0, parse_gba),
+    '.md': (0x200, parse_megadrive),
+    '.gen': (0x200, parse_megadrive),
+    '.bin': (0x200, parse_megadrive),
+    '.z64': (0x40, parse_n64),
+    '.n64': (0x40, parse_n64),
+    '.v64': (0x40, parse_n64),
+}
+
+
+def _read_head(path: str, size: int) -> bytes:
+    # Only the header region gets mapped, not the whole (possibly huge) ROM
+    with open(path, 'rb') as file:
+        length = min(size, os.fstat(file.fileno()).st_size)
+        if length == 0:
+            return b''
+        with mmap.mmap(file.fileno(), length, access=mmap.ACCESS_READ) as mapped:
+            return mapped[:length]
+
+
+def read_rom_header(path: str) -> typing.Optional[dict]:
+    """Parses the internal header of a cartridge ROM, also when it is the first entry of a zip."""
+    try:
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.zip':
+            with zipfile.ZipFile(path) as archive:
+                entries = [e for e in archive.infolist() if not e.is_dir()]
+                if len(entries) == 0:
+                    return None
+                extension = os.path.splitext(entries[0].filename)[1].lower()
+                if extension not in HEADER_PARSERS:
+                    return None
+                size, parser = HEADER_PARSERS[extension]
+                with archive.open(entries[0]) as entry:
+                    return parser(entry.read(size))
+
+        if extension not in HEADER_PARSERS:
+            return None
+        size, parser = HEADER_PARSERS[extension]
+        return parser(_read_head(path, size))
+    except (OSError, ValueError, zipfile.BadZipFile) as ex:
+        logger.debug(f'Cannot read ROM header of "{path}": {ex}')
+        return None
+
+
+def supports_process_pool() -> bool:
+    # Inside Kodi sys.executable is Kodi itself, so spawning interpreter processes is not an option
+    return os.path.basename(sys.executable or '').lower().startswith('python')
+
+
+# ------------------------------------------------------------------------------------------------
+# Reads ROM headers in bulk. Results are cached by path and (size, mtime) of the ROM, so only new
+# or changed files get opened. Large sets are parsed in a process pool when one is available.
+# ------------------------------------------------------------------------------------------------
+class RomHeaderReader(object):
+
+    CACHE_FILE = 'rom_headers.json'
+
+    def __init__(self, cache_dir: str, workers: int = DEFAULT_WORKERS):
+        self.cache_path = os.path.join(cache_dir, RomHeaderReader.CACHE_FILE)
+        self.workers = workers
+        self.cache: typing.Dict[str, list] = {}
+        self.is_dirty = False
+
+    def load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                self.cache = json.load(file)
+        except (OSError, ValueError):
+            self.cache = {}
+
+    def save(self):
+        if not self.is_dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        temp_path = self.cache_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.cache, file, separators=(',', ':'))
+        os.replace(temp_path, self.cache_path)
+        self.is_dirty = False
+
+    def read_all(self, paths: typing.Iterable[str]) -> typing.Dict[str, typing.Optional[dict]]:
+        headers = {}
+        misses = []
+        for path in paths:
+            signature = file_signature(path)
+            if signature is None:
+                continue
+            cached = self.cache.get(path)
+            if cached is not None and tuple(cached[:2]) == signature:
+                headers[path] = cached[2]
+            else:
+                misses.append((path, signature))
+
+        if len(misses) == 0:
+            return headers
+
+        miss_paths = [path for path, _ in misses]
+        if len(misses) >= PROCESS_POOL_THRESHOLD and self.workers > 1 and supports_process_pool():
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(read_rom_header, miss_paths, chunksize=64))
+        elif len(misses) > 1 and self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(read_rom_header, miss_paths))
+        else:
+            results = [read_rom_header(path) for path in miss_paths]
+
+        for (path, signature), header in zip(misses, results):
+            headers[path] = header
+            self.cache[path] = [signature[0], signature[1], header]
+        self.is_dirty = True
+        logger.debug(f'Read {len(misses)} ROM headers, {len(headers) - len(misses)} from cache')
+        return headers
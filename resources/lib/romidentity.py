@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: File identity of scanned ROMs, to tell moved ROMs from new ones
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import json
+import hashlib
+import collections
+import urllib.error
+import urllib.request
+import typing
+
+logger = logging.getLogger(__name__)
+
+IDENTITY_KEY = 'identity'
+MOVED_ROMS_PATH = '/store/roms/moved/'
+# Bytes hashed at the start and at the end of a file
+PARTIAL_HASH_SIZE = 64 * 1024
+REQUEST_TIMEOUT = 60
+# Statuses of a webserver without the moved ROMs call
+UNSUPPORTED_STATUSES = (400, 404, 405, 501)
+
+# (host, port) -> whether the webserver has the moved ROMs call, probed once per process
+_moves_supported: typing.Dict[typing.Tuple[str, int], bool] = {}
+
+
+class MovesNotSupported(Exception):
+    pass
+
+
+def get_file_identity(path: str, partial_hash: bool = False) -> typing.Optional[dict]:
+    """
+    Size, modification time, inode and device of a local file, and optionally a hash of its
+    first and last bytes. None for files that are not local or cannot be read.
+    """
+    if '://' in path:
+        return None
+    try:
+        stat = os.stat(path)
+        identity = {
+            'size': stat.st_size,
+            'mtime': int(stat.st_mtime),
+            'ino': stat.st_ino,
+            'dev': stat.st_dev
+        }
+        if partial_hash:
+            identity['hash'] = get_partial_hash(path, stat.st_size)
+        return identity
+    except OSError as ex:
+        logger.debug(f'No identity for {path}: {ex}')
+        return None
+
+
+def get_partial_hash(path: str, size: int) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        digest.update(file.read(PARTIAL_HASH_SIZE))
+        if size > 2 * PARTIAL_HASH_SIZE:
+            file.seek(-PARTIAL_HASH_SIZE, os.SEEK_END)
+        digest.update(file.read(PARTIAL_HASH_SIZE))
+    return digest.hexdigest()
+
+
+def _get_inode_key(identity: dict) -> typing.Optional[tuple]:
+    # A rename keeps the mtime, a new file that got the inode of a deleted one does not
+    if identity.get('ino') is None or identity.get('dev') is None:
+        return None
+    return (identity['dev'], identity['ino'], identity.get('size'), identity.get('mtime'))
+
+
+def _get_content_key(identity: dict) -> typing.Optional[tuple]:
+    # Moves to another file system keep the size and mtime, but get a new inode
+    if identity.get('size') is None or identity.get('mtime') is None:
+        return None
+    return (identity['size'], identity['mtime'], identity.get('hash'))
+
+
+def match_moves(dead: typing.List[typing.Tuple[typing.Any, dict]],
+                new: typing.List[typing.Tuple[typing.Any, dict]]) -> typing.List[typing.Tuple[typing.Any, typing.Any]]:
+    """
+    Pairs dead ROMs with new ROMs that are the same file at another path, as (dead, new).
+    Renames and moves within a file system keep the inode, so those match first. What is
+    left matches on size, mtime and the partial hash when both have one, but only when
+    exactly one dead and one new ROM share them, so copies of a file never match.
+    """
+    moves = []
+    matched_dead = set()
+    matched_new = set()
+    for get_key in (_get_inode_key, _get_content_key):
+        dead_by_key = collections.defaultdict(list)
+        new_by_key = collections.defaultdict(list)
+        for i, (_, identity) in enumerate(dead):
+            key = get_key(identity) if i not in matched_dead else None
+            if key is not None:
+                dead_by_key[key].append(i)
+        for i, (_, identity) in enumerate(new):
+            key = get_key(identity) if i not in matched_new else None
+            if key is not None:
+                new_by_key[key].append(i)
+
+        for key, dead_indexes in dead_by_key.items():
+            new_indexes = new_by_key.get(key, [])
+            if len(dead_indexes) != 1 or len(new_indexes) != 1:
+                continue
+            matched_dead.add(dead_indexes[0])
+            matched_new.add(new_indexes[0])
+            moves.append((dead[dead_indexes[0]][0], new[new_indexes[0]][0]))
+    return moves
+
+
+def supports_moves(host: str, port: int) -> bool:
+    """
+    Whether the webserver can update the paths of moved ROMs. The first call for a webserver
+    asks with an OPTIONS request, which changes nothing, whether the moved ROMs call takes a
+    POST. Any other answer or error means no, and the answer is kept for the rest of the process.
+    """
+    if not host:
+        return False
+    key = (host, port)
+    if key not in _moves_supported:
+        url = 'http://{}:{}{}'.format(host, port, MOVED_ROMS_PATH)
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, method='OPTIONS'), timeout=REQUEST_TIMEOUT) as response:
+                allowed = response.headers.get('Allow', '')
+                _moves_supported[key] = 'POST' in [method.strip().upper() for method in allowed.split(',')]
+        except (OSError, ValueError) as ex:
+            logger.debug(f'Webserver {host}:{port} did not answer the moved ROMs check: {ex}')
+            _moves_supported[key] = False
+        if not _moves_supported[key]:
+            logger.info(f'Webserver {host}:{port} cannot update moved ROMs, they are removed and added again')
+    return _moves_supported[key]
+
+
+def post_moved_roms(host: str, port: int, source_id: str, roms: typing.List[typing.Tuple[str, dict]]):
+    """
+    Sends the new scanned data of moved ROMs as (ROM id, scanned data), so the webserver
+    updates their paths and keeps everything else. Raises MovesNotSupported when the
+    webserver does not know the call.
+    """
+    body = json.dumps({
+        'source_id': source_id,
+        'roms': [{'id': rom_id, 'scanned_data': scanned_data} for rom_id, scanned_data in roms]
+    }).encode('utf-8')
+    url = 'http://{}:{}{}'.format(host, port, MOVED_ROMS_PATH)
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            response.read()
+    except urllib.error.HTTPError as ex:
+        if ex.code in UNSUPPORTED_STATUSES:
+            raise MovesNotSupported(f'Webserver answered {ex.code}')
+        raise
@@ -20,7 +20,9 @@ from __future__ import division
 import logging
 import typing
 import re
+import hashlib
 import collections
+import contextlib
 
 # --- AKL packages ---
 from akl import report, api
@@ -28,34 +30,97 @@ from akl.utils import io, kodi
 
 from akl.scanners import RomScannerStrategy, ROMCandidateABC, MultiDiscInfo
 
+from resources.lib import apihooks, memdiag, romidentity, filewalk
+
 logger = logging.getLogger(__name__)
 
+M3U_OFF = 'OFF'
+M3U_IN_SOURCE = 'SOURCE'
+M3U_IN_CACHE = 'CACHE'
+M3U_MODES = collections.OrderedDict([
+    (M3U_OFF, 'No playlists'),
+    (M3U_IN_SOURCE, 'Write .m3u playlists in the ROMs folder'),
+    (M3U_IN_CACHE, 'Write .m3u playlists in the addon cache')
+])
+
 
 class ROMFileCandidate(ROMCandidateABC):
     
-    def __init__(self, file: io.FileName):
+    # record_identity adds the file identity to the scanned data, to recognize the ROM when it
+    # is moved or renamed later.
+    def __init__(self, file: io.FileName, extra_scanned_data: dict = None,
+                 record_identity: bool = False, partial_hash: bool = False):
         self.file = file
+        self.extra_scanned_data = extra_scanned_data
+        self.record_identity = record_identity
+        self.partial_hash = partial_hash
         super(ROMFileCandidate, self).__init__()
         
     def get_ROM(self) -> api.ROMObj:
         rom = api.ROMObj()
+        rom.set_name(self.file.getBaseNoExt())
+        rom.set_scanned_data(self.get_scanned_data())
+        return rom
+
+    def get_scanned_data(self) -> dict:
         scanned_data = {
             'file': self.file.getPath(),
             'identifier': self.file.getBaseNoExt()
         }
-        rom.set_name(self.file.getBaseNoExt())
-        rom.set_scanned_data(scanned_data)
-        return rom
+        if self.record_identity:
+            identity = romidentity.get_file_identity(self.file.getPath(), self.partial_hash)
+            if identity is not None:
+                scanned_data[romidentity.IDENTITY_KEY] = identity
+        if self.extra_scanned_data:
+            scanned_data.update(self.extra_scanned_data)
+        return scanned_data
         
     def get_sort_value(self):
         return self.file.getBase()
 
 
 class RomFolderScanner(RomScannerStrategy):
-    
+
+    # With memory_diagnostics every step of the scan is traced as a phase of its own.
+    # detect_moves records the file identity of new ROMs, and dead ROMs that turn up again as
+    # new ROMs at another path are kept as moved ROMs instead, with their metadata and assets,
+    # when the webserver can update the paths of ROMs.
+    # Local ROM paths are walked skipping directories that match prune_patterns, following
+    # symlinked directories up to max_symlink_depth links deep.
+    def __init__(self, reports_dir: io.FileName, source_id: str, webservice_host: str, webservice_port: int,
+                 progress_dialog: kodi.ProgressDialog,
+                 memory_diagnostics: typing.Optional[memdiag.MemoryDiagnostics] = None,
+                 detect_moves: bool = False, identity_hash: bool = False,
+                 prune_patterns: typing.List[str] = None,
+                 max_symlink_depth: int = filewalk.DEFAULT_MAX_SYMLINK_DEPTH):
+        super(RomFolderScanner, self).__init__(reports_dir, source_id, webservice_host, webservice_port, progress_dialog)
+        self.source_id = source_id
+        self.webservice_host = webservice_host
+        self.webservice_port = webservice_port
+        self.memory_diagnostics = memory_diagnostics
+        self.detect_moves = detect_moves
+        self.identity_hash = identity_hash
+        if prune_patterns is None:
+            prune_patterns = filewalk.parse_prune_patterns(filewalk.DEFAULT_PRUNE_PATTERNS)
+        self.prune_patterns = prune_patterns
+        self.max_symlink_depth = max_symlink_depth
+        self.num_files_found = 0
+        # (dead ROM, new ROM) of every ROM found at another path
+        self.moved_roms: typing.List[typing.Tuple[api.ROMObj, api.ROMObj]] = []
+        self.found_dead_roms: typing.List[api.ROMObj] = []
+        self.found_new_roms: typing.List[api.ROMObj] = []
+
     # --------------------------------------------------------------------------------------------
     # Core methods
     # --------------------------------------------------------------------------------------------
+    def scan(self):
+        with contextlib.ExitStack() as stack:
+            if self.memory_diagnostics is not None:
+                stack.enter_context(apihooks.override_api_call(
+                    'client_get_roms_in_source',
+                    lambda original: memdiag.traced_call(self.memory_diagnostics, 'existing ROMs', original)))
+            return super(RomFolderScanner, self).scan()
+
     def get_name(self) -> str:
         return 'Folder scanner'
     
@@ -83,6 +148,9 @@ class RomFolderScanner(RomScannerStrategy):
     def supports_multidisc(self) -> bool:
         return self.scanner_settings['multidisc']
 
+    def get_multidisc_m3u_mode(self) -> str:
+        return self.scanner_settings['multidisc_m3u'] if 'multidisc_m3u' in self.scanner_settings else M3U_OFF
+
     def _configure_get_wizard(self, wizard) -> kodi.WizardDialog:
         
         wizard = kodi.WizardDialog_FileBrowse(wizard, 'rompath', 'Select the ROMs path', 0, '')
@@ -110,6 +178,9 @@ class RomFolderScanner(RomScannerStrategy):
         options[self._change_rom_ext] = "Modify ROM extensions: '{0}'".format(self.scanner_settings['romext'])
         options[self._change_recursive_scan] = "Recursive scan: '{0}'".format(recursive_scan_str)
         options[self._change_multidisc] = "Multidisc ROM support (now {0})".format(multidisc_str)
+        if self.scanner_settings['multidisc']:
+            options[self._change_multidisc_m3u] = "Multidisc playlists (now '{0}')".format(
+                M3U_MODES[self.get_multidisc_m3u_mode()])
         options[self._change_ignore_bios] = "Ignore any BIOS file (now {0})".format(bios_str)
 
         return options
@@ -139,6 +210,13 @@ class RomFolderScanner(RomScannerStrategy):
         current_state = self.scanner_settings['multidisc']
         self.scanner_settings['multidisc'] = not current_state
 
+    def _change_multidisc_m3u(self):
+        selected_mode = kodi.OrdDictionaryDialog().select(
+            'Write a .m3u playlist per multidisc set?', M3U_MODES, self.get_multidisc_m3u_mode())
+        if selected_mode is None:
+            return
+        self.scanner_settings['multidisc_m3u'] = selected_mode
+
     def _change_ignore_bios(self):
         current_state = self.scanner_settings['ignore_bios']
         self.scanner_settings['ignore_bios'] = not current_state
@@ -147,6 +225,7 @@ class RomFolderScanner(RomScannerStrategy):
     # Execution methods
     # ---------------------------------------------------------------------------------------------
     # ~~~ Scan for new files (*.*) and put them in a list ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    @memdiag.traced_phase('candidates')
     def _getCandidates(self, launcher_report: report.Reporter) -> typing.List[ROMCandidateABC]:
         self.progress_dialog.startProgress('Scanning and caching files in ROM path ...')
         files = []
@@ -155,7 +234,15 @@ class RomFolderScanner(RomScannerStrategy):
         self.progress_dialog.updateProgress(2)
         launcher_report.write('Scanning files in {}'.format(rom_path.getPath()))
 
-        if self.scan_recursive():
+        if filewalk.is_local(rom_path.getPath()):
+            logger.info('Recursive scan {}activated'.format('' if self.scan_recursive() else 'not '))
+            walker = filewalk.DirectoryWalker(self.prune_patterns, self.max_symlink_depth)
+            files = [io.FileName(path) for path in walker.walk(rom_path.getPath(),
+                                                               self.scan_recursive(),
+                                                               self.progress_dialog.setSteps,
+                                                               self.progress_dialog.incrementStep)]
+            launcher_report.write('  {}'.format(walker.get_summary()))
+        elif self.scan_recursive():
             logger.info('Recursive scan activated')
             files = rom_path.recursiveScanFilesInPath('*.*',
                                                       self.progress_dialog.setSteps,
@@ -167,12 +254,15 @@ class RomFolderScanner(RomScannerStrategy):
                                              self.progress_dialog.incrementStep)
         
         num_files = len(files)
+        self.num_files_found = num_files
         launcher_report.write('  File scanner found {} files'.format(num_files))
         self.progress_dialog.endProgress()
         
-        return [*(ROMFileCandidate(f) for f in files)]
+        return [*(ROMFileCandidate(f, record_identity=self.detect_moves, partial_hash=self.identity_hash) for f in files)]
 
     # --- Get dead entries -----------------------------------------------------------------
+    # One pass over the ROMs, the ones still alive are kept in the list in their original order.
+    @memdiag.traced_phase('dead ROMs')
     def _getDeadRoms(self, candidates: typing.List[ROMCandidateABC], roms: typing.List[api.ROMObj]) -> typing.List[api.ROMObj]:
         dead_roms = []
         num_roms = len(roms)
@@ -181,24 +271,27 @@ class RomFolderScanner(RomScannerStrategy):
             return dead_roms
         
         logger.info('Starting dead items scan')
-        i = 0
+        alive_roms = []
             
         self.progress_dialog.startProgress('Checking for dead ROMs ...', num_roms)
-        for rom in reversed(roms):
+        for i, rom in enumerate(roms):
             fileName = rom.get_scanned_data_element_as_file('file')
-            logger.info(f'Searching {fileName.getPath()}')
+            logger.debug(f'Searching {fileName.getPath()}')
             self.progress_dialog.updateProgress(i)
             
             if not fileName.exists():
                 logger.info(f'Not found. Marking as dead: {fileName.getPath()}')
-                roms.remove(rom)
                 dead_roms.append(rom)
-            i += 1
+            else:
+                alive_roms.append(rom)
+        roms[:] = alive_roms
             
         self.progress_dialog.endProgress()
+        self.found_dead_roms = dead_roms
         return dead_roms
 
     # ~~~ Now go processing item by item ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    @memdiag.traced_phase('new ROMs')
     def _processFoundItems(self,
                            candidates: typing.List[ROMCandidateABC],
                            roms: typing.List[api.ROMObj],
@@ -214,6 +307,11 @@ class RomFolderScanner(RomScannerStrategy):
         
         allowedExtensions = self.get_rom_extensions()
         scanner_multidisc = self.supports_multidisc()
+        m3u_mode = self.get_multidisc_m3u_mode() if scanner_multidisc else M3U_OFF
+        # Playlist path -> (disc file, disc info) of the set and the new ROM, if the set was not in the source yet
+        m3u_sets: typing.Dict[str, typing.List[typing.Tuple[io.FileName, MultiDiscInfo]]] = collections.OrderedDict()
+        m3u_roms: typing.Dict[str, api.ROMObj] = {}
+        known_paths = set(rom.get_scanned_data_element_as_file('file').getPath() for rom in roms)
 
         for candidate in sorted(candidates, key=lambda c: c.get_sort_value()):
             file_candidate: ROMFileCandidate = candidate
@@ -256,10 +354,19 @@ class RomFolderScanner(RomScannerStrategy):
                 logger.info('extension   "{0}"'.format(MDSet.extension))
                 logger.info('order       "{0}"'.format(MDSet.order))
                 launcher_report.write('  ROM belongs to a multidisc set.')
+
+                if m3u_mode != M3U_OFF:
+                    playlist_file = self._get_m3u_file(ROM_file, MDSet, m3u_mode)
+                    if playlist_file.getPath() in m3u_sets:
+                        m3u_sets[playlist_file.getPath()].append((ROM_file, MDSet))
+                        continue
+                    m3u_sets[playlist_file.getPath()] = [(ROM_file, MDSet)]
+                    file_candidate = ROMFileCandidate(playlist_file, {'m3u': playlist_file.getPath()})
+                    ROM_file = playlist_file
                 
                 # >> Check if the set is already in launcher ROMs.
                 MultiDisc_rom_id = None
-                for new_rom in new_roms:
+                for new_rom in new_roms if m3u_mode == M3U_OFF else []:
                     temp_FN = new_rom.get_scanned_data_element_as_file('file')
                     if temp_FN.getBase() == MDSet.setName:
                         MultiDiscInROMs = True
@@ -270,7 +377,9 @@ class RomFolderScanner(RomScannerStrategy):
 
                 # >> If the set is not in the ROMs then this ROM is the first of the set.
                 # >> Add the set
-                if not MultiDiscInROMs:
+                if m3u_mode != M3U_OFF:
+                    launcher_report.write(f'  Using playlist {ROM_file.getPath()}')
+                elif not MultiDiscInROMs:
                     logger.info('First ROM in the set. Adding to ROMs ...')
                     # >> Manipulate ROM so filename is the name of the set
                     ROM_dir = io.FileName(ROM_file.getDir())
@@ -295,13 +404,7 @@ class RomFolderScanner(RomScannerStrategy):
             # --- Check that ROM is not already in the list of ROMs ---
             # >> If file already in ROM list skip it
             self.progress_dialog.updateMessage('{}\nChecking if ROM is not already in source...'.format(file_text))
-            repeatedROM = False
-            for rom in roms:
-                rpath = rom.get_scanned_data_element_as_file('file')
-                if rpath == ROM_file:
-                    repeatedROM = True
-        
-            if repeatedROM:
+            if ROM_file.getPath() in known_paths:
                 launcher_report.write('  File already into ROM list. Skipping file.')
                 continue
             else:
@@ -320,6 +423,8 @@ class RomFolderScanner(RomScannerStrategy):
             # >> Database always stores the original (non transformed/manipulated) path
             new_rom = file_candidate.get_ROM()
             new_roms.append(new_rom)
+            if ROM_file.getPath() in m3u_sets:
+                m3u_roms[ROM_file.getPath()] = new_rom
             
             # ~~~ Check if user pressed the cancel button ~~~
             if self.progress_dialog.isCanceled():
@@ -330,5 +435,94 @@ class RomFolderScanner(RomScannerStrategy):
             
             num_items_checked += 1
            
+        for playlist_path, discs in m3u_sets.items():
+            self._write_m3u(io.FileName(playlist_path), discs, m3u_mode, m3u_roms.get(playlist_path), launcher_report)
+
+        self.found_new_roms = new_roms
+        if self.detect_moves:
+            self._reconcile_moves(new_roms, launcher_report)
+
         self.progress_dialog.endProgress()
         return new_roms
+
+    # --- Moved ROMs ---------------------------------------------------------------------------
+    # Dead and new ROMs with the same file identity are one ROM at another path. They are taken
+    # out of the dead and new ROMs, so the ROM is not deleted and added again.
+    def _reconcile_moves(self, new_roms: typing.List[api.ROMObj], launcher_report: report.Reporter):
+        if len(self.found_dead_roms) == 0 or len(new_roms) == 0:
+            return
+        dead = [(rom, rom.get_scanned_data_element(romidentity.IDENTITY_KEY)) for rom in self.found_dead_roms]
+        new = [(rom, rom.get_scanned_data_element(romidentity.IDENTITY_KEY)) for rom in new_roms]
+        moves = romidentity.match_moves([item for item in dead if item[1]], [item for item in new if item[1]])
+        if len(moves) == 0:
+            return
+        if not romidentity.supports_moves(self.webservice_host, self.webservice_port):
+            logger.info(f'{len(moves)} ROMs moved or renamed, removing and adding them again')
+            return
+
+        moved_dead = set(id(dead_rom) for dead_rom, _ in moves)
+        moved_new = set(id(new_rom) for _, new_rom in moves)
+        self.found_dead_roms[:] = [rom for rom in self.found_dead_roms if id(rom) not in moved_dead]
+        new_roms[:] = [rom for rom in new_roms if id(rom) not in moved_new]
+        for dead_rom, new_rom in moves:
+            launcher_report.write('  Moved {} to {}'.format(
+                dead_rom.get_scanned_data_element('file'), new_rom.get_scanned_data_element('file')))
+        logger.info(f'{len(moves)} ROMs moved or renamed')
+        self.moved_roms = moves
+
+    def amount_of_moved_roms(self) -> int:
+        return len(self.moved_roms)
+
+    def store_moved_roms(self) -> int:
+        """
+        Updates the paths of the moved ROMs in the source and returns how many were updated.
+        When the webserver cannot update paths, the moved ROMs go back to the dead and new ROMs,
+        to be deleted and added again.
+        """
+        moved_roms = self.moved_roms
+        self.moved_roms = []
+        if len(moved_roms) == 0:
+            return 0
+        roms = [(dead_rom.get_id(), new_rom.get_scanned_data()) for dead_rom, new_rom in moved_roms]
+        try:
+            romidentity.post_moved_roms(self.webservice_host, self.webservice_port, self.source_id, roms)
+            return len(moved_roms)
+        except (romidentity.MovesNotSupported, OSError) as ex:
+            logger.warning(f'Could not update the paths of moved ROMs ({ex}), removing and adding them instead')
+            self.found_dead_roms.extend(dead_rom for dead_rom, _ in moved_roms)
+            self.found_new_roms.extend(new_rom for _, new_rom in moved_roms)
+            return 0
+
+    # --- Multidisc playlists ------------------------------------------------------------------
+    def _get_m3u_file(self, ROM_file: io.FileName, MDSet: MultiDiscInfo, m3u_mode: str) -> io.FileName:
+        playlist_name = io.FileName(MDSet.setName).getBaseNoExt() + '.m3u'
+        if m3u_mode == M3U_IN_SOURCE:
+            return io.FileName(ROM_file.getDir()).pjoin(playlist_name)
+        # One cache folder per ROM folder, so equally named sets in different folders don't clash
+        folder_key = hashlib.sha1(ROM_file.getDir().encode('utf-8')).hexdigest()[:12]
+        return kodi.getAddonDir().pjoin('cache', isdir=True).pjoin('m3u', isdir=True)\
+            .pjoin(folder_key, isdir=True).pjoin(playlist_name)
+
+    def _write_m3u(self, playlist_file: io.FileName, discs: typing.List[typing.Tuple[io.FileName, MultiDiscInfo]],
+                   m3u_mode: str, new_rom: typing.Optional[api.ROMObj], launcher_report: report.Reporter):
+        disc_files = [disc_file for disc_file, MDSet in sorted(discs, key=lambda disc: disc[1].order)]
+        if m3u_mode == M3U_IN_SOURCE:
+            lines = [disc_file.getBase() for disc_file in disc_files]
+        else:
+            lines = [disc_file.getPath() for disc_file in disc_files]
+        content = '\n'.join(lines) + '\n'
+
+        # Only rewritten when the disc list changed, so rescans leave the playlists alone
+        if playlist_file.exists() and playlist_file.loadFileToStr() == content:
+            return
+        try:
+            playlist_dir = io.FileName(playlist_file.getDir(), isdir=True)
+            if not playlist_dir.exists():
+                playlist_dir.makedirs()
+            playlist_file.saveStrToFile(content)
+            launcher_report.write(f'Wrote playlist {playlist_file.getPath()} with {len(lines)} discs')
+        except Exception as ex:
+            logger.error(f'Cannot write playlist "{playlist_file.getPath()}"', exc_info=ex)
+            launcher_report.write(f'Cannot write playlist {playlist_file.getPath()}, using the first disc')
+            if new_rom is not None:
+                new_rom.set_scanned_data(ROMFileCandidate(disc_files[0], {'m3u': None}).get_scanned_data())
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Background rescans of sources while Kodi is idle
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import sys
+import json
+import time
+import ctypes
+import platform
+import threading
+import subprocess
+import typing
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FILE_NAME = 'scheduler.json'
+HOUR = 3600
+# How often the scheduler looks for sources to rescan, in seconds
+CHECK_INTERVAL = 60
+# How often a paused scan checks whether it may go on, in seconds
+PAUSE_POLL_INTERVAL = 1.0
+# Playback and user activity are checked at most this often while a scan runs, in seconds
+BLOCKED_CHECK_INTERVAL = 0.25
+
+NICENESS = 19
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+# ioprio_set is not in the C library, the syscall numbers per architecture
+IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251, 'amd64': 251, 'i386': 289, 'i686': 289,
+    'aarch64': 30, 'arm64': 30, 'riscv64': 30,
+    'armv6l': 314, 'armv7l': 314, 'armv8l': 314,
+    'ppc64le': 273, 'ppc64': 273
+}
+
+
+# ------------------------------------------------------------------------------------------------
+# Lowers the CPU and I/O priority of the calling thread only. Linux schedules threads as tasks
+# of their own, so setpriority and ioprio_set with the thread id leave the rest of Kodi alone.
+# Elsewhere the priority is a property of the whole process, which is Kodi, so nothing changes.
+# ------------------------------------------------------------------------------------------------
+def lower_thread_priority(niceness: int = NICENESS) -> typing.List[str]:
+    """Returns what was lowered, for the log."""
+    if not sys.platform.startswith('linux'):
+        return []
+    lowered = []
+    thread_id = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, thread_id, niceness)
+        lowered.append(f'nice {niceness}')
+    except (OSError, AttributeError) as ex:
+        logger.debug(f'Cannot lower the CPU priority: {ex}')
+    if _set_idle_io_priority(thread_id):
+        lowered.append('idle I/O')
+    return lowered
+
+
+def _set_idle_io_priority(thread_id: int) -> bool:
+    ioprio = IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT
+    syscall_number = IOPRIO_SET_SYSCALLS.get(platform.machine().lower())
+    if syscall_number is not None:
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, thread_id, ioprio) == 0:
+                return True
+            logger.debug(f'ioprio_set failed with errno {ctypes.get_errno()}')
+        except (OSError, AttributeError) as ex:
+            logger.debug(f'Cannot call ioprio_set: {ex}')
+    try:
+        subprocess.run(['ionice', '-c', str(IOPRIO_CLASS_IDLE), '-p', str(thread_id)],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=5)
+        return True
+    except (OSError, subprocess.SubprocessError) as ex:
+        logger.debug(f'Cannot run ionice: {ex}')
+        return False
+
+
+# ------------------------------------------------------------------------------------------------
+# Schedules and run statistics per source, kept in the addon directory so they survive Kodi
+# restarts. Sources are added when a scanner is configured or a source is scanned. The plugin
+# invocations and the service both write the file, so every change is a read, modify and
+# replace under a lock file.
+# A source is rescanned every interval_hours, its own value or the scheduler setting when
+# it has none. An interval of 0 or less leaves the source out.
+# ------------------------------------------------------------------------------------------------
+class ScheduleStore(object):
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def get_sources(self) -> typing.Dict[str, dict]:
+        return self._read().get('sources', {})
+
+    def register(self, source_id: str, host: str, port: int, **values):
+        """Adds the source, or updates where its webserver is and the given values."""
+        def change(sources):
+            source = sources.setdefault(source_id, {'registered': time.time()})
+            source['host'] = host
+            source['port'] = port
+            source.update(values)
+        self._update(change)
+
+    def update(self, source_id: str, **values):
+        """Updates the given values of a source that is in the schedule already."""
+        def change(sources):
+            if source_id in sources:
+                sources[source_id].update(values)
+        self._update(change)
+
+    def record_scan(self, source_id: str, started: float, duration: float, roms_added: int, roms_removed: int):
+        def change(sources):
+            source = sources.get(source_id)
+            if source is None:
+                return
+            source['last_scan'] = started
+            source['last_duration'] = round(duration, 3)
+            source['last_result'] = 'ok'
+            source['last_roms_added'] = roms_added
+            source['last_roms_removed'] = roms_removed
+            source['scans'] = source.get('scans', 0) + 1
+        self._update(change)
+
+    def record_attempt(self, source_id: str, started: float):
+        def change(sources):
+            if source_id in sources:
+                sources[source_id]['last_attempt'] = started
+        self._update(change)
+
+    def record_failure(self, source_id: str, error: str):
+        def change(sources):
+            source = sources.get(source_id)
+            if source is None:
+                return
+            source['last_result'] = error
+            source['failures'] = source.get('failures', 0) + 1
+        self._update(change)
+
+    def get_due(self, now: float, default_interval_hours: float) -> typing.List[typing.Tuple[str, dict]]:
+        """(source id, source) of the sources due for a rescan, the longest overdue first."""
+        due = []
+        for source_id, source in self.get_sources().items():
+            interval = source.get('interval_hours')
+            interval = default_interval_hours if interval is None else interval
+            if interval <= 0:
+                continue
+            # Failed attempts count as runs, so a broken source is not retried every minute
+            last_run = max(source.get('last_scan', 0), source.get('last_attempt', 0))
+            if now - last_run >= interval * HOUR:
+                due.append((last_run, source_id, source))
+        due.sort(key=lambda item: item[0])
+        return [(source_id, source) for _, source_id, source in due]
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') == ScheduleStore.VERSION:
+                return data
+        except (OSError, ValueError) as ex:
+            logger.debug(f'Starting a new schedule: {ex}')
+        return {'version': ScheduleStore.VERSION, 'sources': {}}
+
+    def _update(self, change: typing.Callable[[typing.Dict[str, dict]], None]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                data = self._read()
+                change(data['sources'])
+                temp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+                with open(temp_path, 'w', encoding='utf-8') as file:
+                    json.dump(data, file, indent=1)
+                os.replace(temp_path, self.path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+# ------------------------------------------------------------------------------------------------
+# Progress dialog of background scans. Shows nothing, but blocks the scan in every progress
+# update for as long as is_blocked says so, which is while something plays or the user is
+# active. The scanner and scraper update the progress for every file, so a scan stops right
+# away when playback starts and goes on where it was when Kodi is idle again.
+# ------------------------------------------------------------------------------------------------
+class PausingProgressDialog(object):
+
+    def __init__(self, is_blocked: typing.Callable[[], bool], is_stopping: typing.Callable[[], bool],
+                 poll_interval: float = PAUSE_POLL_INTERVAL):
+        self.is_blocked = is_blocked
+        self.is_stopping = is_stopping
+        self.poll_interval = poll_interval
+        self.checked_at = 0.0
+        self.paused_time = 0.0
+        self.steps = 0
+        self.step_index = 0
+
+    def wait_while_blocked(self):
+        now = time.monotonic()
+        if now - self.checked_at < BLOCKED_CHECK_INTERVAL:
+            return
+        self.checked_at = now
+        if not self.is_blocked():
+            return
+        logger.info('Background scan paused')
+        while self.is_blocked() and not self.is_stopping():
+            time.sleep(self.poll_interval)
+        self.checked_at = time.monotonic()
+        self.paused_time += self.checked_at - now
+        logger.info('Background scan continues' if not self.is_stopping() else 'Background scan stopped')
+
+    def startProgress(self, message: str, num_steps: int = 100):
+        self.wait_while_blocked()
+
+    def setSteps(self, steps: int):
+        self.steps = steps
+        self.step_index = 0
+
+    def incrementStep(self, message: str = None):
+        self.step_index += 1
+        self.wait_while_blocked()
+
+    def updateProgress(self, step_index: int, message: str = None):
+        self.step_index = step_index
+        self.wait_while_blocked()
+
+    def updateMessage(self, message: str):
+        self.wait_while_blocked()
+
+    def isCanceled(self) -> bool:
+        return self.is_stopping()
+
+    def close(self):
+        pass
+
+    def endProgress(self):
+        self.steps = 0
+
+    def reopen(self):
+        pass
+
+
+# ------------------------------------------------------------------------------------------------
+# Thread of the addon service that rescans due sources one after the other while Kodi is idle
+# and nothing plays. The thread runs with the lowest CPU and I/O priority. run_source does the
+# actual scan, and the scrape when the source asks for one. It gets the source id, the source
+# and the progress dialog to use. The lock is taken while a source runs, it is the lock of the
+# warm worker so background scans and commands never run at the same time.
+# ------------------------------------------------------------------------------------------------
+class BackgroundScheduler(object):
+
+    def __init__(self, store: ScheduleStore,
+                 run_source: typing.Callable[[str, dict, PausingProgressDialog], None],
+                 is_idle: typing.Callable[[], bool],
+                 is_playing: typing.Callable[[], bool],
+                 default_interval_hours: float,
+                 lock: threading.Lock = None,
+                 check_interval: float = CHECK_INTERVAL):
+        self.store = store
+        self.run_source = run_source
+        self.is_idle = is_idle
+        self.is_playing = is_playing
+        self.default_interval_hours = default_interval_hours
+        self.lock = lock if lock is not None else threading.Lock()
+        self.check_interval = check_interval
+        self.stopping = threading.Event()
+        self.thread: typing.Optional[threading.Thread] = None
+
+    def is_blocked(self) -> bool:
+        return self.is_playing() or not self.is_idle()
+
+    def start(self):
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name='AKLDefaultsScheduler', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self):
+        lowered = lower_thread_priority()
+        logger.info('Background scheduler started{}'.format(' ({})'.format(', '.join(lowered)) if lowered else ''))
+        while not self.stopping.wait(self.check_interval):
+            try:
+                self.run_due_sources()
+            except Exception as ex:
+                logger.error('Exception in background scheduler', exc_info=ex)
+
+    def run_due_sources(self) -> int:
+        """Runs the sources that are due while Kodi stays idle. Returns how many ran."""
+        ran = 0
+        for source_id, source in self.store.get_due(time.time(), self.default_interval_hours):
+            if self.stopping.is_set() or self.is_blocked():
+                break
+            if not self.lock.acquire(blocking=False):
+                logger.debug('Commands are running, background scan postponed')
+                break
+            try:
+                self._run_source(source_id, source)
+                ran += 1
+            finally:
+                self.lock.release()
+        return ran
+
+    def _run_source(self, source_id: str, source: dict):
+        logger.info(f'Background scan of source {source_id}')
+        self.store.record_attempt(source_id, time.time())
+        progress_dialog = PausingProgressDialog(self.is_blocked, self.stopping.is_set)
+        try:
+            self.run_source(source_id, source, progress_dialog)
+        except Exception as ex:
+            logger.error(f'Background scan of source {source_id} failed', exc_info=ex)
+            self.store.record_failure(source_id, str(ex) or type(ex).__name__)
+        if progress_dialog.paused_time > 0:
+            logger.info('Background scan of source {} was paused for {:.0f}s'.format(source_id, progress_dialog.paused_time))
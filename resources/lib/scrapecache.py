@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Scrape state cache
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import json
+import hashlib
+import collections
+import typing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 50000
+
+
+def file_signature(path: str) -> typing.Optional[typing.Tuple[int, int]]:
+    """(size, mtime in ns) of a file or directory, None when it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def settings_digest(values: dict) -> str:
+    """Digest of the settings a scrape ran with, values that are not JSON count by their str()."""
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def fingerprint(paths: typing.Iterable[str], signature_cache: typing.Dict[str, typing.Any] = None,
+                refresh: bool = False, salt: str = '') -> str:
+    """
+    Digest over the signatures of all given paths. Missing files count as well, so a sidecar
+    file that appears later changes the fingerprint. Paths shared by many ROMs, like asset
+    directories, can be memoized in signature_cache for the duration of a run. With refresh
+    the paths are read again and their memoized signatures replaced, for fingerprints taken
+    after the scrape itself wrote files. salt goes into the digest first, like the digest of
+    the scrape settings.
+    """
+    digest = hashlib.sha1(salt.encode('utf-8'))
+    for path in sorted(set(paths)):
+        if signature_cache is not None:
+            if refresh or path not in signature_cache:
+                signature_cache[path] = file_signature(path)
+            signature = signature_cache[path]
+        else:
+            signature = file_signature(path)
+        digest.update('{}\0{}\n'.format(path, signature).encode('utf-8'))
+    return digest.hexdigest()
+
+
+# ------------------------------------------------------------------------------------------------
+# Persistent ROM id -> fingerprint map of the last successful scrape.
+# Kept in LRU order and capped at max_entries, so ROMs of deleted sources age out.
+# ------------------------------------------------------------------------------------------------
+class ScrapeStateCache(object):
+
+    FILE_NAME = 'scrape_state.json'
+    VERSION = 1
+
+    def __init__(self, cache_dir: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.file_path = os.path.join(cache_dir, ScrapeStateCache.FILE_NAME)
+        self.max_entries = max_entries
+        self.entries: typing.OrderedDict[str, str] = collections.OrderedDict()
+        self.is_dirty = False
+
+    def load(self):
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            logger.debug(f'No usable scrape state in "{self.file_path}"')
+            return
+
+        if data.get('version') != ScrapeStateCache.VERSION:
+            logger.info('Scrape state has another version. Starting with an empty state.')
+            return
+        self.entries = collections.OrderedDict(data.get('entries', []))
+
+    def save(self):
+        if not self.is_dirty:
+            return
+
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        data = {'version': ScrapeStateCache.VERSION, 'entries': list(self.entries.items())}
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, separators=(',', ':'))
+        os.replace(temp_path, self.file_path)
+        self.is_dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_unchanged(self, rom_id: str, rom_fingerprint: str) -> bool:
+        if self.entries.get(rom_id) != rom_fingerprint:
+            return False
+        self.entries.move_to_end(rom_id)
+        self.is_dirty = True
+        return True
+
+    def update(self, rom_id: str, rom_fingerprint: str):
+        self.entries[rom_id] = rom_fingerprint
+        self.entries.move_to_end(rom_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.is_dirty = True
+
+    def forget(self, rom_id: str):
+        if self.entries.pop(rom_id, None) is not None:
+            self.is_dirty = True
@@ -18,14 +18,27 @@ from __future__ import unicode_literals
 from __future__ import division
 
 import logging
+import typing
 
 # --- AKL packages ---
 from akl import constants, settings
+from akl.utils import io, kodi
 from akl.scrapers import Scraper
 from akl.api import ROMObj
 
+# --- Local modules ---
+from resources.lib.assetindex import LocalAssetIndex
+from resources.lib.scrapecache import ScrapeStateCache, fingerprint, settings_digest
+from resources.lib.assetstore import AssetStore
+from resources.lib.assetplacement import AssetPlacementEngine
+from resources.lib.romheaders import RomHeaderReader
+
 logger = logging.getLogger(__name__)
 
+# Part of every ROM fingerprint. Raise it when a change of the scraper itself should scrape
+# ROMs again that did not change.
+SCRAPER_VERSION = 1
+
 
 # ------------------------------------------------------------------------------------------------
 # Local files scraper.
@@ -45,6 +58,20 @@ class LocalFilesScraper(Scraper):
     # --- Constructor ----------------------------------------------------------------------------
     def __init__(self):
         cache_dir = settings.getSettingAsFilePath('scraper_cache_dir')
+        if cache_dir is None or not cache_dir.getPath():
+            cache_dir = kodi.getAddonDir().pjoin('cache', isdir=True)
+        self.cache_dir = cache_dir
+        self.fuzzy_threshold = settings.getSettingAsInt('scraper_fuzzy_threshold') / 100.0
+        self.skip_unchanged = settings.getSettingAsBool('scraper_skip_unchanged')
+        self.place_assets_in_asset_paths = settings.getSettingAsBool('scraper_place_assets')
+        self.placement_engine = AssetPlacementEngine(max_workers=settings.getSettingAsInt('scraper_placement_workers'))
+        self.asset_store = None
+        if settings.getSettingAsBool('scraper_asset_store'):
+            self.asset_store = AssetStore(cache_dir.pjoin('assets', isdir=True).getPath(), self.placement_engine)
+            self.asset_store.load()
+        self.asset_indices: typing.Dict[str, LocalAssetIndex] = {}
+        self.path_signatures = {}
+        self.settings_digest = ''
         super(LocalFilesScraper, self).__init__(cache_dir)
 
     # --- Base class abstract methods ------------------------------------------------------------
@@ -89,3 +116,164 @@ class LocalFilesScraper(Scraper):
 
     def resolve_asset_URL_extension(self, selected_asset, image_url, status_dic):
         pass
+
+    # --- Local asset matching --------------------------------------------------------------------
+    #
+    # The scrape strategy only picks up assets named exactly like the ROM file. This fills the
+    # remaining empty assets with the closest match in the asset directory, so 'Sonic (USA).png'
+    # is used for 'Sonic (USA) (Rev 1).zip'. Returns the number of assets that were added.
+    #
+    def match_local_assets(self, rom: ROMObj, asset_ids: typing.List[str]) -> int:
+        rom_file = rom.get_scanned_data_element_as_file('file')
+        if rom_file is None:
+            return 0
+
+        assets = rom.entity_data.setdefault('assets', {})
+        asset_paths = rom.entity_data.get('asset_paths', {})
+        rom_stem = rom_file.getBaseNoExt()
+        num_matched = 0
+
+        for asset_id in asset_ids:
+            if assets.get(asset_id) or not asset_paths.get(asset_id):
+                continue
+
+            index = self._get_asset_index(asset_paths[asset_id])
+            match = index.find(rom_stem, fuzzy=self.fuzzy_threshold > 0)
+            if match is None:
+                continue
+
+            logger.debug(f'Matched local asset {asset_id} "{match}" for "{rom_stem}"')
+            assets[asset_id] = match
+            num_matched += 1
+
+        return num_matched
+
+    def _get_asset_index(self, asset_path: str) -> LocalAssetIndex:
+        # One index per asset directory, shared by all ROMs in this scraper run.
+        if asset_path in self.asset_indices:
+            return self.asset_indices[asset_path]
+
+        index = LocalAssetIndex(threshold=self.fuzzy_threshold)
+        asset_dir = io.FileName(asset_path, isdir=True)
+        if asset_dir.exists():
+            index.add_all(f.getPath() for f in asset_dir.scanFilesInPath('*.*'))
+        logger.debug(f'Indexed {len(index)} local assets in "{asset_path}"')
+
+        self.asset_indices[asset_path] = index
+        return index
+
+    #
+    # Uses the internal header of cartridge ROMs (title, region, publisher, checksum) for ROMs
+    # without an NFO sidecar. Only the title is applied as metadata and only when the ROM still
+    # has the name the scanner gave it. All header fields are kept in the scanned data.
+    #
+    def apply_rom_headers(self, roms: typing.List[ROMObj]) -> int:
+        rom_files = {}
+        for rom in roms:
+            rom_file = rom.get_scanned_data_element_as_file('file')
+            if rom_file is None or rom_file.changeExtension('.nfo').exists():
+                continue
+            rom_files[rom_file.getPath()] = (rom, rom_file)
+        if len(rom_files) == 0:
+            return 0
+
+        header_reader = RomHeaderReader(self.cache_dir.getPath(), settings.getSettingAsInt('scraper_header_workers'))
+        header_reader.load()
+        headers = header_reader.read_all(rom_files.keys())
+        header_reader.save()
+
+        num_applied = 0
+        for path, header in headers.items():
+            if header is None:
+                continue
+            rom, rom_file = rom_files[path]
+            rom.entity_data.setdefault('scanned_data', {})['header'] = header
+            if header.get('title') and rom.get_name() in (None, '', rom_file.getBaseNoExt()):
+                rom.set_name(header['title'])
+                num_applied += 1
+        return num_applied
+
+    #
+    # Places matched assets that are not named after the ROM in its asset path under the ROM name,
+    # e.g. 'snaps/Sonic (USA).png' -> 'snaps/Sonic (USA) (Rev 1).png'. All files of the run are
+    # placed in parallel.
+    #
+    def place_assets(self, roms: typing.List[ROMObj]):
+        if not self.place_assets_in_asset_paths:
+            return
+
+        placements = []
+        for rom in roms:
+            rom_file = rom.get_scanned_data_element_as_file('file')
+            if rom_file is None:
+                continue
+            assets = rom.entity_data.get('assets', {})
+            asset_paths = rom.entity_data.get('asset_paths', {})
+
+            for asset_id, asset_path in assets.items():
+                if not asset_path or not asset_paths.get(asset_id):
+                    continue
+                asset_file = io.FileName(asset_path)
+                target = io.FileName(asset_paths[asset_id], isdir=True).pjoin(rom_file.getBaseNoExt() + asset_file.getExt())
+                if target.getPath() != asset_file.getPath():
+                    placements.append((assets, asset_id, asset_file.getPath(), target.getPath()))
+
+        results = self.placement_engine.place_all((source, target) for _, _, source, target in placements)
+        for (assets, asset_id, _, _), result in zip(placements, results):
+            if result.is_placed():
+                assets[asset_id] = result.target
+
+        for line in self.placement_engine.get_summary():
+            logger.info(f'Asset placement: {line}')
+
+    #
+    # Moves the assets of this ROM into the content addressed store, so byte identical artwork
+    # of regional variants ends up as a single file the asset files link to. Asset paths are
+    # rewritten to the stored file.
+    #
+    def store_assets(self, rom: ROMObj):
+        if self.asset_store is None:
+            return
+
+        rom_id = rom.get_id()
+        assets = rom.entity_data.get('assets', {})
+        for asset_id, asset_path in assets.items():
+            if not asset_path:
+                continue
+            stored_path = self.asset_store.add(rom_id, asset_id, asset_path)
+            if stored_path is not None:
+                assets[asset_id] = stored_path
+
+    # --- Scrape state ----------------------------------------------------------------------------
+    def get_scrape_state_cache(self) -> ScrapeStateCache:
+        state_cache = ScrapeStateCache(self.cache_dir.getPath(), settings.getSettingAsInt('scraper_state_cache_size'))
+        state_cache.load()
+        return state_cache
+
+    #
+    # Fingerprint of everything a local scrape reads for this ROM: the ROM file, its NFO sidecar,
+    # the assigned assets and the asset directories (their mtime changes when files get added),
+    # and of how it scrapes: the scraper version and the settings given to set_scrape_settings().
+    # Fingerprints stored after the scrape use refresh, placing and storing assets has changed
+    # the signatures memoized before the scrape.
+    #
+    def get_rom_fingerprint(self, rom: ROMObj, refresh: bool = False) -> str:
+        paths = []
+        rom_file = rom.get_scanned_data_element_as_file('file')
+        if rom_file is not None:
+            paths.append(rom_file.getPath())
+            paths.append(rom_file.changeExtension('.nfo').getPath())
+        paths.extend(path for path in rom.entity_data.get('assets', {}).values() if path)
+        paths.extend(path for path in rom.entity_data.get('asset_paths', {}).values() if path)
+
+        return fingerprint(paths, self.path_signatures, refresh, self.settings_digest)
+
+    def set_scrape_settings(self, scraper_settings):
+        """Settings of this scrape, a change of any of them scrapes unchanged ROMs again."""
+        self.settings_digest = settings_digest({
+            'version': SCRAPER_VERSION,
+            'scraper_settings': vars(scraper_settings),
+            'fuzzy_threshold': self.fuzzy_threshold,
+            'place_assets': self.place_assets_in_asset_paths,
+            'asset_store': self.asset_store is not None
+        })
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Launch timeline
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import sys
+import json
+import glob
+import math
+import time
+import contextlib
+import collections
+import typing
+
+logger = logging.getLogger(__name__)
+
+FILE_EXTENSION = '.timeline.jsonl'
+
+PHASE_SETTINGS = 'settings'
+PHASE_WEBSERVER = 'webserver'
+PHASE_APPLICATION = 'application'
+PHASE_ARGUMENTS = 'arguments'
+PHASE_SUSPEND = 'suspend'
+PHASE_SPAWN = 'spawn'
+PHASE_RUN = 'run'
+PHASE_RETURN = 'return'
+
+
+# ------------------------------------------------------------------------------------------------
+# Durations of the phases of a single launch. measure() times a block, mark() closes the phase
+# that ran since the previous measurement or mark. Phases that run more than once add up, the
+# start of a phase is when it first began.
+# ------------------------------------------------------------------------------------------------
+class LaunchTimeline(object):
+
+    def __init__(self, launcher_id: str, rom_id: str):
+        self.launcher_id = launcher_id
+        self.rom_id = rom_id
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.phases: typing.OrderedDict[str, float] = collections.OrderedDict()
+        self.phase_starts: typing.Dict[str, float] = {}
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self._add(phase, self.last, now)
+        self.last = now
+
+    @contextlib.contextmanager
+    def measure(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last = time.perf_counter()
+            self._add(phase, start, self.last)
+
+    def get_spawn_start(self) -> typing.Optional[float]:
+        """perf_counter() when the application was started, None when it was not (yet)."""
+        return self.phase_starts.get(PHASE_SPAWN, self.phase_starts.get(PHASE_RUN))
+
+    def get_total(self) -> float:
+        return self.last - self.start
+
+    def get_startup_time(self) -> float:
+        """Time until the application was started, so without the time it ran."""
+        return sum(s for p, s in self.phases.items() if p not in (PHASE_RUN, PHASE_RETURN))
+
+    def to_dict(self) -> dict:
+        return {
+            'time': round(self.started_at, 3),
+            'launcher': self.launcher_id,
+            'rom': self.rom_id,
+            'total_ms': round(self.get_total() * 1000, 2),
+            'phases': collections.OrderedDict((p, round(s * 1000, 2)) for p, s in self.phases.items())
+        }
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(self.to_dict(), separators=(',', ':')) + '\n')
+
+    def __str__(self):
+        phases = ', '.join('{} {:.1f}ms'.format(p, s * 1000) for p, s in self.phases.items())
+        return 'Launch took {:.1f}ms: {}'.format(self.get_total() * 1000, phases)
+
+    def _add(self, phase: str, start: float, end: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + end - start
+        self.phase_starts.setdefault(phase, start)
+
+
+# --- Aggregation -------------------------------------------------------------------------------
+def percentile(values: typing.List[float], pct: float) -> float:
+    """Nearest rank percentile of an already sorted list."""
+    index = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def read_timelines(reports_dir: str) -> typing.Iterator[dict]:
+    for path in glob.glob(os.path.join(reports_dir, '*' + FILE_EXTENSION)):
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.debug(f'Skipping broken timeline line in "{path}"')
+
+
+def aggregate(timelines: typing.Iterable[dict]) -> typing.OrderedDict[str, typing.Tuple[int, float, float]]:
+    """Phase -> (launches, p50 ms, p95 ms), phases in order of first appearance and the total last."""
+    durations: typing.OrderedDict[str, typing.List[float]] = collections.OrderedDict()
+    totals = []
+    for timeline in timelines:
+        for phase, milliseconds in timeline.get('phases', {}).items():
+            durations.setdefault(phase, []).append(milliseconds)
+        totals.append(timeline.get('total_ms', 0.0))
+    durations['total'] = totals
+
+    stats = collections.OrderedDict()
+    for phase, values in durations.items():
+        if len(values) == 0:
+            continue
+        values.sort()
+        stats[phase] = (len(values), percentile(values, 50), percentile(values, 95))
+    return stats
+
+
+def format_stats(stats: typing.Dict[str, typing.Tuple[int, float, float]]) -> str:
+    if len(stats) == 0:
+        return 'No launches recorded yet.'
+    lines = ['{:<12} {:>8} {:>10} {:>10}'.format('phase', 'launches', 'p50 ms', 'p95 ms')]
+    for phase, (count, p50, p95) in stats.items():
+        lines.append('{:<12} {:>8} {:>10.1f} {:>10.1f}'.format(phase, count, p50, p95))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    # Usage: python -m resources.lib.timeline <reports directory>
+    print(format_stats(aggregate(read_timelines(sys.argv[1] if len(sys.argv) > 1 else '.'))))
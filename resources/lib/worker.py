@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#
+# Advanced Kodi Launcher: Warm worker for the plugin commands
+#
+# Copyright (c) Chrisism <crizizz@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import os
+import json
+import stat as stat_module
+import socket
+import tempfile
+import threading
+import typing
+
+logger = logging.getLogger(__name__)
+
+SOCKET_DIR = 'worker'
+SOCKET_NAME = 'worker.sock'
+# sockaddr_un has room for 108 bytes on Linux, 104 on macOS
+MAX_SOCKET_PATH = 100
+CONNECT_TIMEOUT = 0.5
+
+STATUS_ACCEPTED = 'accepted'
+STATUS_BUSY = 'busy'
+STATUS_ERROR = 'error'
+
+
+def is_supported() -> bool:
+    return hasattr(socket, 'AF_UNIX')
+
+
+def get_socket_path(profile_dir: str) -> str:
+    """
+    The socket lies in a directory only the user can enter, so other local users can neither
+    connect to it nor put a socket of their own in its place. Too long paths for a socket fall
+    back to such a directory in the temp directory.
+    """
+    path = os.path.join(profile_dir, SOCKET_DIR, SOCKET_NAME)
+    if len(path.encode('utf-8')) <= MAX_SOCKET_PATH:
+        return path
+    return os.path.join(tempfile.gettempdir(), 'script.akl.defaults-{}'.format(os.getuid()), SOCKET_NAME)
+
+
+def is_private_dir(path: str) -> bool:
+    """True for a real directory of the current user that nobody else can access."""
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        return False
+    is_shared = stat.st_mode & (stat_module.S_IRWXG | stat_module.S_IRWXO) != 0
+    return stat_module.S_ISDIR(stat.st_mode) and stat.st_uid == os.getuid() and not is_shared
+
+
+def create_private_dir(path: str):
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    if not is_private_dir(path):
+        raise PermissionError(f'Worker socket directory "{path}" is accessible by other users')
+
+
+def _send_message(connection: socket.socket, message: dict):
+    connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def _read_message(connection: socket.socket) -> typing.Optional[dict]:
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = connection.recv(4096)
+        if not chunk:
+            return None
+        data += chunk
+    return json.loads(data.decode('utf-8'))
+
+
+def submit(socket_path: str, argv: typing.List[str]) -> bool:
+    """
+    Hands the command to the worker. Returns False when there is no worker or it is busy,
+    the caller then runs the command itself.
+    """
+    if not is_supported() or not os.path.exists(socket_path):
+        return False
+    if not is_private_dir(os.path.dirname(socket_path)):
+        logger.warning(f'Not using the worker, "{os.path.dirname(socket_path)}" is accessible by other users')
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(CONNECT_TIMEOUT)
+            connection.connect(socket_path)
+            _send_message(connection, {'argv': argv})
+            reply = _read_message(connection)
+    except (OSError, ValueError) as ex:
+        logger.debug(f'Worker not available: {ex}')
+        return False
+
+    status = reply.get('status') if reply else None
+    if status != STATUS_ACCEPTED:
+        logger.debug(f'Worker did not accept the command ({status})')
+        return False
+    return True
+
+
+# ------------------------------------------------------------------------------------------------
+# Runs in the addon service, where the AKL modules stay imported. Takes one command at a time:
+# the command is parsed and then accepted, so the plugin invocation can end while the worker runs
+# it. While a command runs, others are refused and run by the plugin invocation itself. The lock
+# can be shared with everything else in the service that must not run next to a command.
+# ------------------------------------------------------------------------------------------------
+class WorkerServer(object):
+
+    def __init__(self, socket_path: str, parse_command: typing.Callable[[typing.List[str]], typing.Any],
+                 run_command: typing.Callable[[typing.Any], None], lock: threading.Lock = None):
+        self.socket_path = socket_path
+        self.parse_command = parse_command
+        self.run_command = run_command
+        self.busy = lock if lock is not None else threading.Lock()
+        self.server_socket: typing.Optional[socket.socket] = None
+        self.thread: typing.Optional[threading.Thread] = None
+        self.is_stopping = False
+
+    def start(self):
+        create_private_dir(os.path.dirname(self.socket_path))
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self.server_socket.listen(4)
+        self.is_stopping = False
+        self.thread = threading.Thread(target=self._serve, name='AKLDefaultsWorker', daemon=True)
+        self.thread.start()
+        logger.info(f'Worker listening on "{self.socket_path}"')
+
+    def stop(self):
+        self.is_stopping = True
+        if self.server_socket is not None:
+            try:
+                # Wakes up the accept() of the serving thread
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server_socket.close()
+            self.server_socket = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        if self.thread is not None:
+            self.thread.join(2)
+
+    def _serve(self):
+        while not self.is_stopping:
+            try:
+                connection, _ = self.server_socket.accept()
+            except OSError:
+                # Socket closed by stop()
+                break
+            with connection:
+                self._handle(connection)
+
+    def _handle(self, connection: socket.socket):
+        is_acquired = False
+        try:
+            connection.settimeout(CONNECT_TIMEOUT)
+            message = _read_message(connection)
+            if message is None:
+                return
+            is_acquired = self.busy.acquire(blocking=False)
+            if not is_acquired:
+                _send_message(connection, {'status': STATUS_BUSY})
+                return
+            command = self.parse_command(message['argv'])
+            _send_message(connection, {'status': STATUS_ACCEPTED})
+        except (Exception, SystemExit) as ex:
+            # argparse exits on arguments it cannot parse
+            logger.debug('Worker did not take the command', exc_info=ex)
+            if is_acquired:
+                self.busy.release()
+            try:
+                _send_message(connection, {'status': STATUS_ERROR})
+            except OSError:
+                pass
+            return
+
+        threading.Thread(target=self._run, args=(command,), name='AKLDefaultsCommand', daemon=True).start()
+
+    def _run(self, command):
+        try:
+            self.run_command(command)
+        except Exception as ex:
+            logger.error('Exception in worker command', exc_info=ex)
+        finally:
+            self.busy.release()
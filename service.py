@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Default plugins for AKL
+# Service keeping a warm worker for the plugin commands and rescanning sources while Kodi is idle
+#
+# --- Python standard library ---
+from __future__ import unicode_literals
+from __future__ import division
+
+import logging
+import importlib
+import threading
+
+# --- Kodi stuff ---
+import xbmc
+
+# AKL main imports
+from akl import settings
+from akl.utils import kodilogging, kodi
+
+from resources.lib import worker, commands, scheduler
+
+kodilogging.config()
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------------------------
+# Keeps the worker and the background scheduler running while they are enabled. Both are
+# restarted when the settings change, after reloading the settings module so commands see
+# the new values. Commands patch process wide state (akl.api calls, the urllib opener,
+# tracemalloc), so the worker, the scheduler and the settings reload share one lock and
+# never run at the same time.
+# ---------------------------------------------------------------------------------------------
+class WorkerService(xbmc.Monitor):
+
+    def __init__(self):
+        super(WorkerService, self).__init__()
+        self.command_lock = threading.Lock()
+        self.server = None
+        self.scheduler = None
+        self.player = xbmc.Player()
+        self.idle_seconds = 0
+
+    def onSettingsChanged(self):
+        self.stop_scheduler()
+        self.stop_worker()
+        # Waits for a command the worker still runs
+        with self.command_lock:
+            importlib.reload(settings)
+        self.start_worker()
+        self.start_scheduler()
+
+    def start_worker(self):
+        if not settings.getSettingAsBool('use_worker') or not worker.is_supported():
+            return
+        commands.warm_up()
+        socket_path = worker.get_socket_path(kodi.getAddonDir().getPath())
+        self.server = worker.WorkerServer(socket_path, commands.parse_arguments, commands.run_command,
+                                          lock=self.command_lock)
+        try:
+            self.server.start()
+        except OSError as ex:
+            logger.error('Cannot start the worker', exc_info=ex)
+            self.server = None
+
+    def stop_worker(self):
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+
+    def start_scheduler(self):
+        if not settings.getSettingAsBool('scheduler_enabled'):
+            return
+        self.idle_seconds = settings.getSettingAsInt('scheduler_idle_minutes') * 60
+        self.scheduler = scheduler.BackgroundScheduler(
+            commands.get_schedule_store(),
+            commands.run_scheduled_source,
+            self.is_idle,
+            self.player.isPlaying,
+            settings.getSettingAsInt('scheduler_interval_hours'),
+            # Background scans wait for commands in the worker and the other way around
+            lock=self.command_lock)
+        self.scheduler.start()
+
+    def stop_scheduler(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+
+    def is_idle(self) -> bool:
+        return xbmc.getGlobalIdleTime() >= self.idle_seconds and not self.abortRequested()
+
+    def run(self):
+        self.start_worker()
+        self.start_scheduler()
+        while not self.abortRequested():
+            if self.waitForAbort(60):
+                break
+        self.stop_scheduler()
+        self.stop_worker()
+
+
+# ---------------------------------------------------------------------------------------------
+# RUN
+# ---------------------------------------------------------------------------------------------
+try:
+    WorkerService().run()
+except Exception as ex:
+    logger.fatal('Exception in service', exc_info=ex)
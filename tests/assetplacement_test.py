@@ -0,0 +1,81 @@
+import unittest, os
+import tempfile
+import shutil
+from unittest.mock import patch
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib import assetplacement
+from resources.lib.assetplacement import AssetPlacementEngine
+
+class Test_assetplacement(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.sources = []
+        for i in range(8):
+            path = os.path.join(self.test_dir, 'fanart', 'game{}.jpg'.format(i))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(os.urandom(64 * 1024))
+            self.sources.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _targets(self):
+        return [(source, source.replace('fanart', 'placed')) for source in self.sources]
+
+    def test_files_on_the_same_filesystem_are_hard_linked(self):
+        # arrange
+        target = AssetPlacementEngine(max_workers=4)
+
+        # act
+        results = target.place_all(self._targets())
+
+        # assert
+        for result in results:
+            self.assertEqual(assetplacement.METHOD_HARDLINK, result.method)
+            self.assertTrue(os.path.samefile(result.source, result.target))
+        logger.info(target.get_summary())
+
+    def test_when_no_zero_copy_method_works_it_falls_back_to_a_buffered_copy(self):
+        # arrange
+        unsupported = OSError(18, 'Invalid cross-device link')
+        target = AssetPlacementEngine(max_workers=4, allow_hardlink=False)
+
+        # act
+        with patch.dict(assetplacement.PLACEMENT_METHODS, {
+                assetplacement.METHOD_REFLINK: unittest.mock.Mock(side_effect=unsupported),
+                assetplacement.METHOD_COPY_FILE_RANGE: unittest.mock.Mock(side_effect=unsupported),
+                assetplacement.METHOD_SENDFILE: unittest.mock.Mock(side_effect=unsupported)}):
+            results = target.place_all(self._targets())
+
+        # assert
+        for result in results:
+            self.assertEqual(assetplacement.METHOD_BUFFERED, result.method)
+            with open(result.source, 'rb') as source, open(result.target, 'rb') as placed:
+                self.assertEqual(source.read(), placed.read())
+        self.assertIn('buffered: 8 files', target.get_summary()[0])
+
+    def test_an_in_kernel_copy_ending_early_is_not_reported_as_placed(self):
+        # arrange
+        source, placed = self._targets()[0]
+        target = AssetPlacementEngine(max_workers=1, allow_hardlink=False)
+        target.methods = [assetplacement.METHOD_COPY_FILE_RANGE, assetplacement.METHOD_BUFFERED]
+
+        # act
+        with patch.object(assetplacement.os, 'copy_file_range', return_value=0, create=True):
+            result = target.place(source, placed)
+
+        # assert
+        self.assertEqual(assetplacement.METHOD_BUFFERED, result.method)
+        with open(source, 'rb') as source_file, open(placed, 'rb') as placed_file:
+            self.assertEqual(source_file.read(), placed_file.read())
+
+if __name__ == '__main__':
+    unittest.main()
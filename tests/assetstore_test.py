@@ -0,0 +1,95 @@
+import unittest, os
+import tempfile
+import shutil
+import stat
+from unittest.mock import patch
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.assetstore import AssetStore
+
+class Test_assetstore(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.test_dir, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write_asset(self, name: str, content: bytes) -> str:
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_identical_assets_of_different_roms_are_stored_once(self):
+        # arrange
+        usa_boxfront = self._write_asset('Sonic (USA).png', b'x' * 1000)
+        eur_boxfront = self._write_asset('Sonic (Europe).png', b'x' * 1000)
+        target = AssetStore(self.store_dir)
+
+        # act
+        usa_stored = target.add('1', 'boxfront', usa_boxfront)
+        eur_stored = target.add('2', 'boxfront', eur_boxfront)
+
+        # assert
+        self.assertEqual(usa_stored, eur_stored)
+        self.assertEqual(target.get_digest('1', 'boxfront'), target.get_digest('2', 'boxfront'))
+        self.assertEqual(1, target.stats.assets_deduplicated)
+        self.assertEqual(1000, target.stats.bytes_freed)
+        self.assertEqual(1000, target.stats.bytes_stored)
+        with open(eur_boxfront, 'rb') as f:
+            self.assertEqual(b'x' * 1000, f.read())
+
+    def test_the_stored_file_is_read_only_and_not_the_inode_of_the_first_source(self):
+        # arrange
+        boxfront = self._write_asset('Sonic.png', b'x' * 1000)
+        original_inode = os.stat(boxfront).st_ino
+        target = AssetStore(self.store_dir)
+
+        # act
+        stored = target.add('1', 'boxfront', boxfront)
+
+        # assert
+        self.assertNotEqual(original_inode, os.stat(stored).st_ino)
+        self.assertEqual(0, os.stat(stored).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+    def test_assets_on_another_filesystem_are_not_stored(self):
+        # arrange
+        boxfront = self._write_asset('Sonic.png', b'x' * 1000)
+        target = AssetStore(self.store_dir)
+
+        # act
+        with patch.object(AssetStore, '_is_on_store_device', return_value=False):
+            actual = target.add('1', 'boxfront', boxfront)
+
+        # assert
+        self.assertIsNone(actual)
+        self.assertEqual(1, target.stats.assets_not_stored)
+        self.assertEqual(0, target.stats.bytes_stored)
+
+    def test_unchanged_assets_are_not_hashed_again_in_the_next_run(self):
+        # arrange
+        snap = self._write_asset('pitfall.png', b'snap')
+        first_run = AssetStore(self.store_dir)
+        first_run.add('1', 'snap', snap)
+        first_run.save()
+
+        target = AssetStore(self.store_dir)
+        target.load()
+
+        # act
+        actual = target.add('1', 'snap', snap)
+
+        # assert
+        self.assertTrue(os.path.exists(actual))
+        self.assertEqual(0, target.stats.assets_hashed)
+        self.assertEqual(0, target.stats.bytes_freed)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# Bytes on the wire and wall time of a bulk ROM store with plain, gzipped and compact JSON bodies.
+#
+# A local http.server stands in for the AKL webserver. It takes gzipped bodies, decompresses
+# and parses them like the store would. The ROMs have the fields AKL sends for freshly scanned
+# ROMs, which are mostly empty defaults. Loopback has no bandwidth limit to speak of, so the
+# stand-in also holds every request for as long as the body would take on the given link speed.
+# The default of 20 Mbit/s is a Kodi box on a busy Wi-Fi network.
+#
+# Usage: python -m tests.benchmarks.compression_bench [roms] [link Mbit/s]
+import sys
+import json
+import gzip
+import threading
+import time
+import urllib.request
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from resources.lib.httpclient import KeepAliveHandler
+
+LINK_MBIT = 20.0
+
+
+def create_rom(i):
+    return {
+        'id': '{:032x}'.format(i), 'm_name': f'Game {i}', 'm_year': None, 'm_genre': '', 'm_developer': '',
+        'm_nplayers': None, 'm_esrb': '', 'm_rating': None, 'm_plot': '', 'platform': 'Nintendo SNES',
+        'box_size': '', 'm_tags': [], 'extra': {}, 'launch_count': 0, 'last_launch_timestamp': None,
+        'rom_status': 'OK', 'finished': False, 'nointro_status': None, 'pclone_status': None,
+        'cloneof': '', 'assets': {'boxfront': '', 'boxback': '', 'cartridge': '', 'fanart': '',
+                                  'snap': '', 'title': '', 'clearlogo': '', 'manual': '', 'trailer': ''},
+        'asset_paths': {}, 'scanned_by_id': 'a' * 32,
+        'scanned_data': {'file': f'/storage/roms/snes/Game {i} (USA).zip'}
+    }
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(len(body) * 8 / (self.server.link_mbit * 1000 * 1000))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        roms = json.loads(body)
+        reply = json.dumps({'stored': len(roms)}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def store(url, body, compress, compact_json):
+    handler = KeepAliveHandler()
+    handler.compress_bodies = compress
+    handler.compact_json = compact_json
+    opener = urllib.request.build_opener(handler)
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    with opener.open(request) as response:
+        response.read()
+    elapsed = time.perf_counter() - start
+    handler.close()
+    return handler.bytes_sent, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    link_mbit = float(sys.argv[2]) if len(sys.argv) > 2 else LINK_MBIT
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.link_mbit = link_mbit
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/store/roms/'.format(server.server_address[1])
+
+    body = json.dumps([create_rom(i) for i in range(count)]).encode('utf-8')
+    print(f'{count} ROMs, {link_mbit:.0f} Mbit/s link')
+    for name, compress, compact_json in [('plain', False, False),
+                                         ('gzip', True, False),
+                                         ('compact', False, True),
+                                         ('compact + gzip', True, True)]:
+        sent, elapsed = store(url, body, compress, compact_json)
+        print('{:<15} {:>10} bytes {:>6.1f}% {:>9.1f}ms'.format(name, sent, sent * 100 / len(body), elapsed * 1000))
+
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# Round trip time of webserver calls with a new connection per call and with the pooled
+# keep-alive connections of resources.lib.httpclient.
+#
+# A local http.server stands in for the AKL webserver and answers every call with a small JSON
+# document, about the size of a ROM. The stand-in speaks HTTP/1.1 like the Kodi webserver does.
+# The handler is the same in both runs, so the difference is connection setup only. Against a
+# webserver on another host the savings grow with the network latency.
+#
+# Usage: python -m tests.benchmarks.http_bench [calls]
+import sys
+import json
+import threading
+import time
+import urllib.request
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from resources.lib.httpclient import KeepAliveHandler
+
+ROM = json.dumps({'id': '0' * 32, 'm_name': 'Pitfall', 'scanned_data': {'file': '/roms/pitfall.zip'}}).encode('utf-8')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(ROM)))
+        self.end_headers()
+        self.wfile.write(ROM)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def time_calls(opener, url, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        with opener.open(f'{url}?id={i}') as response:
+            response.read()
+    return time.perf_counter() - start
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/query/rom/'.format(server.server_address[1])
+
+    default_opener = urllib.request.build_opener()
+    handler = KeepAliveHandler()
+    pooled_opener = urllib.request.build_opener(handler)
+    # Warm up both paths once
+    time_calls(default_opener, url, 10)
+    time_calls(pooled_opener, url, 10)
+
+    per_call = time_calls(default_opener, url, calls)
+    pooled = time_calls(pooled_opener, url, calls)
+    print(f'{calls} calls')
+    print('connection per call: {:.1f}ms, {:.3f}ms per call'.format(per_call * 1000, per_call * 1000 / calls))
+    print('keep-alive pool:     {:.1f}ms, {:.3f}ms per call'.format(pooled * 1000, pooled * 1000 / calls))
+    print('saved {:.1f}% ({})'.format((1 - pooled / per_call) * 100, handler.get_summary()))
+
+    handler.close()
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Cost of the metrics compared to the local work of a ROM scan.
+#
+# The scan here does what the folder scanner does on its own side for every file: walk and stat,
+# match the extension and the multidisc pattern, write a report line and build the ROM, and
+# at the end serialize the ROMs for the store call. The webserver round trips of a real scan
+# are left out, so the real share of the metrics is lower still. The metrics part is what
+# scan_for_roms adds: the scan metrics plus the command duration, merged into an exposition
+# file that already holds the series of many other sources.
+#
+# Usage: python -m tests.benchmarks.metrics_bench [files] [sources in file]
+import os
+import re
+import sys
+import json
+import shutil
+import statistics
+import tempfile
+import time
+
+from resources.lib.metrics import MetricsRegistry
+
+RUNS = 10
+
+
+def create_folder(root, files):
+    for i in range(files):
+        with open(os.path.join(root, 'Game {} (USA).zip'.format(i)), 'wb') as file:
+            file.write(b'PK')
+
+
+MULTIDISC_RE = re.compile(r'\(Dis[ck] ([0-9]+) of ([0-9]+)\)', re.IGNORECASE)
+
+
+def scan(root, report_path):
+    roms = []
+    with open(report_path, 'w', encoding='utf-8') as report:
+        for directory, _, file_names in os.walk(root):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                os.stat(path)
+                report.write('>>> {}\n'.format(path))
+                base, extension = os.path.splitext(file_name)
+                if extension.lower() != '.zip':
+                    report.write('  File has not an expected extension. Skipping file.\n')
+                    continue
+                MULTIDISC_RE.search(base)
+                report.write('  File not in ROM list. Processing it ...\n')
+                roms.append({'id': '{:032x}'.format(len(roms)), 'm_name': base, 'assets': {}, 'asset_paths': {},
+                             'scanned_data': {'file': path}})
+    json.dumps(roms)
+    return len(roms)
+
+
+def record_scan(path, source_id, files, seconds):
+    registry = MetricsRegistry()
+    registry.histogram('akl_defaults_command_duration_seconds').observe(seconds, command='SCAN')
+    registry.histogram('akl_defaults_scan_duration_seconds').observe(seconds, source=source_id)
+    registry.counter('akl_defaults_scan_files_total').inc(files, source=source_id)
+    registry.gauge('akl_defaults_scan_files_per_second').set(files / seconds, source=source_id)
+    registry.counter('akl_defaults_scan_roms_added_total').inc(files, source=source_id)
+    registry.counter('akl_defaults_scan_roms_removed_total').inc(0, source=source_id)
+    registry.gauge('akl_defaults_scan_last_success_timestamp_seconds').set(time.time(), source=source_id)
+    registry.save(path)
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    sources = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    temp_dir = tempfile.mkdtemp()
+    try:
+        rom_dir = os.path.join(temp_dir, 'roms')
+        os.makedirs(rom_dir)
+        create_folder(rom_dir, files)
+        metrics_path = os.path.join(temp_dir, 'metrics', 'script_akl_defaults.prom')
+        for i in range(sources):
+            record_scan(metrics_path, 'source{}'.format(i), files, 1.0)
+
+        scan_timings = []
+        metrics_timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            found = scan(rom_dir, os.path.join(temp_dir, 'scan.txt'))
+            scan_timings.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            record_scan(metrics_path, 'source0', found, scan_timings[-1])
+            metrics_timings.append(time.perf_counter() - start)
+
+        scan_time = statistics.median(scan_timings)
+        metrics_time = statistics.median(metrics_timings)
+        print(f'{files} files, metrics file with {sources} sources ({os.path.getsize(metrics_path)} bytes)')
+        print('scan:    {:.2f}ms'.format(scan_time * 1000))
+        print('metrics: {:.2f}ms ({:.2f}% of the scan)'.format(metrics_time * 1000, metrics_time * 100 / scan_time))
+        print('under 1% for scans that take longer than {:.0f}ms'.format(metrics_time * 100 * 1000))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Launch latency benchmark for page cache prewarming.
+#
+# Stands in for an emulator that has to read its ROM before showing the first frame: a child
+# process reads the first MB of a file and exits. The file is dropped from the page cache with
+# posix_fadvise(DONTNEED) before each run, then the child is started either right away or after
+# the prewarmer had the length of the launcher setup work to read ahead.
+# Only meaningful on a real disk or NAS mount, on tmpfs both numbers are the same.
+#
+# Usage: python -m tests.benchmarks.prewarm_bench <file> [setup ms] [runs]
+import os
+import sys
+import statistics
+import subprocess
+import time
+
+from resources.lib.prewarm import Prewarmer
+
+READ_MB = 256
+EMULATOR = 'import sys\nwith open(sys.argv[1], "rb") as f:\n    for _ in range({}):\n        f.read(1024 * 1024)'.format(READ_MB)
+
+
+def drop_from_cache(path):
+    with open(path, 'rb') as file:
+        os.fsync(file.fileno())
+        os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def time_to_first_frame(path, setup_seconds, prewarm):
+    drop_from_cache(path)
+    start = time.perf_counter()
+    if prewarm:
+        Prewarmer(READ_MB * 1024 * 1024).start(path)
+    # The launcher setup work that the prewarming overlaps with
+    time.sleep(setup_seconds)
+    subprocess.run([sys.executable, '-c', EMULATOR, path], check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    if len(sys.argv) < 2 or not hasattr(os, 'posix_fadvise'):
+        print(__doc__ if __doc__ else 'Usage: python -m tests.benchmarks.prewarm_bench <file> [setup ms] [runs]')
+        return
+    path = os.path.abspath(sys.argv[1])
+    setup_seconds = int(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.1
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    cold = statistics.median(time_to_first_frame(path, setup_seconds, False) for _ in range(runs))
+    warm = statistics.median(time_to_first_frame(path, setup_seconds, True) for _ in range(runs))
+    print('Without prewarming: {:8.1f} ms'.format(cold * 1000))
+    print('With prewarming:    {:8.1f} ms'.format(warm * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Spawn latency benchmark for the posix_spawn executor.
+#
+# Grows this process to the given size first, like Kodi with its textures and GPU mappings,
+# then compares starting /bin/true with fork() + exec() against posix_spawn(). subprocess is
+# timed as well. Newer Pythons use vfork() in subprocess where they can, older ones fork.
+#
+# Usage: python -m tests.benchmarks.spawn_bench [parent MB] [runs]
+import os
+import sys
+import statistics
+import subprocess
+import time
+
+APPLICATION = '/bin/true'
+
+
+def fork_exec():
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.execv(APPLICATION, [APPLICATION])
+        finally:
+            os._exit(127)
+    os.waitpid(pid, 0)
+
+
+def posix_spawn():
+    pid = os.posix_spawn(APPLICATION, [APPLICATION], os.environ)
+    os.waitpid(pid, 0)
+
+
+def subprocess_call():
+    subprocess.call([APPLICATION], close_fds=True)
+
+
+def time_spawn(spawn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        spawn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parent_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    # Touch every page so they are really mapped
+    ballast = bytearray(parent_mb * 1024 * 1024)
+    for offset in range(0, len(ballast), 4096):
+        ballast[offset] = 1
+
+    print('Parent process: {} MB'.format(parent_mb))
+    for name, spawn in [('fork + exec', fork_exec), ('subprocess', subprocess_call), ('posix_spawn', posix_spawn)]:
+        print('{:<12} {:8.2f} ms'.format(name, time_spawn(spawn, runs) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Cold start benchmark for the plugin entry point.
+#
+# Measures how long a fresh interpreter needs to import what a command uses, comparing the
+# old eager imports of default.py with the per command imports. Every command goes through
+# resources.lib.commands and the keep-alive HTTP client; the optional features (metrics,
+# profiling, memory diagnostics, the scheduler) are only imported when they are switched on,
+# so they are left out of the scenarios. A launch through the worker of the addon service
+# imports nothing at all, this is the cost without the service.
+# Needs the same environment as the tests (script.module.akl and Kodistubs installed).
+#
+# Usage: python -m tests.benchmarks.startup_bench [runs]
+import os
+import sys
+import statistics
+import subprocess
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+
+BASE_IMPORTS = [
+    'from akl import constants, settings, addons',
+    'from akl.utils import kodilogging, kodi',
+    'from resources.lib import commands, httpclient',
+]
+SCENARIOS = {
+    'eager (all commands)': BASE_IMPORTS + [
+        'from akl.utils import io',
+        'from akl.launchers import ExecutionSettings, get_executor_factory',
+        'from akl.scrapers import ScrapeStrategy, ScraperSettings',
+        'from resources.lib.launcher import AppLauncher',
+        'from resources.lib.executors import InstrumentedExecutorFactory',
+        'from resources.lib import timeline, reportstore',
+        'from resources.lib.scanner import RomFolderScanner',
+        'from resources.lib.scraper import LocalFilesScraper',
+    ],
+    'launch_rom': BASE_IMPORTS + [
+        'from akl.utils import io',
+        'from akl.launchers import ExecutionSettings, get_executor_factory',
+        'from resources.lib.launcher import AppLauncher',
+        'from resources.lib.executors import InstrumentedExecutorFactory',
+        'from resources.lib import timeline, reportstore',
+    ],
+    'scan_for_roms': BASE_IMPORTS + [
+        'from akl.utils import io',
+        'from resources.lib import filewalk',
+        'from resources.lib.scanner import RomFolderScanner',
+        'from resources.lib import reportstore',
+    ],
+    'run_scraper': BASE_IMPORTS + [
+        'from akl.scrapers import ScrapeStrategy, ScraperSettings',
+        'from resources.lib.scraper import LocalFilesScraper',
+        'from resources.lib import reportstore',
+    ],
+}
+
+def time_imports(statements, runs):
+    code = ';'.join(statements)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    baseline = statistics.median(time_imports(['pass'], runs))
+    print('Interpreter start: {:.1f} ms (subtracted below)'.format(baseline * 1000))
+
+    results = {}
+    for name, statements in SCENARIOS.items():
+        results[name] = statistics.median(time_imports(statements, runs)) - baseline
+        print('{:<22} {:8.1f} ms'.format(name, results[name] * 1000))
+
+    eager = results['eager (all commands)']
+    launch = results['launch_rom']
+    print('launch_rom imports {:.1f} ms less ({:.0f}%)'.format((eager - launch) * 1000, (1 - launch / eager) * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Per command overhead with and without the warm worker.
+#
+# Cold: a fresh interpreter imports what a command needs, like every plugin invocation without
+# the worker. Warm: the command is handed to a worker process that has everything imported,
+# which is what the plugin invocation does when the addon service runs. The commands themselves
+# are no-ops, so the numbers are overhead only. With script.module.akl installed its modules are
+# imported as well, without it only the addon's own modules are.
+#
+# Usage: python -m tests.benchmarks.worker_bench [runs]
+import os
+import sys
+import statistics
+import subprocess
+import tempfile
+import time
+
+from resources.lib import worker
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+
+IMPORTS = [
+    'from resources.lib import launchcache, prewarm, timeline, reportstore, extractcache, scrapecache, assetindex',
+]
+AKL_IMPORTS = [
+    'from akl import constants, settings, addons',
+    'from akl.launchers import ExecutionSettings, get_executor_factory',
+    'from resources.lib.launcher import AppLauncher',
+]
+SERVER = '''
+import sys, time
+{imports}
+from resources.lib import worker
+server = worker.WorkerServer(sys.argv[1], lambda argv: argv, lambda command: None)
+server.start()
+print('ready', flush=True)
+sys.stdin.read()
+server.stop()
+'''
+
+
+def get_imports():
+    try:
+        import akl  # noqa: F401
+        return IMPORTS + AKL_IMPORTS
+    except ImportError:
+        return IMPORTS
+
+
+def time_cold(imports, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', ';'.join(imports)], cwd=ROOT_DIR, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def time_warm(imports, runs):
+    socket_path = os.path.join(tempfile.mkdtemp(), worker.SOCKET_NAME)
+    server = subprocess.Popen([sys.executable, '-c', SERVER.format(imports='\n'.join(imports)), socket_path],
+                              cwd=ROOT_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    server.stdout.readline()
+    timings = []
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            if not worker.submit(socket_path, ['default.py', 'launch']):
+                raise RuntimeError('Worker did not accept the command')
+            timings.append(time.perf_counter() - start)
+            # Let the no-op command finish so the worker is not busy
+            time.sleep(0.01)
+    finally:
+        server.communicate('')
+    return statistics.median(timings)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    imports = get_imports()
+    cold = time_cold(imports, runs)
+    warm = time_warm(imports, runs)
+    print('In-process (cold interpreter + imports): {:8.2f} ms'.format(cold * 1000))
+    print('Handed to warm worker:                   {:8.2f} ms'.format(warm * 1000))
+
+
+if __name__ == '__main__':
+    main()
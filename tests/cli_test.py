@@ -0,0 +1,103 @@
+import unittest, os
+import tempfile
+import shutil
+import threading
+import json
+import gzip
+import urllib.request
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.cli import read_setting_defaults, translate_path, read_settings_file, split_chunks, \
+    create_standin_server, HeadlessProgressDialog
+
+class Test_cli(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_setting_defaults_are_read_from_the_settings_xml_with_paths_in_the_data_dir(self):
+        # act
+        actual = read_setting_defaults(self.test_dir)
+
+        # assert
+        self.assertEqual('false', actual['metrics_enabled'])
+        self.assertEqual(os.path.join(self.test_dir, 'metrics/'), actual['metrics_dir'])
+        self.assertIn('scanner_detect_moves', actual)
+
+    def test_other_special_paths_stay_below_the_data_dir(self):
+        # act
+        actual = translate_path('special://home/userdata/', self.test_dir)
+
+        # assert
+        self.assertEqual(os.path.join(self.test_dir, 'special', 'home/userdata/'), actual)
+        self.assertEqual('/storage/roms/', translate_path('/storage/roms/', self.test_dir))
+
+    def test_a_settings_file_without_source_id_is_named_after_the_file(self):
+        # arrange
+        path = os.path.join(self.test_dir, 'snes roms.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'scanner': {'rompath': '/storage/roms/snes/'}}, f)
+
+        # act
+        actual = read_settings_file(path)
+
+        # assert
+        self.assertEqual('snes_roms', actual['source_id'])
+
+    def test_roms_are_split_in_chunks(self):
+        # act
+        actual = split_chunks(list(range(7)), 3)
+
+        # assert
+        self.assertEqual([[0, 1, 2], [3, 4, 5], [6]], actual)
+
+    def test_the_progress_dialog_follows_steps_and_is_never_cancelled(self):
+        # arrange
+        target = HeadlessProgressDialog()
+        target.startProgress('Scanning', 10)
+        target.setSteps(4)
+
+        # act
+        target.incrementStep('Checking ROMs')
+        target.incrementStep()
+
+        # assert
+        self.assertEqual(2, target.step_index)
+        self.assertEqual('Checking ROMs', target.message)
+        self.assertFalse(target.isCanceled())
+
+    def test_the_standin_webserver_answers_from_files_and_keeps_posted_bodies(self):
+        # arrange
+        with open(os.path.join(self.test_dir, 'query.source.roms-abc.json'), 'w', encoding='utf-8') as f:
+            json.dump([{'id': str(i)} for i in range(5)], f)
+        server = create_standin_server(self.test_dir, 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+        try:
+            # act
+            page = json.loads(urllib.request.urlopen(f'{base_url}/query/source/roms/?id=abc&offset=2&limit=2').read())
+            missing = json.loads(urllib.request.urlopen(f'{base_url}/query/source/roms/?id=xyz').read())
+            request = urllib.request.Request(f'{base_url}/store/roms/?id=abc', data=gzip.compress(b'[{"id": "1"}]'),
+                                             headers={'Content-Encoding': 'gzip'})
+            urllib.request.urlopen(request).read()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        # assert
+        self.assertEqual([{'id': '2'}, {'id': '3'}], page)
+        self.assertEqual([], missing)
+        with open(os.path.join(self.test_dir, 'received', '00001-store.roms-abc.json'), 'rb') as f:
+            self.assertEqual(b'[{"id": "1"}]', f.read())
+
+if __name__ == '__main__':
+    unittest.main()
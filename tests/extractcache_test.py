@@ -0,0 +1,155 @@
+import unittest, os
+import tempfile
+import shutil
+import zipfile
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.extractcache import ExtractionCache
+
+class Test_extractcache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.test_dir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _create_zip(self, name, files):
+        path = os.path.join(self.test_dir, name)
+        with zipfile.ZipFile(path, 'w') as archive:
+            for file_name, content in files.items():
+                archive.writestr(file_name, content)
+        return path
+
+    def test_archive_path_in_the_arguments_is_replaced_by_the_extracted_main_file(self):
+        # arrange
+        archive_path = self._create_zip('ff7.zip', {'ff7 (Track 1).bin': b'x' * 1000, 'ff7.cue': b'FILE'})
+        target = ExtractionCache(self.cache_dir, 1024 * 1024)
+
+        # act
+        target.prepare(archive_path)
+        actual = target.substitute(['-L', 'core.so', '"{}"'.format(archive_path)])
+        target.wait()
+
+        # assert
+        self.assertTrue(actual[2].endswith('ff7.cue"'))
+        self.assertTrue(os.path.exists(actual[2].strip('"')))
+        self.assertEqual(1, target.stats.misses)
+
+    def test_second_launch_reuses_the_extraction(self):
+        # arrange
+        archive_path = self._create_zip('tetris.zip', {'tetris.gb': b'rom'})
+        first_launch = ExtractionCache(self.cache_dir, 1024 * 1024)
+        first_launch.prepare(archive_path)
+        first_launch.substitute([archive_path])
+        first_launch.evict_in_background()
+        first_launch.wait()
+
+        # act
+        target = ExtractionCache(self.cache_dir, 1024 * 1024)
+        target.prepare(archive_path)
+        actual = target.substitute([archive_path])
+        target.wait()
+
+        # assert
+        self.assertEqual(1, target.stats.hits)
+        self.assertEqual(0, target.stats.misses)
+        self.assertTrue(actual[0].endswith('tetris.gb'))
+        self.assertIn('1 hits, 1 misses', target.get_report_lines()[1])
+
+    def test_an_extraction_is_in_the_index_without_eviction(self):
+        # arrange
+        archive_path = self._create_zip('tetris.zip', {'tetris.gb': b'rom'})
+        first_launch = ExtractionCache(self.cache_dir, 1024 * 1024)
+        first_launch.prepare(archive_path)
+        first_launch.substitute([archive_path])
+        first_launch.executor.shutdown(wait=True)
+
+        # act
+        target = ExtractionCache(self.cache_dir, 1024 * 1024)
+        target.prepare(archive_path)
+        target.substitute([archive_path])
+        target.wait()
+
+        # assert
+        self.assertEqual(1, target.stats.hits)
+
+    def test_old_directories_missing_in_the_index_are_removed(self):
+        # arrange
+        orphan_dir = os.path.join(self.cache_dir, 'a' * 40 + '.1234.tmp')
+        recent_dir = os.path.join(self.cache_dir, 'b' * 40)
+        for path in (orphan_dir, recent_dir):
+            os.makedirs(path)
+            with open(os.path.join(path, 'game.iso'), 'wb') as f:
+                f.write(b'x' * 100)
+        os.utime(orphan_dir, (0, 0))
+        target = ExtractionCache(self.cache_dir, 1024 * 1024)
+        self.assertTrue(os.path.exists(orphan_dir))
+
+        # act
+        target.evict_in_background()
+        target.wait()
+
+        # assert
+        self.assertFalse(os.path.exists(orphan_dir))
+        self.assertTrue(os.path.exists(recent_dir))
+
+    def test_overlapping_launches_keep_each_others_extractions(self):
+        # arrange
+        tetris_path = self._create_zip('tetris.zip', {'tetris.gb': b'rom'})
+        zelda_path = self._create_zip('zelda.zip', {'zelda.gb': b'rom'})
+        first_launch = ExtractionCache(self.cache_dir, 1024 * 1024)
+        second_launch = ExtractionCache(self.cache_dir, 1024 * 1024)
+        first_launch.prepare(tetris_path)
+        first_launch.substitute([tetris_path])
+        second_launch.prepare(zelda_path)
+        second_launch.substitute([zelda_path])
+
+        # act
+        first_launch.evict_in_background()
+        first_launch.wait()
+        second_launch.evict_in_background()
+        second_launch.wait()
+        target = ExtractionCache(self.cache_dir, 1024 * 1024)
+
+        # assert
+        self.assertEqual(2, len(target.entries))
+        self.assertEqual(2, target.total_misses)
+
+    def test_least_recently_used_extractions_are_evicted_above_the_size_limit(self):
+        # arrange
+        target = ExtractionCache(self.cache_dir, 2500)
+        archives = [self._create_zip(f'game{i}.zip', {f'game{i}.gb': b'x' * 1000}) for i in range(4)]
+
+        # act
+        for archive_path in archives:
+            target.get_extracted(archive_path)
+        target.evict_in_background()
+        target.wait()
+
+        # assert
+        self.assertEqual(2, len(target.entries))
+        self.assertEqual({'game2.gb', 'game3.gb'}, {e['main'] for e in target.entries.values()})
+
+    def test_entries_pointing_outside_the_cache_are_refused(self):
+        # arrange
+        archive_path = self._create_zip('evil.zip', {'../../evil.gb': b'x'})
+        target = ExtractionCache(self.cache_dir, 1024 * 1024)
+
+        # act
+        target.prepare(archive_path)
+        actual = target.substitute([archive_path])
+        target.wait()
+
+        # assert
+        self.assertEqual([archive_path], actual)
+        self.assertEqual(1, target.stats.failures)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest, os
+import tempfile
+import shutil
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.filewalk import DirectoryWalker, parse_prune_patterns, is_local
+
+class Test_filewalk(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.test_dir, 'roms')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _create_file(self, relative_path):
+        path = os.path.join(self.root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'PK')
+        return path
+
+    def _relative(self, paths):
+        return sorted(os.path.relpath(path, self.root) for path in paths)
+
+    def test_all_files_below_the_root_are_found(self):
+        # arrange
+        self._create_file('snes/tetris.zip')
+        self._create_file('snes/usa/zelda.zip')
+        self._create_file('readme.txt')
+        steps = []
+        target = DirectoryWalker()
+
+        # act
+        actual = target.walk(self.root, True, steps.append, lambda: steps.append('done'))
+
+        # assert
+        self.assertEqual(['readme.txt', 'snes/tetris.zip', 'snes/usa/zelda.zip'], self._relative(actual))
+        self.assertEqual([1, 'done'], steps)
+
+    def test_without_recursion_only_the_files_in_the_root_are_found(self):
+        # arrange
+        self._create_file('snes/tetris.zip')
+        self._create_file('duckhunt.zip')
+
+        # act
+        actual = DirectoryWalker().walk(self.root, False)
+
+        # assert
+        self.assertEqual(['duckhunt.zip'], self._relative(actual))
+
+    def test_a_symlink_back_into_the_tree_is_walked_once(self):
+        # arrange
+        self._create_file('shared-bios/scph1001.bin')
+        self._create_file('psx/crash.cue')
+        os.symlink(os.path.join(self.root, 'shared-bios'), os.path.join(self.root, 'psx', 'bios'))
+        os.symlink(self.root, os.path.join(self.root, 'psx', 'loop'))
+        target = DirectoryWalker()
+
+        # act
+        actual = target.walk(self.root)
+
+        # assert
+        self.assertEqual(['psx/crash.cue', 'shared-bios/scph1001.bin'], self._relative(actual))
+        self.assertEqual(2, target.num_duplicates)
+
+    def test_symlinks_are_only_followed_up_to_the_maximum_depth(self):
+        # arrange
+        outside = os.path.join(self.test_dir, 'outside')
+        os.makedirs(os.path.join(outside, 'deeper'))
+        with open(os.path.join(outside, 'deeper', 'game.zip'), 'wb') as f:
+            f.write(b'PK')
+        os.symlink(os.path.join(outside, 'deeper'), os.path.join(outside, 'link2'))
+        os.makedirs(self.root)
+        os.symlink(outside, os.path.join(self.root, 'link1'))
+        target = DirectoryWalker(max_symlink_depth=1)
+
+        # act
+        actual = target.walk(self.root)
+
+        # assert
+        self.assertEqual(['link1/deeper/game.zip'], self._relative(actual))
+        self.assertEqual(1, target.num_too_deep)
+
+    def test_pruned_directories_are_never_listed(self):
+        # arrange
+        self._create_file('snes/tetris.zip')
+        self._create_file('snes/media/boxfront/tetris.png')
+        self._create_file('snes/@eaDir/tetris.zip/SYNOFILE_THUMB.jpg')
+        self._create_file('psx/snap/crash.png')
+        self._create_file('snap/duckhunt.png')
+        target = DirectoryWalker(parse_prune_patterns('media|@EADIR|psx/snap'))
+        listed = []
+        original_list = target._list
+        target._list = lambda path, *args: listed.append(path) or original_list(path, *args)
+
+        # act
+        actual = target.walk(self.root)
+
+        # assert
+        self.assertEqual(['snap/duckhunt.png', 'snes/tetris.zip'], self._relative(actual))
+        self.assertFalse(any('media' in path or '@eaDir' in path or 'psx/snap' in path for path in listed))
+        self.assertEqual(3, target.num_pruned)
+
+    def test_paths_of_the_kodi_vfs_are_not_local(self):
+        # act / assert
+        self.assertFalse(is_local('smb://nas/roms/'))
+        self.assertTrue(is_local('/storage/roms/'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import unittest
+import threading
+import json
+import gzip
+import urllib.error
+import urllib.request
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.httpclient import KeepAliveHandler, encode_compact_json, COMPRESS_MIN_SIZE
+
+class FakeWebserverHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        if self.path.startswith('/query/missing'):
+            self._reply(404, {'error': 'not found'})
+            return
+        if self.path.startswith('/query/close'):
+            self.close_connection = True
+        self._reply(200, {'path': self.path})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.encodings.append(self.headers.get('Content-Encoding'))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            if not self.server.accepts_gzip:
+                self._reply(self.server.rejected_status, {'error': 'unsupported encoding'})
+                return
+            body = gzip.decompress(body)
+        self._reply(200, json.loads(body))
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class Test_httpclient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeWebserverHandler)
+        self.server.connections = 0
+        self.server.encodings = []
+        self.server.accepts_gzip = True
+        self.server.rejected_status = 415
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        self.handler = KeepAliveHandler()
+        self.opener = urllib.request.build_opener(self.handler)
+
+    def tearDown(self):
+        self.handler.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sequential_calls_share_one_connection(self):
+        # act
+        bodies = [self.opener.open(f'{self.base_url}/query/rom/?id={i}').read() for i in range(5)]
+
+        # assert
+        self.assertEqual({'path': '/query/rom/?id=3'}, json.loads(bodies[3]))
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual(5, self.handler.requests)
+
+    def test_posted_data_is_sent_over_the_pooled_connection(self):
+        # arrange
+        self.opener.open(f'{self.base_url}/query/rom/?id=1').read()
+        data = json.dumps({'roms': [1, 2]}).encode('utf-8')
+
+        # act
+        request = urllib.request.Request(f'{self.base_url}/store/roms/', data=data,
+                                         headers={'Content-Type': 'application/json'})
+        actual = json.loads(self.opener.open(request).read())
+
+        # assert
+        self.assertEqual({'roms': [1, 2]}, actual)
+        self.assertEqual(1, self.server.connections)
+
+    def test_error_statuses_raise_http_errors(self):
+        # act / assert
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.opener.open(f'{self.base_url}/query/missing/')
+        self.assertEqual(404, context.exception.code)
+
+    def test_a_connection_closed_by_the_server_is_replaced(self):
+        # act
+        self.opener.open(f'{self.base_url}/query/close/').read()
+        actual = self.opener.open(f'{self.base_url}/query/rom/?id=1').read()
+
+        # assert
+        self.assertEqual({'path': '/query/rom/?id=1'}, json.loads(actual))
+        self.assertEqual(2, self.server.connections)
+
+    def _post_roms(self, count):
+        roms = [{'id': str(i), 'm_name': f'Game {i}', 'm_plot': '', 'tags': []} for i in range(count)]
+        request = urllib.request.Request(f'{self.base_url}/store/roms/', data=json.dumps(roms).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        return json.loads(self.opener.open(request).read())
+
+    def test_large_bodies_are_sent_compressed(self):
+        # arrange
+        self.handler.compress_bodies = True
+
+        # act
+        actual = self._post_roms(1000)
+
+        # assert
+        self.assertEqual(1000, len(actual))
+        self.assertEqual(['gzip'], self.server.encodings)
+        self.assertLess(self.handler.bytes_sent, COMPRESS_MIN_SIZE)
+
+    def test_when_compression_is_rejected_plain_bodies_are_sent_from_then_on(self):
+        # arrange
+        self.handler.compress_bodies = True
+        self.server.accepts_gzip = False
+
+        # act
+        first = self._post_roms(1000)
+        second = self._post_roms(1000)
+
+        # assert
+        self.assertEqual(1000, len(first))
+        self.assertEqual(1000, len(second))
+        self.assertEqual(['gzip', None, None], self.server.encodings)
+
+    def test_a_server_error_on_the_first_compressed_body_falls_back_to_plain_bodies(self):
+        # arrange
+        self.handler.compress_bodies = True
+        self.server.accepts_gzip = False
+        self.server.rejected_status = 500
+
+        # act
+        first = self._post_roms(1000)
+        second = self._post_roms(1000)
+
+        # assert
+        self.assertEqual(1000, len(first))
+        self.assertEqual(1000, len(second))
+        self.assertEqual(['gzip', None, None], self.server.encodings)
+
+    def test_once_compressed_bodies_were_taken_errors_are_not_sent_again(self):
+        # arrange
+        self.handler.compress_bodies = True
+        self._post_roms(1000)
+        self.server.accepts_gzip = False
+        self.server.rejected_status = 500
+
+        # act / assert
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self._post_roms(1000)
+        self.assertEqual(500, context.exception.code)
+        self.assertEqual(['gzip', 'gzip'], self.server.encodings)
+
+    def test_compact_json_leaves_out_empty_fields(self):
+        # arrange
+        data = json.dumps([{'id': '1', 'm_plot': '', 'm_rating': 0, 'tags': [], 'scanned_data': {'file': 'a.zip', 'm3u': None}}])
+
+        # act
+        actual = json.loads(encode_compact_json(data.encode('utf-8')))
+
+        # assert
+        self.assertEqual([{'id': '1', 'm_rating': 0, 'scanned_data': {'file': 'a.zip'}}], actual)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest, os
+import tempfile
+import shutil
+import json
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.launchcache import LauncherSettingsSnapshot, ApplicationResolutionCache
+
+class Test_launchcache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.launcher_settings = {'application': '/usr/bin/retroarch', 'args': '-L core.so "$rom$"'}
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_stored_snapshot_will_be_used_for_the_next_launch(self):
+        # arrange
+        target = LauncherSettingsSnapshot(self.test_dir, 3600)
+        target.put('launcher1', 'rom1', self.launcher_settings)
+
+        # act
+        actual = LauncherSettingsSnapshot(self.test_dir, 3600).get('launcher1', 'rom1')
+
+        # assert
+        self.assertEqual(self.launcher_settings, actual)
+
+    def test_storing_the_same_settings_again_is_not_a_change(self):
+        # arrange
+        target = LauncherSettingsSnapshot(self.test_dir, 3600)
+        target.put('launcher1', 'rom1', self.launcher_settings)
+
+        # act
+        unchanged = target.put('launcher1', 'rom1', dict(self.launcher_settings))
+        changed = target.put('launcher1', 'rom1', {'application': '/usr/bin/mame', 'args': ''})
+
+        # assert
+        self.assertFalse(unchanged)
+        self.assertTrue(changed)
+        self.assertEqual('/usr/bin/mame', target.get('launcher1', 'rom1')['application'])
+
+    def test_expired_snapshot_will_not_be_used(self):
+        # arrange
+        target = LauncherSettingsSnapshot(self.test_dir, 60)
+        target.put('launcher1', 'rom1', self.launcher_settings)
+        path = os.path.join(self.test_dir, 'launcher1-rom1.json')
+        with open(path, 'r') as f:
+            data = json.load(f)
+        data['stored_at'] -= 120
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+        # act
+        actual = target.get('launcher1', 'rom1')
+
+        # assert
+        self.assertIsNone(actual)
+
+    def test_an_expired_snapshot_is_used_again_once_the_same_settings_are_fetched(self):
+        # arrange
+        target = LauncherSettingsSnapshot(self.test_dir, 60)
+        target.put('launcher1', 'rom1', self.launcher_settings)
+        path = os.path.join(self.test_dir, 'launcher1-rom1.json')
+        with open(path, 'r') as f:
+            data = json.load(f)
+        data['stored_at'] -= 120
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+        # act
+        is_changed = target.put('launcher1', 'rom1', dict(self.launcher_settings))
+
+        # assert
+        self.assertFalse(is_changed)
+        self.assertEqual(self.launcher_settings, target.get('launcher1', 'rom1'))
+
+    def test_invalidating_a_launcher_removes_the_snapshots_of_all_its_roms(self):
+        # arrange
+        target = LauncherSettingsSnapshot(self.test_dir, 0)
+        target.put('launcher1', 'rom1', self.launcher_settings)
+        target.put('launcher1', 'rom2', self.launcher_settings)
+        target.put('launcher2', 'rom1', self.launcher_settings)
+
+        # act
+        target.invalidate('launcher1')
+
+        # assert
+        self.assertIsNone(target.get('launcher1', 'rom1'))
+        self.assertIsNone(target.get('launcher1', 'rom2'))
+        self.assertIsNotNone(target.get('launcher2', 'rom1'))
+
+    def test_resolved_application_will_be_returned_from_the_cache(self):
+        # arrange
+        app_path = os.path.join(self.test_dir, 'retroarch')
+        with open(app_path, 'w') as f:
+            f.write('#!/bin/sh')
+        os.chmod(app_path, 0o755)
+        ApplicationResolutionCache(self.test_dir).store('retroarch', app_path)
+
+        # act
+        target = ApplicationResolutionCache(self.test_dir)
+        actual = target.resolve('retroarch')
+        target.wait()
+
+        # assert
+        self.assertEqual(app_path, actual)
+
+    def test_when_the_application_is_gone_it_is_not_returned_and_dropped(self):
+        # arrange
+        app_path = os.path.join(self.test_dir, 'retroarch')
+        with open(app_path, 'w') as f:
+            f.write('#!/bin/sh')
+        os.chmod(app_path, 0o755)
+        target = ApplicationResolutionCache(self.test_dir)
+        target.store('retroarch', app_path)
+        os.remove(app_path)
+
+        # act
+        first = target.resolve('retroarch')
+        target.wait()
+        second = ApplicationResolutionCache(self.test_dir).resolve('retroarch')
+
+        # assert
+        self.assertIsNone(first)
+        self.assertIsNone(second)
+
+    def test_when_the_application_changed_the_background_check_updates_it(self):
+        # arrange
+        app_path = os.path.join(self.test_dir, 'retroarch')
+        with open(app_path, 'w') as f:
+            f.write('#!/bin/sh')
+        os.chmod(app_path, 0o755)
+        ApplicationResolutionCache(self.test_dir).store('retroarch', app_path)
+        os.utime(app_path, (0, 0))
+
+        # act
+        target = ApplicationResolutionCache(self.test_dir)
+        actual = target.resolve('retroarch')
+        target.wait()
+
+        # assert
+        self.assertEqual(app_path, actual)
+        self.assertEqual(0, ApplicationResolutionCache(self.test_dir)._get_entries()['retroarch']['mtime'])
+
+if __name__ == '__main__':
+    unittest.main()
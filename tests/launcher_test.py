@@ -1,4 +1,7 @@
 import unittest, os
+import tempfile
+import shutil
+import json
 import unittest.mock
 from unittest.mock import MagicMock, patch
 
@@ -11,6 +14,7 @@ logger = logging.getLogger(__name__)
 from tests.fakes import FakeFile, FakeExecutor, random_string
 
 from resources.lib.launcher import AppLauncher
+from resources.lib.launchcache import LauncherSettingsSnapshot, ApplicationResolutionCache
 from akl.launchers import ExecutionSettings
 from akl.api import ROMObj
 
@@ -31,6 +35,12 @@ class Test_Launcher(unittest.TestCase):
         logger.info('TEST ASSETS DIR: {}'.format(cls.TEST_ASSETS_DIR))
         logger.info('---------------------------------------------------------------------------')
 
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
     # todo: Move to repository tests
     #def test_when_creating_a_launcher_with_not_exisiting_id_it_will_fail(self):
     #    # arrange
@@ -179,6 +189,105 @@ class Test_Launcher(unittest.TestCase):
         self.assertEqual(expectedArgsArray[2], mock.actualArgs[2])
         self.assertEqual(expectedArgsArray[3], mock.actualArgs[3])
                 
+    def _get_launcher_settings(self, application):
+        return {'id': 'ABC', 'application': application, 'toggle_window': True, 'args': '"$rom$"',
+                'romext': '', 'args_extra': '', 'display_launcher_notify': False}
+
+    @patch('akl.launchers.kodi', autospec=True)
+    @patch('akl.utils.io.FileName', side_effect = FakeFile)
+    @patch('akl.api.client_get_rom')
+    @patch('akl.api.client_get_launcher_settings')
+    @patch('akl.executors.ExecutorFactory')
+    def test_when_a_snapshot_is_fresh_the_launch_does_not_wait_for_the_webserver(self,
+            factory_mock:MagicMock, api_settings_mock:MagicMock, api_rom_mock: MagicMock, filename_mock, kodi_mock):
+
+        # arrange
+        launcher_id = random_string(10)
+        rom_id = random_string(10)
+        snapshot = LauncherSettingsSnapshot(self.test_dir, 600)
+        snapshot.put(launcher_id, rom_id, self._get_launcher_settings('/usr/bin/retroarch'))
+        api_settings_mock.return_value = self._get_launcher_settings('/usr/bin/mame')
+        api_rom_mock.return_value = ROMObj({'id': rom_id, 'm_name': 'TestCase', 'scanned_data': {'file': 'testing.zip'}})
+
+        mock = FakeExecutor()
+        factory_mock.create.return_value = mock
+
+        # act
+        target = AppLauncher(launcher_id, rom_id, 'localhost', 8080, factory_mock, ExecutionSettings(), snapshot)
+        target.launch()
+        is_changed = target.revalidate_settings_snapshot()
+
+        # assert
+        self.assertTrue(target.snapshot_used)
+        self.assertEqual('/usr/bin/retroarch', mock.actualApplication)
+        self.assertTrue(is_changed)
+        self.assertEqual(1, api_settings_mock.call_count)
+        self.assertEqual('/usr/bin/mame', snapshot.get(launcher_id, rom_id)['application'])
+
+    @patch('akl.launchers.kodi', autospec=True)
+    @patch('akl.utils.io.FileName', side_effect = FakeFile)
+    @patch('akl.api.client_get_rom')
+    @patch('akl.api.client_get_launcher_settings')
+    @patch('akl.executors.ExecutorFactory')
+    def test_when_a_snapshot_expired_the_launch_uses_the_settings_of_the_webserver(self,
+            factory_mock:MagicMock, api_settings_mock:MagicMock, api_rom_mock: MagicMock, filename_mock, kodi_mock):
+
+        # arrange
+        launcher_id = random_string(10)
+        rom_id = random_string(10)
+        snapshot = LauncherSettingsSnapshot(self.test_dir, 600)
+        snapshot.put(launcher_id, rom_id, self._get_launcher_settings('/usr/bin/retroarch'))
+        path = os.path.join(self.test_dir, '{}-{}.json'.format(launcher_id, rom_id))
+        with open(path, 'r') as f:
+            data = json.load(f)
+        data['stored_at'] -= 3600
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        api_settings_mock.return_value = self._get_launcher_settings('/usr/bin/mame')
+        api_rom_mock.return_value = ROMObj({'id': rom_id, 'm_name': 'TestCase', 'scanned_data': {'file': 'testing.zip'}})
+
+        mock = FakeExecutor()
+        factory_mock.create.return_value = mock
+
+        # act
+        target = AppLauncher(launcher_id, rom_id, 'localhost', 8080, factory_mock, ExecutionSettings(), snapshot)
+        target.launch()
+
+        # assert
+        self.assertFalse(target.snapshot_used)
+        self.assertEqual('/usr/bin/mame', mock.actualApplication)
+        self.assertEqual('/usr/bin/mame', snapshot.get(launcher_id, rom_id)['application'])
+
+    @patch('akl.launchers.kodi', autospec=True)
+    @patch('akl.utils.io.FileName', side_effect = FakeFile)
+    @patch('akl.api.client_get_rom')
+    @patch('akl.api.client_get_launcher_settings')
+    @patch('akl.executors.ExecutorFactory')
+    def test_a_cached_application_path_is_launched_without_resolving_it_again(self,
+            factory_mock:MagicMock, api_settings_mock:MagicMock, api_rom_mock: MagicMock, filename_mock, kodi_mock):
+
+        # arrange
+        app_path = os.path.join(self.test_dir, 'retroarch')
+        with open(app_path, 'w') as f:
+            f.write('#!/bin/sh')
+        application_cache = ApplicationResolutionCache(self.test_dir)
+        application_cache.store('retroarch', app_path)
+        api_settings_mock.return_value = self._get_launcher_settings('retroarch')
+        rom_id = random_string(10)
+        api_rom_mock.return_value = ROMObj({'id': rom_id, 'm_name': 'TestCase', 'scanned_data': {'file': 'testing.zip'}})
+
+        mock = FakeExecutor()
+        factory_mock.create.return_value = mock
+
+        # act
+        target = AppLauncher(random_string(10), rom_id, 'localhost', 8080, factory_mock, ExecutionSettings(),
+                             application_cache=application_cache)
+        target.launch()
+        application_cache.wait()
+
+        # assert
+        self.assertEqual(app_path, mock.actualApplication)
+
     # @patch('resources.objects.FileName', side_effect = FakeFile)
     # @patch('resources.objects.ExecutorFactory')
     # def test_if_rom_launcher_will_use_the_multidisk_launcher_when_romdata_has_disks_field_filled_in(self, mock_exeFactory, mock_file):
@@ -0,0 +1,103 @@
+import unittest
+import random
+import time
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.assetindex import LocalAssetIndex, normalize_title
+
+REGIONS = ['USA', 'Europe', 'Japan', 'World', 'USA, Europe']
+DUMP_TAGS = ['', ' [!]', ' [b1]', ' (Rev 1)', ' (Rev A)', ' (Beta)']
+
+def random_word(length:int):
+    return ''.join(random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(length))
+
+class Test_localassetindex(unittest.TestCase):
+
+    def test_normalizing_titles_strips_regions_revisions_and_dump_tags(self):
+        self.assertEqual('sonic the hedgehog', normalize_title('Sonic The Hedgehog (USA) (Rev 1)'))
+        self.assertEqual('sonic the hedgehog', normalize_title('sonic_the_hedgehog [!]'))
+        self.assertEqual('the legend of zelda', normalize_title('Legend of Zelda, The (Europe)'))
+        self.assertEqual('tom and jerry', normalize_title('Tom & Jerry (USA)'))
+
+    def test_when_asset_has_the_same_name_it_will_be_matched_exactly(self):
+        # arrange
+        target = LocalAssetIndex()
+        target.add_all(['/titles/pitfall.jpg', '/titles/donkeykong.jpg'])
+
+        # act
+        actual = target.find('Pitfall')
+
+        # assert
+        self.assertEqual('/titles/pitfall.jpg', actual)
+
+    def test_when_asset_misses_the_revision_tag_the_same_region_will_be_preferred(self):
+        # arrange
+        target = LocalAssetIndex()
+        target.add_all(['/snaps/Sonic (Japan).png', '/snaps/Sonic (USA).png', '/snaps/Sonic (Europe).png'])
+
+        # act
+        actual = target.find('Sonic (USA) (Rev 1)')
+
+        # assert
+        self.assertEqual('/snaps/Sonic (USA).png', actual)
+
+    def test_when_names_are_only_similar_the_threshold_decides(self):
+        # arrange
+        target = LocalAssetIndex(threshold=0.8)
+        target.add_all(['/boxfront/Super Mario Bros. 3 (USA).png', '/boxfront/Tetris (World).png'])
+
+        # act
+        similar = target.find('Super Mario Bros 3 (Europe) (Rev A)')
+        different = target.find('Super Metroid (USA)')
+        exact_only = target.find('Super Mario Bross 3', fuzzy=False)
+
+        # assert
+        self.assertEqual('/boxfront/Super Mario Bros. 3 (USA).png', similar)
+        self.assertIsNone(different)
+        self.assertIsNone(exact_only)
+
+    def test_matching_a_large_synthetic_asset_set_is_accurate_and_fast(self):
+        # arrange
+        random.seed(26)
+        titles = set()
+        while len(titles) < 100000:
+            titles.add('{} {} {}'.format(random_word(random.randint(4, 9)),
+                                         random_word(random.randint(4, 9)),
+                                         random_word(random.randint(3, 6))))
+        titles = list(titles)
+        asset_files = ['/fanart/{} ({}).png'.format(t.title(), random.choice(REGIONS)) for t in titles]
+
+        # ROM names with other tags, other casing and a trailing typo in the fuzzy half
+        sample = random.sample(titles, 2000)
+        roms = {}
+        for i, title in enumerate(sample):
+            rom_title = title.upper() if i % 2 == 0 else title + random_word(1)
+            roms['{} ({}){}'.format(rom_title, random.choice(REGIONS), random.choice(DUMP_TAGS))] = title
+
+        target = LocalAssetIndex()
+
+        # act
+        start = time.perf_counter()
+        target.add_all(asset_files)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actuals = {rom: target.find(rom) for rom in roms}
+        match_time = time.perf_counter() - start
+
+        # assert
+        correct = sum(1 for rom, title in roms.items()
+                      if actuals[rom] and normalize_title(actuals[rom].split('/')[-1][:-4]) == title)
+        logger.info('Indexed {} assets in {:.2f}s, matched {} ROMs in {:.2f}s, {} correct'.format(
+            len(asset_files), build_time, len(roms), match_time, correct))
+
+        self.assertGreaterEqual(correct / len(roms), 0.95)
+        self.assertLess(match_time, 10.0)
+
+if __name__ == '__main__':
+    unittest.main()
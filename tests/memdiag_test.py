@@ -0,0 +1,76 @@
+import unittest
+import tracemalloc
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.memdiag import MemoryDiagnostics, traced_phase, MB
+
+def create_candidates(count):
+    return [('/storage/roms/snes/Game {} (USA).zip'.format(i), {'file': i}) for i in range(count)]
+
+class FakeScanner(object):
+
+    def __init__(self, memory_diagnostics):
+        self.memory_diagnostics = memory_diagnostics
+
+    @traced_phase('candidates')
+    def get_candidates(self, count):
+        return create_candidates(count)
+
+class Test_memdiag(unittest.TestCase):
+
+    def test_phases_keep_their_peak_and_the_sites_that_grew(self):
+        # arrange
+        target = MemoryDiagnostics()
+        target.start()
+        try:
+            # act
+            candidates = FakeScanner(target).get_candidates(20000)
+            with target.phase('free'):
+                del candidates
+        finally:
+            target.stop()
+
+        # assert
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(['candidates', 'free'], [phase.name for phase in target.phases])
+        candidates_phase = target.phases[0]
+        self.assertGreater(candidates_phase.get_growth(), 1 * MB)
+        self.assertIn('memdiag_test.py', candidates_phase.top_sites[0][0])
+        self.assertLess(target.phases[1].get_growth(), 0)
+
+    def test_without_tracing_phases_are_not_recorded(self):
+        # arrange
+        target = MemoryDiagnostics()
+
+        # act
+        FakeScanner(target).get_candidates(10)
+        FakeScanner(None).get_candidates(10)
+
+        # assert
+        self.assertEqual([], target.phases)
+
+    def test_the_peak_is_projected_linearly_to_the_library_size(self):
+        # arrange
+        target = MemoryDiagnostics()
+        target.start()
+        try:
+            FakeScanner(target).get_candidates(5000)
+        finally:
+            target.stop()
+        target.set_items(5000)
+
+        # act
+        actual = target.get_projected_peak(50000)
+
+        # assert
+        self.assertEqual(target.get_peak() * 10, actual)
+        self.assertEqual(target.get_peak(), target.get_projected_peak(0))
+        self.assertIn('Projected peak for 50000 items', target.get_summary(50000, 512 * MB))
+
+if __name__ == '__main__':
+    unittest.main()
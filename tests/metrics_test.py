@@ -0,0 +1,86 @@
+import unittest, os
+import tempfile
+import shutil
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.metrics import MetricsRegistry, parse_exposition
+
+class Test_metrics(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, 'metrics', 'akl.prom')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _read(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def test_counters_add_to_the_values_of_earlier_commands(self):
+        # arrange
+        for files in [100, 50]:
+            registry = MetricsRegistry()
+            registry.counter('akl_scan_files_total', 'Files found').inc(files, source='snes')
+            # act
+            registry.save(self.path)
+
+        # assert
+        self.assertIn('akl_scan_files_total{source="snes"} 150', self._read())
+        self.assertIn('# TYPE akl_scan_files_total counter', self._read())
+
+    def test_gauges_keep_the_last_value(self):
+        # arrange
+        for value in [10.5, 20.25]:
+            registry = MetricsRegistry()
+            registry.gauge('akl_files_per_second').set(value, source='snes')
+            registry.save(self.path)
+
+        # assert
+        self.assertIn('akl_files_per_second{source="snes"} 20.25', self._read())
+
+    def test_histogram_buckets_are_cumulative_and_merged(self):
+        # arrange
+        registry = MetricsRegistry()
+        histogram = registry.histogram('akl_launch_latency_seconds', buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        registry.save(self.path)
+        histogram.observe(5.0)
+
+        # act
+        registry.save(self.path)
+
+        # assert
+        samples = parse_exposition(self._read())['akl_launch_latency_seconds'].samples
+        self.assertEqual(1, samples[('akl_launch_latency_seconds_bucket', (('le', '0.1'),))])
+        self.assertEqual(2, samples[('akl_launch_latency_seconds_bucket', (('le', '1'),))])
+        self.assertEqual(3, samples[('akl_launch_latency_seconds_bucket', (('le', '+Inf'),))])
+        self.assertEqual(3, samples[('akl_launch_latency_seconds_count', ())])
+        self.assertAlmostEqual(5.55, samples[('akl_launch_latency_seconds_sum', ())])
+
+    def test_metrics_of_other_commands_are_kept(self):
+        # arrange
+        launch = MetricsRegistry()
+        launch.counter('akl_launch_failures_total').inc()
+        launch.save(self.path)
+
+        # act
+        scan = MetricsRegistry()
+        scan.counter('akl_scan_files_total').inc(3, source='a "quoted" name')
+        scan.save(self.path)
+
+        # assert
+        families = parse_exposition(self._read())
+        self.assertEqual(1, families['akl_launch_failures_total'].samples[('akl_launch_failures_total', ())])
+        self.assertEqual(3, families['akl_scan_files_total'].samples[('akl_scan_files_total', (('source', 'a "quoted" name'),))])
+        self.assertEqual([], [f for f in os.listdir(os.path.dirname(self.path)) if f.endswith('.tmp')])
+
+if __name__ == '__main__':
+    unittest.main()
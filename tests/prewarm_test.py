@@ -0,0 +1,60 @@
+import unittest, os
+import tempfile
+import shutil
+import time
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.prewarm import Prewarmer, prewarm_file
+
+class Test_prewarm(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.rom_path = os.path.join(self.test_dir, 'disc.iso')
+        with open(self.rom_path, 'wb') as f:
+            f.write(os.urandom(300 * 1024))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_prewarming_stops_at_the_limit(self):
+        # act
+        actual = prewarm_file(self.rom_path, 100 * 1024)
+
+        # assert
+        self.assertEqual(100 * 1024, actual)
+
+    def test_prewarmer_prewarms_each_file_once_and_skips_what_it_cannot_open(self):
+        # arrange
+        target = Prewarmer()
+
+        # act
+        target.start(self.rom_path)
+        target.start(self.rom_path)
+        target.start(os.path.join(self.test_dir, 'missing.iso'))
+        target.start('smb://nas/roms/disc.iso')
+        target.wait()
+
+        # assert
+        self.assertEqual(300 * 1024, target.bytes_prewarmed)
+
+    def test_prewarming_never_keeps_the_process_from_exiting(self):
+        # arrange
+        target = Prewarmer()
+
+        # act
+        target.start(self.rom_path)
+        spawned_at = time.perf_counter()
+        target.wait()
+
+        # assert
+        self.assertTrue(all(thread.daemon for thread in target.threads))
+        self.assertLessEqual(target.get_elapsed(spawned_at), target.get_elapsed())
+
+if __name__ == '__main__':
+    unittest.main()
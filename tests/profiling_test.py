@@ -0,0 +1,62 @@
+import unittest, os
+import tempfile
+import shutil
+import pstats
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.profiling import CommandProfile, get_profile_name
+
+def busy_scan():
+    return sum(i * i for i in range(200000))
+
+class Test_profiling(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_the_profile_is_written_as_pstats_and_summary(self):
+        # arrange
+        target = CommandProfile('scan-source1')
+        with target:
+            busy_scan()
+
+        # act
+        actual = target.write(self.test_dir)
+
+        # assert
+        self.assertEqual(['scan-source1.pstats', 'scan-source1.txt'], actual)
+        stats = pstats.Stats(os.path.join(self.test_dir, 'scan-source1.pstats'))
+        self.assertTrue(any(func[2] == 'busy_scan' for func in stats.stats))
+        with open(os.path.join(self.test_dir, 'scan-source1.txt'), 'r', encoding='utf-8') as f:
+            summary = f.read()
+        self.assertIn('Wall time:', summary)
+        self.assertIn('busy_scan', summary)
+
+    def test_wall_and_cpu_time_are_recorded(self):
+        # act
+        with CommandProfile('scan') as target:
+            busy_scan()
+
+        # assert
+        self.assertGreater(target.wall_time, 0)
+        self.assertGreater(target.thread_time, 0)
+        self.assertGreaterEqual(target.process_time, target.thread_time * 0.5)
+
+    def test_profile_names_are_safe_file_names(self):
+        # act
+        actual = get_profile_name('SCAN', 'a/b c', 0)
+
+        # assert
+        self.assertTrue(actual.startswith('SCAN-a_b_c-'))
+        self.assertNotIn('/', actual)
+
+if __name__ == '__main__':
+    unittest.main()
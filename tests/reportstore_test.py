@@ -0,0 +1,140 @@
+import unittest, os
+import unittest.mock
+import tempfile
+import shutil
+import time
+import gzip
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.reportstore import ReportStore, ReportLimits, CATEGORY_LAUNCH, CATEGORY_LEGACY
+
+class Test_reportstore(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write_report(self, store, file_name, entity, age_days=0, content='report\n'):
+        path = store.get_path(CATEGORY_LAUNCH, file_name)
+        with open(path, 'w') as f:
+            f.write(content)
+        report_time = time.time() - age_days * 24 * 3600
+        os.utime(path, (report_time, report_time))
+        store.register(CATEGORY_LAUNCH, file_name, entity)
+        return path
+
+    def test_registered_reports_are_read_from_the_index_of_their_category(self):
+        # arrange
+        store = ReportStore(self.test_dir)
+        self._write_report(store, 'a-rom1.txt', 'a-rom1', age_days=2)
+        self._write_report(store, 'a-rom1.txt', 'a-rom1')
+        self._write_report(store, 'a-rom2.txt', 'a-rom2')
+
+        # act
+        actual = ReportStore(self.test_dir).get_entries(CATEGORY_LAUNCH)
+
+        # assert
+        self.assertEqual(['a-rom1.txt', 'a-rom2.txt'], sorted(actual))
+        self.assertAlmostEqual(time.time(), actual['a-rom1.txt']['time'], delta=60)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, 'index.json')))
+
+    def test_newest_report_of_an_entity_is_found_through_the_index(self):
+        # arrange
+        store = ReportStore(self.test_dir)
+        self._write_report(store, 'a-rom1.old.txt', 'a-rom1', age_days=2)
+        expected = self._write_report(store, 'a-rom1.txt', 'a-rom1')
+        self._write_report(store, 'a-rom2.txt', 'a-rom2')
+
+        # act
+        with unittest.mock.patch('os.listdir', side_effect=AssertionError), \
+                unittest.mock.patch('os.scandir', side_effect=AssertionError):
+            actual = ReportStore(self.test_dir).find_latest(CATEGORY_LAUNCH, 'a-rom1')
+            missing = ReportStore(self.test_dir).find_latest(CATEGORY_LAUNCH, 'a-rom3')
+
+        # assert
+        self.assertEqual(expected, actual)
+        self.assertIsNone(missing)
+
+    def test_registering_appends_without_reading_the_index(self):
+        # arrange
+        store = ReportStore(self.test_dir)
+        self._write_report(store, 'a-rom1.txt', 'a-rom1')
+        index_path = os.path.join(self.test_dir, CATEGORY_LAUNCH, ReportStore.INDEX_FILE)
+        with open(index_path, 'a') as f:
+            f.write('{"file": "a-rom2.t')
+
+        # act
+        with unittest.mock.patch.object(ReportStore, 'get_entries', side_effect=AssertionError):
+            self._write_report(store, 'a-rom3.txt', 'a-rom3')
+
+        # assert
+        self.assertEqual(['a-rom1.txt', 'a-rom3.txt'], sorted(store.get_entries(CATEGORY_LAUNCH)))
+
+    def test_older_reports_are_compressed_and_expired_reports_deleted(self):
+        # arrange
+        store = ReportStore(self.test_dir, default_limits=ReportLimits(max_age_days=30, compress_after_days=1))
+        self._write_report(store, 'a-rom1.txt', 'a-rom1', age_days=0)
+        old_path = self._write_report(store, 'a-rom2.txt', 'a-rom2', age_days=5, content='old report\n')
+        expired_path = self._write_report(store, 'a-rom3.txt', 'a-rom3', age_days=40)
+
+        # act
+        store.prune(CATEGORY_LAUNCH)
+
+        # assert
+        self.assertFalse(os.path.exists(old_path))
+        self.assertFalse(os.path.exists(expired_path))
+        with gzip.open(old_path + '.gz', 'rt') as f:
+            self.assertEqual('old report\n', f.read())
+        self.assertEqual(['a-rom1.txt', 'a-rom2.txt.gz'], sorted(store.get_entries(CATEGORY_LAUNCH)))
+        self.assertEqual(old_path + '.gz', store.find_latest(CATEGORY_LAUNCH, 'a-rom2'))
+        self.assertIsNone(store.find_latest(CATEGORY_LAUNCH, 'a-rom3'))
+
+    def test_a_category_is_pruned_at_most_once_an_hour(self):
+        # arrange
+        store = ReportStore(self.test_dir, default_limits=ReportLimits(max_age_days=30))
+        store.prune(CATEGORY_LAUNCH)
+        expired_path = self._write_report(store, 'a-rom3.txt', 'a-rom3', age_days=40)
+
+        # act
+        store.prune(CATEGORY_LAUNCH)
+
+        # assert
+        self.assertTrue(os.path.exists(expired_path))
+
+    def test_oldest_reports_are_deleted_when_the_category_is_too_big(self):
+        # arrange
+        store = ReportStore(self.test_dir, default_limits=ReportLimits(max_size_mb=1, compress_after_days=0))
+        for i in range(5):
+            self._write_report(store, f'a-rom{i}.txt', f'a-rom{i}', age_days=5 - i, content='x' * 300 * 1024)
+
+        # act
+        store.prune(CATEGORY_LAUNCH)
+
+        # assert
+        self.assertLessEqual(store.get_total_size(CATEGORY_LAUNCH), 1024 * 1024)
+        entries = store.get_entries(CATEGORY_LAUNCH)
+        self.assertNotIn('a-rom0.txt', entries)
+        self.assertIn('a-rom4.txt', entries)
+
+    def test_reports_from_before_the_store_are_moved_into_the_legacy_category(self):
+        # arrange
+        with open(os.path.join(self.test_dir, 'a-rom1.txt'), 'w') as f:
+            f.write('report')
+        store = ReportStore(self.test_dir)
+
+        # act
+        store.prune(CATEGORY_LEGACY)
+
+        # assert
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, CATEGORY_LEGACY, 'a-rom1.txt')))
+        self.assertEqual('a-rom1', store.get_entries(CATEGORY_LEGACY)['a-rom1.txt']['entity'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,16 +32,16 @@ class Test_romscannerstests(unittest.TestCase):
         print('---------------------------------------------------------------------------')
     
     @patch('akl.api.client_get_source_scanner_settings')
-    @patch('resources.lib.scanner.io.FileName.recursiveScanFilesInPath')
+    @patch('resources.lib.scanner.filewalk.DirectoryWalker.walk')
     def test_when_scanning_with_a_normal_rom_scanner_it_will_go_without_exceptions(self, recursive_scan_mock:MagicMock, api_settings_mock:MagicMock):
         
         # arrange
         recursive_scan_mock.return_value = [
-           FakeFile('//fake/folder/myfile.dot'),
-           FakeFile('//fake/folder/donkey_kong.zip'), 
-           FakeFile('//fake/folder/tetris.zip'), 
-           FakeFile('//fake/folder/thumbs.db'),
-           FakeFile('//fake/folder/duckhunt.zip')]
+           '//fake/folder/myfile.dot',
+           '//fake/folder/donkey_kong.zip', 
+           '//fake/folder/tetris.zip', 
+           '//fake/folder/thumbs.db',
+           '//fake/folder/duckhunt.zip']
         api_settings_mock.return_value = {
             'multidisc': False,
             'romext': 'zip',
@@ -60,16 +60,16 @@ class Test_romscannerstests(unittest.TestCase):
     @patch('resources.lib.scanner.io.FileName.exists_python',autospec=True)   
     @patch('akl.api.client_get_roms_in_source')
     @patch('akl.api.client_get_source_scanner_settings')
-    @patch('resources.lib.scanner.io.FileName.recursiveScanFilesInPath')
+    @patch('resources.lib.scanner.filewalk.DirectoryWalker.walk')
     def test_when_scanning_with_a_normal_rom_scanner_dead_roms_will_be_removed(self, 
             recursive_scan_mock:MagicMock, api_settings_mock:MagicMock, api_roms_mock:MagicMock, file_exists_mock:MagicMock):
         # arrange
         scanner_id = random_string(5)
         
         recursive_scan_mock.return_value = [
-           FakeFile('//fake/folder/myfile.dot'),
-           FakeFile('//fake/folder/donkey_kong.zip'), 
-           FakeFile('//fake/folder/tetris.zip')]
+           '//fake/folder/myfile.dot',
+           '//fake/folder/donkey_kong.zip', 
+           '//fake/folder/tetris.zip']
         api_settings_mock.return_value = {
             'multidisc': False,
             'romext': 'zip',
@@ -98,7 +98,7 @@ class Test_romscannerstests(unittest.TestCase):
     @patch('resources.lib.scanner.io.FileName.exists_python', autospec=True)    
     @patch('akl.api.client_get_roms_in_source')
     @patch('akl.api.client_get_source_scanner_settings')
-    @patch('resources.lib.scanner.io.FileName.recursiveScanFilesInPath')
+    @patch('resources.lib.scanner.filewalk.DirectoryWalker.walk')
     def test_when_scanning_with_a_normal_rom_scanner_multidiscs_will_be_put_together(self, 
             recursive_scan_mock:MagicMock, api_settings_mock:MagicMock, api_roms_mock:MagicMock, file_exists_mock:MagicMock):
         
@@ -106,10 +106,10 @@ class Test_romscannerstests(unittest.TestCase):
         scanner_id = random_string(5)
         
         recursive_scan_mock.return_value = [
-           FakeFile('//fake/folder/zekda.zip'),
-           FakeFile('//fake/folder/donkey kong (Disc 1 of 2).zip'), 
-           FakeFile('//fake/folder/donkey kong (Disc 2 of 2).zip'), 
-           FakeFile('//fake/folder/tetris.zip')]
+           '//fake/folder/zekda.zip',
+           '//fake/folder/donkey kong (Disc 1 of 2).zip', 
+           '//fake/folder/donkey kong (Disc 2 of 2).zip', 
+           '//fake/folder/tetris.zip']
         api_settings_mock.return_value = {
             'multidisc': True,
             'romext': 'zip',
@@ -142,16 +142,16 @@ class Test_romscannerstests(unittest.TestCase):
     @patch('resources.lib.scanner.io.FileName.exists_python', autospec=True)    
     @patch('akl.api.client_get_roms_in_source')
     @patch('akl.api.client_get_source_scanner_settings')
-    @patch('resources.lib.scanner.io.FileName.recursiveScanFilesInPath')
+    @patch('resources.lib.scanner.filewalk.DirectoryWalker.walk')
     def test_when_scanning_with_a_normal_rom_scanner_existing_items_wont_end_up_double(self, 
             recursive_scan_mock:MagicMock, api_settings_mock:MagicMock, api_roms_mock:MagicMock, file_exists_mock:MagicMock):        
         # arrange
         scanner_id = random_string(5)
         
         recursive_scan_mock.return_value = [
-           FakeFile('//fake/folder/zelda.zip'),
-           FakeFile('//fake/folder/donkey kong.zip'), 
-           FakeFile('//fake/folder/tetris.zip')]
+           '//fake/folder/zelda.zip',
+           '//fake/folder/donkey kong.zip', 
+           '//fake/folder/tetris.zip']
         api_settings_mock.return_value = {
             'multidisc': False,
             'romext': 'zip',
@@ -186,15 +186,15 @@ class Test_romscannerstests(unittest.TestCase):
     @patch('resources.lib.scanner.io.FileName.exists_python', autospec=True)    
     @patch('akl.api.client_get_roms_in_source')
     @patch('akl.api.client_get_source_scanner_settings')
-    @patch('resources.lib.scanner.io.FileName.recursiveScanFilesInPath')
+    @patch('resources.lib.scanner.filewalk.DirectoryWalker.walk')
     def test_when_scanning_with_a_normal_rom_scanner_and_bios_roms_must_be_skipped_they_wont_be_added(self,
             recursive_scan_mock:MagicMock, api_settings_mock:MagicMock, api_roms_mock:MagicMock, file_exists_mock:MagicMock):
         # arrange
         scanner_id = random_string(5)
         
         recursive_scan_mock.return_value = [
-           FakeFile('//fake/folder/zelda.zip'),
-           FakeFile('//fake/folder/donkey kong.zip'), 
+           '//fake/folder/zelda.zip',
+           '//fake/folder/donkey kong.zip', 
            FakeFile('//fake/folder/[BIOS] dinkytoy.zip'), 
            FakeFile('//fake/folder/tetris.zip')]
         api_settings_mock.return_value = {
@@ -228,5 +228,126 @@ class Test_romscannerstests(unittest.TestCase):
 
         self.assertEqual(expected, target.amount_of_scanned_roms())
 
+    @patch('resources.lib.scanner.io.FileName.saveStrToFile', autospec=True)
+    @patch('resources.lib.scanner.io.FileName.loadFileToStr', autospec=True)
+    @patch('resources.lib.scanner.io.FileName.exists_python', autospec=True)
+    @patch('akl.api.client_get_roms_in_source')
+    @patch('akl.api.client_get_source_scanner_settings')
+    @patch('resources.lib.scanner.filewalk.DirectoryWalker.walk')
+    def test_when_scanning_multidiscs_with_playlists_the_set_becomes_one_rom_with_a_m3u(self,
+            recursive_scan_mock:MagicMock, api_settings_mock:MagicMock, api_roms_mock:MagicMock, file_exists_mock:MagicMock,
+            load_mock:MagicMock, save_mock:MagicMock):
+
+        # arrange
+        recursive_scan_mock.return_value = [
+           '//fake/folder/zekda.zip',
+           '//fake/folder/donkey kong (Disc 2 of 2).zip',
+           '//fake/folder/donkey kong (Disc 1 of 2).zip',
+           '//fake/folder/tetris.zip']
+        api_settings_mock.return_value = {
+            'multidisc': True,
+            'multidisc_m3u': 'SOURCE',
+            'romext': 'zip',
+            'scan_recursive': True
+        }
+        api_roms_mock.return_value = []
+        file_exists_mock.side_effect = lambda f: f.getPath().startswith('//fake/')
+        load_mock.return_value = ''
+
+        report_dir = FakeFile('//fake_reports/')
+        target = RomFolderScanner(report_dir, random_string(5), None, 0, FakeProgressDialog())
+
+        # act
+        target.scan()
+
+        # assert
+        self.assertEqual(3, target.amount_of_scanned_roms())
+        playlist_roms = [r for r in target.scanned_roms if r.get_scanned_data_element_as_file('file').getExt() == '.m3u']
+        self.assertEqual(1, len(playlist_roms))
+        self.assertEqual('donkey kong', playlist_roms[0].get_name())
+        save_mock.assert_called_once()
+        self.assertEqual('donkey kong (Disc 1 of 2).zip\ndonkey kong (Disc 2 of 2).zip\n', save_mock.call_args[0][1])
+
+    @patch('resources.lib.scanner.io.FileName.exists_python', autospec=True)
+    @patch('akl.api.client_get_roms_in_source')
+    @patch('akl.api.client_get_source_scanner_settings')
+    @patch('resources.lib.scanner.filewalk.DirectoryWalker.walk')
+    def test_when_scanning_dead_and_existing_roms_are_found_in_one_pass(self,
+            recursive_scan_mock:MagicMock, api_settings_mock:MagicMock, api_roms_mock:MagicMock, file_exists_mock:MagicMock):
+        # arrange
+        scanner_id = random_string(5)
+
+        recursive_scan_mock.return_value = [
+           '//fake/folder/rocket.zip',
+           '//fake/folder/tetris.zip']
+        api_settings_mock.return_value = {
+            'multidisc': False,
+            'romext': 'zip',
+            'scan_recursive': True
+        }
+
+        roms = []
+        roms.append(ROMObj({'id': '1', 'm_name': 'this-one-will-be-deleted', 'scanned_data': { 'file': '//not-existing/byebye.zip'}}))
+        roms.append(ROMObj({'id': '2', 'm_name': 'Rocket League', 'scanned_data': { 'file': '//fake/folder/rocket.zip'}}))
+        api_roms_mock.return_value = roms
+
+        file_exists_mock.side_effect = lambda f: f.getPath().startswith('//fake/')
+        report_dir = FakeFile('//fake_reports/')
+        target = RomFolderScanner(report_dir, scanner_id, None, 0, FakeProgressDialog())
+
+        # act
+        target.scan()
+
+        # assert
+        self.assertEqual(1, target.amount_of_dead_roms())
+        self.assertEqual(1, target.amount_of_scanned_roms())
+        self.assertEqual('tetris.zip', target.scanned_roms[0].get_scanned_data_element_as_file('file').getBase())
+
+    @patch('resources.lib.scanner.romidentity.supports_moves', return_value=True)
+    @patch('resources.lib.scanner.romidentity.get_file_identity')
+    @patch('resources.lib.scanner.io.FileName.exists_python', autospec=True)
+    @patch('akl.api.client_get_roms_in_source')
+    @patch('akl.api.client_get_source_scanner_settings')
+    @patch('resources.lib.scanner.filewalk.DirectoryWalker.walk')
+    def test_when_scanning_with_move_detection_moved_roms_are_not_removed_and_added(self,
+            recursive_scan_mock:MagicMock, api_settings_mock:MagicMock, api_roms_mock:MagicMock,
+            file_exists_mock:MagicMock, identity_mock:MagicMock, supports_moves_mock:MagicMock):
+        # arrange
+        scanner_id = random_string(5)
+        recursive_scan_mock.return_value = [
+           '//fake/folder/nintendo/tetris.zip',
+           '//fake/folder/duckhunt.zip']
+        api_settings_mock.return_value = {
+            'multidisc': False,
+            'romext': 'zip',
+            'scan_recursive': True
+        }
+        identities = {
+            '//fake/folder/nintendo/tetris.zip': {'dev': 1, 'ino': 20, 'size': 100, 'mtime': 1000},
+            '//fake/folder/duckhunt.zip': {'dev': 1, 'ino': 21, 'size': 300, 'mtime': 1000}
+        }
+        identity_mock.side_effect = lambda path, partial_hash: identities.get(path)
+
+        roms = []
+        roms.append(ROMObj({'id': '1', 'm_name': 'Tetris', 'scanned_data': {
+            'file': '//not-existing/tetris.zip', 'identity': {'dev': 1, 'ino': 20, 'size': 100, 'mtime': 1000}}}))
+        roms.append(ROMObj({'id': '2', 'm_name': 'Zelda', 'scanned_data': {'file': '//not-existing/zelda.zip'}}))
+        api_roms_mock.return_value = roms
+
+        file_exists_mock.side_effect = lambda f: f.getPath().startswith('//fake/')
+        report_dir = FakeFile('//fake_reports/')
+        target = RomFolderScanner(report_dir, scanner_id, None, 0, FakeProgressDialog(), detect_moves=True)
+
+        # act
+        target.scan()
+
+        # assert
+        self.assertEqual(1, target.amount_of_moved_roms())
+        dead_rom, new_rom = target.moved_roms[0]
+        self.assertEqual('1', dead_rom.get_id())
+        self.assertEqual('//fake/folder/nintendo/tetris.zip', new_rom.get_scanned_data_element('file'))
+        self.assertEqual(1, target.amount_of_dead_roms())
+        self.assertEqual(1, target.amount_of_scanned_roms())
+
 if __name__ == '__main__':    
     unittest.main()
@@ -0,0 +1,130 @@
+import unittest, os
+import tempfile
+import shutil
+import struct
+import zipfile
+import unittest.mock
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.romheaders import RomHeaderReader, read_rom_header
+
+def gameboy_rom(title: bytes) -> bytes:
+    data = bytearray(0x8000)
+    data[0x134:0x134 + len(title)] = title
+    data[0x14A] = 0x01
+    data[0x14B] = 0x01
+    checksum = 0
+    for value in data[0x134:0x14D]:
+        checksum = (checksum - value - 1) & 0xFF
+    data[0x14D] = checksum
+    data[0x14E:0x150] = b'\x12\x34'
+    return bytes(data)
+
+def snes_rom(title: bytes) -> bytes:
+    data = bytearray(0x80000)
+    data[0x7FC0:0x7FC0 + 21] = title.ljust(21, b' ')
+    data[0x7FD9] = 0x01
+    data[0x7FDA] = 0x01
+    struct.pack_into('<HH', data, 0x7FDC, 0xFFFF ^ 0xABCD, 0xABCD)
+    return bytes(data)
+
+def n64_rom(title: bytes) -> bytes:
+    data = bytearray(0x1000)
+    data[0:4] = b'\x80\x37\x12\x40'
+    data[0x20:0x20 + len(title)] = title.ljust(20, b' ')
+    data[0x3B:0x3F] = b'NSME'
+    return bytes(data)
+
+class Test_romheaders(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_reading_a_gameboy_header_gives_title_region_and_checksum(self):
+        # arrange
+        path = self._write('tetris.gb', gameboy_rom(b'TETRIS'))
+
+        # act
+        actual = read_rom_header(path)
+
+        # assert
+        self.assertEqual('Tetris', actual['title'])
+        self.assertEqual('World', actual['region'])
+        self.assertEqual('1234', actual['checksum'])
+
+    def test_reading_a_snes_header_with_copier_header(self):
+        # arrange
+        path = self._write('smw.smc', b'\x00' * 512 + snes_rom(b'SUPER MARIOWORLD'))
+
+        # act
+        actual = read_rom_header(path)
+
+        # assert
+        self.assertEqual('Super Marioworld', actual['title'])
+        self.assertEqual('USA', actual['region'])
+        self.assertEqual('ABCD', actual['checksum'])
+
+    def test_reading_a_byteswapped_n64_header(self):
+        # arrange
+        data = n64_rom(b'SUPER MARIO 64')
+        swapped = bytes(b for pair in zip(data[1::2], data[0::2]) for b in pair)
+        path = self._write('sm64.v64', swapped)
+
+        # act
+        actual = read_rom_header(path)
+
+        # assert
+        self.assertEqual('Super Mario 64', actual['title'])
+        self.assertEqual('USA', actual['region'])
+        self.assertEqual('NSME', actual['serial'])
+
+    def test_reading_the_header_of_the_first_entry_in_a_zip(self):
+        # arrange
+        path = os.path.join(self.test_dir, 'tetris.zip')
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('tetris.gb', gameboy_rom(b'TETRIS'))
+
+        # act
+        actual = read_rom_header(path)
+
+        # assert
+        self.assertEqual('Tetris', actual['title'])
+
+    def test_unknown_or_invalid_roms_have_no_header(self):
+        self.assertIsNone(read_rom_header(self._write('game.iso', b'\x00' * 4096)))
+        self.assertIsNone(read_rom_header(self._write('broken.gb', b'\xff' * 0x200)))
+
+    def test_cached_headers_are_not_read_again(self):
+        # arrange
+        path = self._write('tetris.gb', gameboy_rom(b'TETRIS'))
+        first_run = RomHeaderReader(self.test_dir)
+        first_run.read_all([path])
+        first_run.save()
+
+        target = RomHeaderReader(self.test_dir)
+        target.load()
+
+        # act
+        with unittest.mock.patch('resources.lib.romheaders.read_rom_header') as read_mock:
+            actual = target.read_all([path])
+
+        # assert
+        read_mock.assert_not_called()
+        self.assertEqual('Tetris', actual[path]['title'])
+
+if __name__ == '__main__':
+    unittest.main()
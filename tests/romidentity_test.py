@@ -0,0 +1,143 @@
+import unittest, os
+import tempfile
+import shutil
+import urllib.error
+from unittest.mock import patch, MagicMock
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib import romidentity
+from resources.lib.romidentity import get_file_identity, match_moves
+
+class Test_romidentity(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+        romidentity._moves_supported.clear()
+
+    def _create_file(self, name, content):
+        path = os.path.join(self.test_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_a_renamed_file_keeps_its_identity(self):
+        # arrange
+        path = self._create_file('snes/Tetris (USA).zip', b'PK' + b'x' * 200000)
+        expected = get_file_identity(path, partial_hash=True)
+        new_path = os.path.join(self.test_dir, 'nintendo snes', 'Tetris.zip')
+        os.makedirs(os.path.dirname(new_path))
+
+        # act
+        os.rename(path, new_path)
+        actual = get_file_identity(new_path, partial_hash=True)
+
+        # assert
+        self.assertEqual(expected, actual)
+        self.assertIn('hash', actual)
+
+    def test_files_that_are_not_local_have_no_identity(self):
+        # act / assert
+        self.assertIsNone(get_file_identity('smb://nas/roms/tetris.zip'))
+        self.assertIsNone(get_file_identity(os.path.join(self.test_dir, 'missing.zip')))
+
+    def test_dead_and_new_roms_with_the_same_inode_are_moves(self):
+        # arrange
+        dead = [('dead1', {'dev': 1, 'ino': 10, 'size': 5, 'mtime': 100}),
+                ('dead2', {'dev': 1, 'ino': 11, 'size': 5, 'mtime': 100})]
+        new = [('new2', {'dev': 1, 'ino': 11, 'size': 5, 'mtime': 100}),
+               ('new3', {'dev': 1, 'ino': 12, 'size': 7, 'mtime': 100})]
+
+        # act
+        actual = match_moves(dead, new)
+
+        # assert
+        self.assertEqual([('dead2', 'new2')], actual)
+
+    def test_a_new_file_reusing_the_inode_of_a_deleted_rom_is_no_move(self):
+        # arrange
+        dead = [('dead1', {'dev': 1, 'ino': 10, 'size': 5, 'mtime': 100})]
+        new = [('new1', {'dev': 1, 'ino': 10, 'size': 5, 'mtime': 900})]
+
+        # act
+        actual = match_moves(dead, new)
+
+        # assert
+        self.assertEqual([], actual)
+
+    def test_moves_to_another_file_system_match_on_size_and_mtime_only_when_unique(self):
+        # arrange
+        dead = [('dead1', {'dev': 1, 'ino': 10, 'size': 5, 'mtime': 100}),
+                ('dead2', {'dev': 1, 'ino': 11, 'size': 9, 'mtime': 200}),
+                ('dead3', {'dev': 1, 'ino': 12, 'size': 9, 'mtime': 200})]
+        new = [('new1', {'dev': 2, 'ino': 50, 'size': 5, 'mtime': 100}),
+               ('new2', {'dev': 2, 'ino': 51, 'size': 9, 'mtime': 200})]
+
+        # act
+        actual = match_moves(dead, new)
+
+        # assert
+        self.assertEqual([('dead1', 'new1')], actual)
+
+    def test_different_partial_hashes_are_no_move(self):
+        # arrange
+        dead = [('dead1', {'dev': 1, 'ino': 10, 'size': 5, 'mtime': 100, 'hash': 'aa'})]
+        new = [('new1', {'dev': 2, 'ino': 50, 'size': 5, 'mtime': 100, 'hash': 'bb'})]
+
+        # act
+        actual = match_moves(dead, new)
+
+        # assert
+        self.assertEqual([], actual)
+
+    @patch('resources.lib.romidentity.urllib.request.urlopen')
+    def test_the_webserver_is_asked_for_moves_support_once(self, urlopen_mock:MagicMock):
+        # arrange
+        urlopen_mock.side_effect = urllib.error.HTTPError('http://localhost:8080/', 404, 'Not Found', {}, None)
+
+        # act
+        first = romidentity.supports_moves('localhost', 8080)
+        second = romidentity.supports_moves('localhost', 8080)
+
+        # assert
+        self.assertFalse(first)
+        self.assertFalse(second)
+        self.assertEqual(1, urlopen_mock.call_count)
+
+    @patch('resources.lib.romidentity.urllib.request.urlopen')
+    def test_a_webserver_taking_posts_of_moved_roms_supports_moves(self, urlopen_mock:MagicMock):
+        # arrange
+        response = urlopen_mock.return_value.__enter__.return_value
+        response.headers = {'Allow': 'OPTIONS, POST'}
+
+        # act
+        actual = romidentity.supports_moves('localhost', 8080)
+
+        # assert
+        self.assertTrue(actual)
+        self.assertEqual('OPTIONS', urlopen_mock.call_args[0][0].get_method())
+
+    @patch('resources.lib.romidentity.urllib.request.urlopen')
+    def test_an_unreachable_webserver_does_not_support_moves(self, urlopen_mock:MagicMock):
+        # arrange
+        urlopen_mock.side_effect = urllib.error.URLError('refused')
+
+        # act
+        first = romidentity.supports_moves('localhost', 8080)
+        second = romidentity.supports_moves('localhost', 8080)
+
+        # assert
+        self.assertFalse(first)
+        self.assertFalse(second)
+        self.assertEqual(1, urlopen_mock.call_count)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest, os
+import tempfile
+import shutil
+import threading
+import time
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.scheduler import ScheduleStore, PausingProgressDialog, BackgroundScheduler, lower_thread_priority, HOUR
+
+class Test_scheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.store = ScheduleStore(os.path.join(self.test_dir, 'scheduler.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_sources_are_due_after_their_interval_the_longest_overdue_first(self):
+        # arrange
+        now = time.time()
+        self.store.register('snes', '127.0.0.1', 8080)
+        self.store.register('psx', '127.0.0.1', 8080)
+        self.store.register('n64', '127.0.0.1', 8080, interval_hours=2)
+        self.store.register('mame', '127.0.0.1', 8080, interval_hours=0)
+        self.store.record_scan('snes', now - 30 * HOUR, 12.5, 3, 1)
+        self.store.record_scan('psx', now - 10 * HOUR, 2.0, 0, 0)
+        self.store.record_scan('n64', now - 3 * HOUR, 1.0, 0, 0)
+
+        # act
+        actual = self.store.get_due(now, 24)
+
+        # assert
+        self.assertEqual(['snes', 'n64'], [source_id for source_id, _ in actual])
+        self.assertEqual(3, actual[0][1]['last_roms_added'])
+        self.assertEqual(1, actual[0][1]['scans'])
+
+    def test_a_failed_attempt_postpones_the_next_run(self):
+        # arrange
+        now = time.time()
+        self.store.register('snes', '127.0.0.1', 8080)
+
+        # act
+        self.store.record_attempt('snes', now)
+        self.store.record_failure('snes', 'Connection refused')
+
+        # assert
+        self.assertEqual([], self.store.get_due(now, 24))
+        source = self.store.get_sources()['snes']
+        self.assertEqual('Connection refused', source['last_result'])
+        self.assertEqual(1, source['failures'])
+
+    def test_unknown_sources_are_not_updated(self):
+        # act
+        self.store.update('snes', scrape=True)
+        self.store.record_scan('snes', time.time(), 1.0, 0, 0)
+
+        # assert
+        self.assertEqual({}, self.store.get_sources())
+
+    def test_the_pausing_dialog_waits_until_the_scan_may_go_on(self):
+        # arrange
+        checks = [True, True, True, False]
+        target = PausingProgressDialog(lambda: checks.pop(0) if checks else False, lambda: False, poll_interval=0.01)
+
+        # act
+        target.incrementStep()
+
+        # assert
+        self.assertEqual([], checks)
+        self.assertGreater(target.paused_time, 0)
+        self.assertFalse(target.isCanceled())
+
+    def test_the_pausing_dialog_cancels_when_stopping(self):
+        # arrange
+        stopping = threading.Event()
+        target = PausingProgressDialog(lambda: True, stopping.is_set, poll_interval=0.01)
+        threading.Timer(0.05, stopping.set).start()
+
+        # act
+        target.updateProgress(1)
+
+        # assert
+        self.assertTrue(target.isCanceled())
+
+    def test_due_sources_are_not_run_while_blocked(self):
+        # arrange
+        self.store.register('snes', '127.0.0.1', 8080)
+        ran = []
+        target = BackgroundScheduler(self.store, lambda *args: ran.append(args), lambda: True, lambda: True, 24)
+
+        # act
+        actual = target.run_due_sources()
+
+        # assert
+        self.assertEqual(0, actual)
+        self.assertEqual([], ran)
+
+    def test_due_sources_are_not_run_while_commands_hold_the_lock(self):
+        # arrange
+        self.store.register('snes', '127.0.0.1', 8080)
+        ran = []
+        lock = threading.Lock()
+        target = BackgroundScheduler(self.store, lambda *args: ran.append(args), lambda: True, lambda: False, 24, lock=lock)
+
+        # act
+        with lock:
+            actual = target.run_due_sources()
+
+        # assert
+        self.assertEqual(0, actual)
+        self.assertEqual([], ran)
+
+    def test_failing_sources_are_recorded_and_the_others_still_run(self):
+        # arrange
+        self.store.register('snes', '127.0.0.1', 8080)
+        self.store.register('psx', '127.0.0.1', 8080)
+        ran = []
+
+        def run_source(source_id, source, progress_dialog):
+            ran.append(source_id)
+            if source_id == 'snes':
+                raise ConnectionError('Connection refused')
+
+        target = BackgroundScheduler(self.store, run_source, lambda: True, lambda: False, 24)
+
+        # act
+        actual = target.run_due_sources()
+
+        # assert
+        self.assertEqual(2, actual)
+        self.assertEqual(['psx', 'snes'], sorted(ran))
+        sources = self.store.get_sources()
+        self.assertEqual('Connection refused', sources['snes']['last_result'])
+        self.assertNotIn('failures', sources['psx'])
+        self.assertEqual([], self.store.get_due(time.time(), 24))
+
+    def test_lowering_the_priority_of_a_thread_never_fails(self):
+        # arrange
+        result = []
+        thread = threading.Thread(target=lambda: result.append(lower_thread_priority()))
+
+        # act
+        thread.start()
+        thread.join()
+
+        # assert
+        self.assertIsInstance(result[0], list)
+
+if __name__ == '__main__':
+    unittest.main()
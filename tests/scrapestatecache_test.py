@@ -0,0 +1,118 @@
+import unittest, os
+import tempfile
+import shutil
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.scrapecache import ScrapeStateCache, fingerprint, settings_digest
+
+class Test_scrapestatecache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.rom_path = os.path.join(self.test_dir, 'pitfall.zip')
+        with open(self.rom_path, 'wb') as f:
+            f.write(b'rom')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_when_nothing_changed_the_rom_will_be_skipped(self):
+        # arrange
+        nfo_path = os.path.join(self.test_dir, 'pitfall.nfo')
+        target = ScrapeStateCache(self.test_dir)
+        target.update('1', fingerprint([self.rom_path, nfo_path]))
+
+        # act
+        actual = target.is_unchanged('1', fingerprint([self.rom_path, nfo_path]))
+
+        # assert
+        self.assertTrue(actual)
+
+    def test_when_a_sidecar_file_appears_the_rom_will_be_scraped_again(self):
+        # arrange
+        nfo_path = os.path.join(self.test_dir, 'pitfall.nfo')
+        target = ScrapeStateCache(self.test_dir)
+        target.update('1', fingerprint([self.rom_path, nfo_path]))
+
+        with open(nfo_path, 'w') as f:
+            f.write('<game/>')
+
+        # act
+        actual = target.is_unchanged('1', fingerprint([self.rom_path, nfo_path]))
+
+        # assert
+        self.assertFalse(actual)
+
+    def test_when_the_cache_is_full_the_least_recently_used_roms_are_dropped(self):
+        # arrange
+        target = ScrapeStateCache(self.test_dir, max_entries=3)
+        for rom_id in ['1', '2', '3']:
+            target.update(rom_id, 'abc')
+
+        # act
+        target.is_unchanged('1', 'abc')
+        target.update('4', 'abc')
+
+        # assert
+        self.assertEqual(3, len(target))
+        self.assertTrue(target.is_unchanged('1', 'abc'))
+        self.assertFalse(target.is_unchanged('2', 'abc'))
+
+    def test_saved_state_will_be_loaded_in_the_next_run(self):
+        # arrange
+        rom_fingerprint = fingerprint([self.rom_path])
+        first_run = ScrapeStateCache(self.test_dir)
+        first_run.update('1', rom_fingerprint)
+        first_run.save()
+
+        # act
+        target = ScrapeStateCache(self.test_dir)
+        target.load()
+
+        # assert
+        self.assertTrue(target.is_unchanged('1', rom_fingerprint))
+
+    def test_a_scraped_rom_is_skipped_in_the_next_run(self):
+        # arrange
+        asset_dir = os.path.join(self.test_dir, 'boxfronts')
+        os.makedirs(asset_dir)
+        asset_path = os.path.join(asset_dir, 'pitfall.png')
+        paths = [self.rom_path, asset_path, asset_dir]
+        signatures = {}
+        first_run = ScrapeStateCache(self.test_dir)
+        self.assertFalse(first_run.is_unchanged('1', fingerprint(paths, signatures)))
+
+        # the scrape places the asset after the signatures were memoized
+        with open(asset_path, 'wb') as f:
+            f.write(b'PNG')
+        first_run.update('1', fingerprint(paths, signatures, refresh=True))
+        first_run.save()
+
+        # act
+        target = ScrapeStateCache(self.test_dir)
+        target.load()
+        actual = target.is_unchanged('1', fingerprint(paths, {}))
+
+        # assert
+        self.assertTrue(actual)
+
+    def test_when_the_scrape_settings_changed_the_rom_will_be_scraped_again(self):
+        # arrange
+        target = ScrapeStateCache(self.test_dir)
+        assets_only = settings_digest({'version': 1, 'scraper_settings': {'scrape_metadata_policy': 0}})
+        target.update('1', fingerprint([self.rom_path], salt=assets_only))
+
+        # act
+        with_metadata = settings_digest({'version': 1, 'scraper_settings': {'scrape_metadata_policy': 1}})
+        actual = target.is_unchanged('1', fingerprint([self.rom_path], salt=with_metadata))
+
+        # assert
+        self.assertFalse(actual)
+
+if __name__ == '__main__':
+    unittest.main()
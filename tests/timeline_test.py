@@ -0,0 +1,73 @@
+import unittest, os
+import tempfile
+import shutil
+import json
+import time
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib.timeline import LaunchTimeline, aggregate, read_timelines, format_stats
+
+class Test_timeline(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_phases_are_recorded_in_order_and_repeated_phases_add_up(self):
+        # arrange
+        target = LaunchTimeline('launcher1', 'rom1')
+
+        # act
+        target.mark('settings')
+        with target.measure('webserver'):
+            pass
+        with target.measure('webserver'):
+            pass
+        target.mark('return')
+
+        # assert
+        self.assertEqual(['settings', 'webserver', 'return'], list(target.phases.keys()))
+        self.assertLessEqual(sum(target.phases.values()), target.get_total())
+
+    def test_the_spawn_start_is_when_the_application_was_started_not_when_it_returned(self):
+        # arrange
+        target = LaunchTimeline('launcher1', 'rom1')
+        target.mark('settings')
+
+        # act
+        with target.measure('run'):
+            started = time.perf_counter()
+            time.sleep(0.05)
+        target.mark('return')
+
+        # assert
+        self.assertLessEqual(target.get_spawn_start(), started)
+        self.assertGreaterEqual(target.last - target.get_spawn_start(), 0.05)
+
+    def test_written_launches_are_aggregated_per_phase(self):
+        # arrange
+        path = os.path.join(self.test_dir, 'launcher1-rom1.timeline.jsonl')
+        with open(path, 'w') as f:
+            for i in range(1, 21):
+                f.write(json.dumps({'total_ms': i * 10.0, 'phases': {'settings': float(i), 'spawn': i * 9.0}}) + '\n')
+            f.write('{broken\n')
+        LaunchTimeline('launcher1', 'rom2').write(os.path.join(self.test_dir, 'launcher1-rom2.timeline.jsonl'))
+
+        # act
+        actual = aggregate(read_timelines(self.test_dir))
+
+        # assert
+        self.assertEqual((20, 10.0, 19.0), actual['settings'])
+        self.assertEqual((20, 90.0, 171.0), actual['spawn'])
+        self.assertEqual(21, actual['total'][0])
+        self.assertIn('p95 ms', format_stats(actual))
+
+if __name__ == '__main__':
+    unittest.main()
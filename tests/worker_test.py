@@ -0,0 +1,132 @@
+import unittest, os
+import tempfile
+import shutil
+import threading
+
+import logging
+
+logging.basicConfig(format = '%(asctime)s %(module)s %(levelname)s: %(message)s',
+                datefmt = '%m/%d/%Y %I:%M:%S %p', level = logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+from resources.lib import worker
+
+@unittest.skipUnless(worker.is_supported(), 'Unix sockets not supported')
+class Test_worker(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.socket_path = worker.get_socket_path(self.test_dir)
+        self.commands = []
+        self.release_command = threading.Event()
+        self.command_done = threading.Event()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _run_command(self, command):
+        self.commands.append(command)
+        self.release_command.wait(5)
+        self.command_done.set()
+
+    def _parse_command(self, argv):
+        if '--fail' in argv:
+            raise ValueError('Unknown argument')
+        if '--exit' in argv:
+            raise SystemExit(2)
+        return argv[1:]
+
+    def test_command_is_handed_over_to_the_running_worker(self):
+        # arrange
+        target = worker.WorkerServer(self.socket_path, self._parse_command, self._run_command)
+        target.start()
+
+        # act
+        actual = worker.submit(self.socket_path, ['default.py', 'launch', '--rom_id', '1'])
+        self.release_command.set()
+        self.command_done.wait(5)
+        target.stop()
+
+        # assert
+        self.assertTrue(actual)
+        self.assertEqual([['launch', '--rom_id', '1']], self.commands)
+
+    def test_busy_worker_refuses_the_next_command(self):
+        # arrange
+        target = worker.WorkerServer(self.socket_path, self._parse_command, self._run_command)
+        target.start()
+        worker.submit(self.socket_path, ['default.py', 'scan'])
+
+        # act
+        actual = worker.submit(self.socket_path, ['default.py', 'launch'])
+        self.release_command.set()
+        self.command_done.wait(5)
+        target.stop()
+
+        # assert
+        self.assertFalse(actual)
+        self.assertEqual([['scan']], self.commands)
+
+    def test_while_the_shared_lock_is_held_commands_are_refused(self):
+        # arrange
+        background_scan = threading.Lock()
+        target = worker.WorkerServer(self.socket_path, self._parse_command, self._run_command, lock=background_scan)
+        target.start()
+        background_scan.acquire()
+
+        # act
+        actual = worker.submit(self.socket_path, ['default.py', 'launch'])
+        background_scan.release()
+        target.stop()
+
+        # assert
+        self.assertFalse(actual)
+        self.assertEqual([], self.commands)
+
+    def test_without_worker_or_with_unparsable_command_it_falls_back(self):
+        # arrange
+        target = worker.WorkerServer(self.socket_path, self._parse_command, self._run_command)
+
+        # act
+        without_worker = worker.submit(self.socket_path, ['default.py', 'launch'])
+        target.start()
+        unparsable = worker.submit(self.socket_path, ['default.py', '--fail'])
+        target.stop()
+
+        # assert
+        self.assertFalse(without_worker)
+        self.assertFalse(unparsable)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_the_socket_lies_in_a_directory_only_the_user_can_enter(self):
+        # arrange
+        target = worker.WorkerServer(self.socket_path, self._parse_command, self._run_command)
+
+        # act
+        target.start()
+        mode = os.stat(os.path.dirname(self.socket_path)).st_mode & 0o777
+        unparsable = worker.submit(self.socket_path, ['default.py', '--exit'])
+        after_exit = worker.submit(self.socket_path, ['default.py', 'scan'])
+        self.release_command.set()
+        self.command_done.wait(5)
+        target.stop()
+
+        # assert
+        self.assertEqual(0o700, mode)
+        self.assertFalse(unparsable)
+        self.assertTrue(after_exit)
+
+    def test_a_socket_directory_other_users_can_enter_is_not_used(self):
+        # arrange
+        socket_dir = os.path.dirname(self.socket_path)
+        os.mkdir(socket_dir, 0o755)
+        os.chmod(socket_dir, 0o755)
+        target = worker.WorkerServer(self.socket_path, self._parse_command, self._run_command)
+
+        # act / assert
+        with self.assertRaises(PermissionError):
+            target.start()
+        self.assertFalse(worker.is_private_dir(socket_dir))
+
+if __name__ == '__main__':
+    unittest.main()